@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+
+# Compares the peak memory and time of parsing a synthetic catalog
+# response at once (json.loads()) and incrementally
+# (toutv.jsonstream.iter_array()), mapping the programs to emissions.
+#
+#     python3 extra/bench/catalog_parsing.py [--items N]
+
+import argparse
+import json
+import time
+import tracemalloc
+import toutv.jsonstream
+import toutv.transport
+
+
+def _make_response(num_items):
+    items = []
+
+    for i in range(num_items):
+        kind = 'program' if i % 3 else 'person'
+        items.append({
+            'Key': '{}-{}'.format(kind, i),
+            'DisplayText': 'Résultat numéro {}'.format(i),
+            'Description': 'Description du résultat {}. '.format(i) * 4,
+            'Id': 2000000 + i,
+            'Url': 'resultat-{}'.format(i),
+            'ImageUrl': 'https://images.tou.tv/w_400/v1/{}.jpg'.format(i),
+        })
+
+    return json.dumps(items).encode()
+
+
+def _chunks(body, size=65536):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def _parse_at_once(body):
+    transport = toutv.transport.JsonTransport
+    dtos = json.loads(body.decode())
+    programs = filter(transport._is_program_dto, dtos)
+
+    return len(list(map(transport._emission_dto_to_bo, programs)))
+
+
+def _parse_incrementally(body):
+    transport = toutv.transport.JsonTransport
+    num_emissions = 0
+
+    # the emissions are consumed as they come, like the CLI would do
+    for dto in toutv.jsonstream.iter_array(_chunks(body)):
+        if transport._is_program_dto(dto):
+            transport._emission_dto_to_bo(dto)
+            num_emissions += 1
+
+    return num_emissions
+
+
+def _bench(name, parse, body):
+    # the response body itself isn't counted
+    tracemalloc.start()
+    start = time.perf_counter()
+    num_emissions = parse(body)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:<14} {:>8} {:>12,} B {:>10.2f} ms'.format(
+        name, num_emissions, peak, elapsed * 1000))
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=20000)
+    args = parser.parse_args()
+
+    body = _make_response(args.items)
+    print('response: {:,} B'.format(len(body)))
+    print('{:<14} {:>8} {:>14} {:>13}'.format('parsing', 'emissions', 'peak', 'time'))
+    _bench('at once', _parse_at_once, body)
+    _bench('incremental', _parse_incrementally, body)
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Compares the size and speed of pickle and toutv.serialization on a
+# synthetic catalog resembling what the caches store.
+#
+#     python3 extra/bench/serialization.py [--emissions N] [--episodes N]
+
+import argparse
+import pickle
+import time
+import toutv.bos
+import toutv.serialization
+
+
+def _make_catalog(num_emissions, num_episodes):
+    emissions = []
+    episodes = []
+
+    for emid in range(num_emissions):
+        emission = toutv.bos.Emission()
+        emission.Id = 2000000 + emid
+        emission.Title = 'Émission numéro {}'.format(emid)
+        emission.Country = 'Canada'
+        emission.Network = 'ICI Radio-Canada Télé'
+        emission.Url = 'emission-{}'.format(emid)
+        emission.ImagePromoLargeJ = 'https://images.tou.tv/w_1200/v1/emissions/{}.jpg'.format(emid)
+        emission.Description = 'Description de l\'émission {}. '.format(emid) * 4
+        emission._auth = object()
+        emissions.append(emission)
+
+        for epid in range(num_episodes):
+            episode = toutv.bos.Episode()
+            episode.Id = emission.Id * 100 + epid
+            episode.PID = '{:032x}'.format(episode.Id)
+            episode.Title = 'Épisode {}'.format(epid)
+            episode.SeasonAndEpisode = 'S01E{:02d}'.format(epid)
+            episode.Length = 1800000
+            episode.AirDateFormated = '2014-01-{:02d}'.format(epid % 28 + 1)
+            episode.Url = 'emission-{}/S01E{:02d}'.format(emid, epid)
+            episode.Description = 'Résumé de l\'épisode {}. '.format(epid) * 3
+            episode.set_emission(emission)
+            episodes.append(episode)
+
+    return emissions, episodes
+
+
+def _bench(name, dumps, loads, value, repeat):
+    start = time.perf_counter()
+
+    for i in range(repeat):
+        data = dumps(value)
+
+    dump_time = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+
+    for i in range(repeat):
+        loads(data)
+
+    load_time = (time.perf_counter() - start) / repeat
+    print('{:<16} {:>12,} B {:>10.2f} ms {:>10.2f} ms'.format(
+        name, len(data), dump_time * 1000, load_time * 1000))
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emissions', type=int, default=500)
+    parser.add_argument('--episodes', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    emissions, episodes = _make_catalog(args.emissions, args.episodes)
+    ser = toutv.serialization
+    formats = [
+        ('pickle', lambda v: pickle.dumps(v, pickle.HIGHEST_PROTOCOL),
+         pickle.loads),
+        ('compact', lambda v: ser.dumps(v, ser.COMPRESSION_NONE), ser.loads),
+        ('compact+zlib', lambda v: ser.dumps(v, ser.COMPRESSION_ZLIB),
+         ser.loads),
+        ('compact+lzma', lambda v: ser.dumps(v, ser.COMPRESSION_LZMA),
+         ser.loads),
+    ]
+
+    for title, value in [('emissions', emissions), ('episodes', episodes)]:
+        print('{} ({} objects)'.format(title, len(value)))
+        print('{:<16} {:>14} {:>13} {:>13}'.format('format', 'size', 'dump', 'load'))
+
+        for name, dumps, loads in formats:
+            _bench(name, dumps, loads, value, args.repeat)
+
+        print()
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,99 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import concurrent.futures
+import functools
+import toutv.client
+
+
+class Client:
+
+    """asyncio facade of toutv.client.Client (Python 3.5+).
+
+    The calls are made by client (a toutv.client.Client, with its
+    transport and cache) in a pool of max_concurrency threads, so that
+    they don't block the event loop and at most max_concurrency requests
+    are made at once.
+    """
+
+    def __init__(self, client=None, max_concurrency=8):
+        if client is None:
+            client = toutv.client.Client()
+
+        self._client = client
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def get_client(self):
+        return self._client
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+
+        return await loop.run_in_executor(self._executor,
+                                          functools.partial(func, *args))
+
+    async def get_emissions(self):
+        return await self._run(self._client.get_emissions)
+
+    async def get_emission_episodes(self, emission, short_version=False):
+        return await self._run(self._client.get_emission_episodes, emission,
+                               short_version)
+
+    async def get_emission_by_whatever(self, query):
+        return await self._run(self._client.get_emission_by_whatever, query)
+
+    async def get_episode_by_name(self, emission, episode_name,
+                                  short_version=False):
+        return await self._run(self._client.get_episode_by_name, emission,
+                               episode_name, short_version)
+
+    async def search(self, query):
+        return await self._run(self._client.search, query)
+
+    async def get_many_emission_episodes(self, emissions, short_version=True,
+                                         return_exceptions=False):
+        """Returns the episodes of each emission of emissions, in the same
+        order, getting them concurrently.
+
+        If return_exceptions is True, the exception raised while getting
+        the episodes of an emission is returned in place of its episodes,
+        like with asyncio.gather().
+        """
+        coros = [self.get_emission_episodes(emission, short_version)
+                 for emission in emissions]
+
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
@@ -28,19 +28,34 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import re
-import requests
+import threading
 import toutv.config
 import toutv.exceptions
+import toutv.http
 
 
 class Auth:
 
+    """TOU.TV authentication.
+
+    Auth objects can be used by several threads at once, except while
+    login() is running: the claims are requested once, by the first thread
+    which needs them.
+    """
+
     def __init__(self, token=None):
         self._token = token
         self._claims = None
+        self._claims_lock = threading.Lock()
 
     def get_claims(self, token):
-        if not self._claims:
+        if self._claims:
+            return self._claims
+
+        with self._claims_lock:
+            if self._claims:
+                return self._claims
+
             headers = {
                 "Authorization": "Bearer " + token,
                 "User-Agent": toutv.config.USER_AGENT,
@@ -48,18 +63,22 @@ class Auth:
                 "Host": "services.radio-canada.ca",
             }
 
-            r = requests.get(toutv.config.TOUTV_AUTH_CLAIMS_URL.format(token), headers=headers)
+            http_client = toutv.http.get_default_client()
+            r = http_client.get(toutv.config.TOUTV_AUTH_CLAIMS_URL.format(token), headers=headers,
+                                ok_status_codes=None)
 
             if r.status_code != 200:
                 raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_CLAIMS_URL.format(token), r.status_code)
 
             self._claims = r.json()["claims"]
+
         return self._claims
 
     def get_token(self):
         return self._token
 
     def login(self, username, password):
+        http_client = toutv.http.get_default_client()
         session = self._get_session()
 
         payload = {
@@ -82,7 +101,8 @@ class Auth:
             "Content-type": "application/x-www-form-urlencoded",
         }
 
-        r = requests.post(toutv.config.TOUTV_AUTH_LOGIN_URL, headers=headers, data=payload, allow_redirects=False)
+        r = http_client.post(toutv.config.TOUTV_AUTH_LOGIN_URL, headers=headers, data=payload, allow_redirects=False,
+                             ok_status_codes=None)
 
         if r.status_code != 200:
             raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_TOKEN_URL, r.status_code)
@@ -96,7 +116,8 @@ class Auth:
             "lang": session['lang']
         }
 
-        r = requests.post(toutv.config.TOUTV_AUTH_CONSENT_URL, headers=headers, data=payload, allow_redirects=False)
+        r = http_client.post(toutv.config.TOUTV_AUTH_CONSENT_URL, headers=headers, data=payload, allow_redirects=False,
+                             ok_status_codes=None)
 
         if r.status_code != 302:
             raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_TOKEN_URL, r.status_code)
@@ -111,7 +132,9 @@ class Auth:
             "X-Requested-With": "tv.tou.android"
         }
 
-        r = requests.get(toutv.config.TOUTV_AUTH_SESSION_URL, headers=headers)
+        http_client = toutv.http.get_default_client()
+        r = http_client.get(toutv.config.TOUTV_AUTH_SESSION_URL, headers=headers,
+                            ok_status_codes=None)
 
         if r.status_code != 200:
             raise toutv.exceptions.UnexpectedHttpStatusCodeError(toutv.config.TOUTV_AUTH_SESSION_URL, r.status_code)
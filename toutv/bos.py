@@ -26,13 +26,17 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import base64
+import concurrent.futures
 import datetime
+import hashlib
+import json
 import logging
 import os
 import re
-import requests
 import toutv.dl
 import toutv.config
+import toutv.http
 import toutv.m3u8
 
 
@@ -43,6 +47,37 @@ def _clean_description(desc):
     return desc.strip()
 
 
+# Concurrent validations of the same playlist are merged
+_playlist_flights = toutv.http.SingleFlight()
+
+
+def _get_url_expiration(url):
+    # Signed URLs carry their expiration time (seconds since the epoch),
+    # like ".../master.m3u8?hdnea=exp=1500000000~acl=...~hmac=...".
+    m = re.search(r'\bexp(?:ires)?=(\d{9,})', url)
+
+    if not m:
+        return None
+
+    return datetime.datetime.fromtimestamp(int(m.group(1)))
+
+
+def _get_token_expiration(token):
+    # JWT tokens have an "exp" claim; other tokens are opaque.
+    parts = token.split('.')
+
+    if len(parts) != 3:
+        return None
+
+    try:
+        payload = parts[1] + '=' * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload).decode())['exp']
+
+        return datetime.datetime.fromtimestamp(int(exp))
+    except Exception:
+        return None
+
+
 class _Bo:
 
     def set_auth(self, auth):
@@ -67,55 +102,144 @@ class _Bo:
 
         return self._proxies
 
-    def _do_request(self, url, timeout=None, params=None):
+    # Fields which may be missing from the listings, and which the
+    # hydrator (a toutv.client.Client) can fetch on demand.
+    _lazy_fields = []
+
+    def set_hydrator(self, hydrator):
+        self._hydrator = hydrator
+
+    def get_hydrator(self):
+        if hasattr(self, '_hydrator'):
+            return self._hydrator
+
+        self._hydrator = None
+
+        return self._hydrator
+
+    def set_hydrated(self, hydrated=True):
+        self._hydrated = hydrated
+
+    def is_hydrated(self):
+        if hasattr(self, '_hydrated'):
+            return self._hydrated
+
+        self._hydrated = False
+
+        return self._hydrated
+
+    def get_missing_fields(self):
+        """Returns the names of the lazy fields of this object which are
+        missing, unless they were already fetched."""
+        if self.is_hydrated():
+            return []
+
+        return [name for name in self._lazy_fields
+                if getattr(self, name) is None]
+
+    def _hydrate(self, name):
+        # Fetches the missing lazy fields if name is one of them
+        hydrator = self.get_hydrator()
+
+        if hydrator is not None and name in self.get_missing_fields():
+            hydrator.hydrate([self])
+
+    def _do_request(self, url, timeout=None, params=None, cookies=None,
+                    num_tries=None):
         proxies = self.get_proxies()
         auth = self.get_auth()
+        headers = {}
 
-        try:
-            headers = dict(toutv.config.HEADERS)
-
-            if auth and params:
-                url = toutv.config.TOUTV_AUTH_PLAYLIST_URL
-                token = auth.get_token()
-                params['claims'] = auth.get_claims(token)
-                headers['Authorization'] = "Bearer " + token
-                headers['Host'] = "services.radio-canada.ca"
+        if auth and params:
+            url = toutv.config.TOUTV_AUTH_PLAYLIST_URL
+            token = auth.get_token()
+            params['claims'] = auth.get_claims(token)
+            headers['Authorization'] = "Bearer " + token
+            headers['Host'] = "services.radio-canada.ca"
 
-            r = requests.get(url, params=params, headers=headers,
-                             proxies=proxies, timeout=timeout)
-            if r.status_code != 200:
-                raise toutv.exceptions.UnexpectedHttpStatusCodeError(url,
-                                                                     r.status_code)
-        except requests.exceptions.Timeout:
-            raise toutv.exceptions.RequestTimeoutError(url, timeout)
+        http_client = toutv.http.get_default_client()
 
-        return r
+        return http_client.get(url, params=params, headers=headers,
+                               proxies=proxies, cookies=cookies,
+                               timeout=timeout, num_tries=num_tries)
 
 
 class _ThumbnailProvider:
 
+    def set_thumb_store(self, thumb_store):
+        self._thumb_store = thumb_store
+
+    def get_thumb_store(self):
+        if hasattr(self, '_thumb_store'):
+            return self._thumb_store
+
+        self._thumb_store = None
+
+        return self._thumb_store
+
+    def _fetch_first_thumb(self, urls):
+        # Get all the candidates at once, and keep the first good one: a
+        # dead URL doesn't delay the others. They're tried once: the other
+        # candidates are the retries.
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(urls))
+        futures = {}
+
+        for url in urls:
+            logging.debug('HTTP-getting "{}"'.format(url))
+            future = executor.submit(self._do_request, url, timeout=2,
+                                     num_tries=1)
+            futures[future] = url
+
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    r = future.result()
+                except Exception as e:
+                    # Ignore any network error
+                    logging.warning(e)
+                    continue
+
+                if r.content:
+                    return futures[future], r.content
+        finally:
+            # Don't wait for the slower requests
+            executor.shutdown(wait=False)
+
+        return None, None
+
     def _cache_medium_thumb(self):
         if self.has_medium_thumb_data():
             # No need to download again
             return
 
-        urls = self.get_medium_thumb_urls()
+        urls = []
 
-        for url in urls:
-            if not url:
-                continue
+        for url in self.get_medium_thumb_urls():
+            if url and url not in urls:
+                urls.append(url)
 
-            logging.debug('HTTP-getting "{}"'.format(url))
+        if not urls:
+            return
 
-            try:
-                r = self._do_request(url, timeout=2)
-            except Exception as e:
-                # Ignore any network error
-                logging.warning(e)
-                continue
+        thumb_store = self.get_thumb_store()
+
+        if thumb_store is not None:
+            for url in urls:
+                data = thumb_store.get(url)
+
+                if data is not None:
+                    self._medium_thumb_data = data
+                    return
 
-            self._medium_thumb_data = r.content
-            break
+        url, data = self._fetch_first_thumb(urls)
+
+        if data is None:
+            return
+
+        self._medium_thumb_data = data
+
+        if thumb_store is not None:
+            thumb_store.put(url, data)
 
     def get_medium_thumb_data(self):
         self._cache_medium_thumb()
@@ -169,6 +293,9 @@ class _AbstractEmission(_Bo):
 
 class Emission(_AbstractEmission, _ThumbnailProvider):
 
+    # not in the catalog (see toutv.transport.Transport.get_emission_details())
+    _lazy_fields = ['Description', 'Country']
+
     def __init__(self):
         self.CategoryURL = None
         self.ClassCategory = None
@@ -238,9 +365,13 @@ class Emission(_AbstractEmission, _ThumbnailProvider):
         return self.Year
 
     def get_country(self):
+        self._hydrate('Country')
+
         return self.Country
 
     def get_description(self):
+        self._hydrate('Description')
+
         if self.Description is None:
             return None
         return _clean_description(self.Description)
@@ -295,6 +426,9 @@ class Genre(_Bo):
 
 class Episode(_Bo, _ThumbnailProvider):
 
+    # not in the search results
+    _lazy_fields = ['PID']
+
     class Quality:
 
         def __init__(self, bitrate, xres, yres):
@@ -482,10 +616,20 @@ class Episode(_Bo, _ThumbnailProvider):
 
         return dt.date()
 
+    def get_pid(self):
+        self._hydrate('PID')
+
+        return self.PID
+
     def set_emission(self, emission):
         self._emission = emission
 
     def get_emission(self):
+        if hasattr(self, '_emission'):
+            return self._emission
+
+        self._emission = None
+
         return self._emission
 
     @staticmethod
@@ -537,18 +681,119 @@ class Episode(_Bo, _ThumbnailProvider):
                 else:
                     raise RuntimeError("Error: GetPlaylistURL failed.") from e
 
+    # Validated playlists without a known expiration time are cached for
+    # this long.
+    _default_playlist_ttl = datetime.timedelta(minutes=10)
+
+    # Cached playlists are considered expired this long before the
+    # expiration time of their URL or token.
+    _playlist_expiration_margin = datetime.timedelta(minutes=1)
+
+    def set_playlist_cache(self, playlist_cache):
+        self._playlist_cache = playlist_cache
+
+    def get_playlist_cache(self):
+        if hasattr(self, '_playlist_cache'):
+            return self._playlist_cache
+
+        self._playlist_cache = None
+
+        return self._playlist_cache
+
+    def _get_playlist_cache_key(self):
+        # The validation depends on the user's rights
+        auth = self.get_auth()
+        identity = 'anonymous'
+
+        if auth is not None and auth.get_token():
+            identity = hashlib.sha1(auth.get_token().encode()).hexdigest()
+
+        return '{}/{}'.format(self.PID, identity)
+
+    def _get_playlist_ttl(self, url):
+        expirations = [_get_url_expiration(url)]
+        auth = self.get_auth()
+
+        if auth is not None and auth.get_token():
+            expirations.append(_get_token_expiration(auth.get_token()))
+
+        expirations = [e for e in expirations if e is not None]
+
+        if not expirations:
+            return self._default_playlist_ttl
+
+        expiration = min(expirations) - self._playlist_expiration_margin
+
+        return expiration - datetime.datetime.now()
+
     def get_playlist_cookies(self):
         if not self._playlist or not self._cookies:
-            url = self._get_playlist_url()
-            r = self._do_request(url)
+            self._hydrate('PID')
 
-            # parse M3U8 file
-            m3u8_file = r.text
-            self._playlist = toutv.m3u8.parse(m3u8_file, os.path.dirname(url))
-            self._cookies = r.cookies
+            if self.PID:
+                key = self._get_playlist_cache_key()
+                result = _playlist_flights.do(key, self._validate_playlist)
+            else:
+                result = self._validate_playlist()
+
+            self._playlist, self._cookies = result
 
         return self._playlist, self._cookies
 
+    def _validate_playlist(self):
+        playlist_cache = self.get_playlist_cache()
+        entry = None
+
+        if playlist_cache is not None and self.PID:
+            entry = playlist_cache.get_playlist(self._get_playlist_cache_key())
+
+        if entry is not None:
+            logging.debug('Using cached playlist of {}'.format(self.PID))
+
+            return entry['playlist'], entry['cookies']
+
+        url = self._get_playlist_url()
+        r = self._do_request(url)
+
+        # parse M3U8 file
+        m3u8_file = r.text
+        playlist = toutv.m3u8.parse(m3u8_file, os.path.dirname(url))
+        cookies = r.cookies
+
+        if playlist_cache is not None and self.PID:
+            ttl = self._get_playlist_ttl(url)
+
+            if ttl > datetime.timedelta():
+                entry = {
+                    'url': url,
+                    'playlist': playlist,
+                    'cookies': cookies,
+                }
+                playlist_cache.set_playlist(self._get_playlist_cache_key(),
+                                            entry, ttl)
+
+        return playlist, cookies
+
+    def get_playlist_duration(self):
+        """Returns the duration (seconds) of the episode's video."""
+        if hasattr(self, '_playlist_duration'):
+            return self._playlist_duration
+
+        playlist, cookies = self.get_playlist_cookies()
+
+        # All the variants have the same duration: get the smallest one.
+        streams = [s for s in playlist.streams if re.search(r'_av\.m3u8', s.uri)]
+
+        if not streams:
+            streams = playlist.streams
+
+        stream = min(streams, key=lambda s: s.bandwidth)
+        r = self._do_request(stream.uri, cookies=cookies)
+        video_playlist = toutv.m3u8.parse(r.text, os.path.dirname(stream.uri))
+        self._playlist_duration = video_playlist.get_duration()
+
+        return self._playlist_duration
+
     def get_available_qualities(self):
         # Get playlist
         playlist, cookies = self.get_playlist_cookies()
@@ -25,14 +25,95 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import collections
 import logging
 import shelve
+import sqlite3
+import threading
+import time
 from datetime import datetime
 from datetime import timedelta
+import toutv.serialization
+
+
+# Families of cache keys (for statistics and purging)
+KEY_FAMILIES = ['emissions', 'emission_episodes', 'emission_details',
+                'page_repertoire', 'response', 'playlist', 'missing_emission']
+
+
+def _get_key_family(key):
+    # 'emission_episodes/1234' -> 'emission_episodes'
+    return key.split('/', 1)[0]
+
+
+def _merge_stats(*all_stats):
+    merged = {}
+
+    for stats in all_stats:
+        for family, counters in stats.items():
+            merged_counters = merged.setdefault(family, {})
+
+            for name, value in counters.items():
+                merged_counters[name] = merged_counters.get(name, 0) + value
+
+    return merged
+
+
+def _add_entry_size(sizes, key, size, is_expired):
+    family = _get_key_family(key)
+
+    if family not in sizes:
+        sizes[family] = {'entries': 0, 'bytes': 0, 'expired_entries': 0}
+
+    sizes[family]['entries'] += 1
+    sizes[family]['bytes'] += size
+
+    if is_expired:
+        sizes[family]['expired_entries'] += 1
+
+
+class CacheStats:
+
+    """Thread-safe operation counters per key family."""
+
+    COUNTERS = ['hits', 'stale_hits', 'misses', 'expired', 'sets', 'set_bytes']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def incr(self, key, name, value=1):
+        family = _get_key_family(key)
+
+        with self._lock:
+            if family not in self._counters:
+                self._counters[family] = dict.fromkeys(self.COUNTERS, 0)
+
+            self._counters[family][name] += value
+
+    def get(self):
+        with self._lock:
+            return {family: dict(counters)
+                    for family, counters in self._counters.items()}
+
+    def pop(self):
+        """Returns the counters and resets them."""
+        with self._lock:
+            counters = self._counters
+            self._counters = {}
+
+        return counters
 
 
 class Cache:
 
+    """Cache of the business objects and HTTP responses.
+
+    All the caches of this module can be used by several threads at once.
+    The objects they return may be shared with other threads: don't modify
+    them.
+    """
+
     def __init__(self):
         pass
 
@@ -45,18 +126,88 @@ class Cache:
     def get_page_repertoire(self):
         pass
 
+    def get_stale_emissions(self, max_stale):
+        """Returns (emissions, is_stale).
+
+        Emissions which expired less than max_stale (a timedelta) ago are
+        returned too, with is_stale set to True.
+        """
+        return self.get_emissions(), False
+
+    def get_stale_emission_episodes(self, emission, max_stale):
+        """Like get_stale_emissions(), for the episodes of emission."""
+        return self.get_emission_episodes(emission), False
+
     def set_emissions(self, emissions):
         pass
 
     def set_emission_episodes(self, emission_id, episodes):
         pass
 
+    def set_many_emission_episodes(self, emissions_episodes):
+        """Caches the episodes of many emissions: emissions_episodes is a
+        list of (emission, episodes)."""
+        for emission, episodes in emissions_episodes:
+            self.set_emission_episodes(emission, episodes)
+
     def set_page_repertoire(self, page_repertoire):
         pass
 
+    def get_emission_details(self, emission):
+        """Returns the details of emission which aren't in the catalog (a
+        dict of field names to values; see
+        toutv.transport.Transport.get_emission_details())."""
+        pass
+
+    def set_many_emission_details(self, emissions_details):
+        """Caches the details of many emissions: emissions_details is a
+        list of (emission, details)."""
+        pass
+
+    def get_response(self, key):
+        """Returns the HTTP response entry (a dict) stored under key."""
+        pass
+
+    def set_response(self, key, response):
+        pass
+
+    def get_playlist(self, key):
+        """Returns the validated playlist entry (a dict) stored under key."""
+        pass
+
+    def set_playlist(self, key, playlist, ttl):
+        pass
+
+    def is_emission_missing(self, emission):
+        """Returns True if the episodes of emission were recently not found."""
+        return False
+
+    def set_emission_missing(self, emission):
+        pass
+
     def invalidate(self):
         pass
 
+    def get_stats(self):
+        """Returns the statistics of this cache per key family.
+
+        Each one of KEY_FAMILIES with entries or lookups maps to a dict of
+        the CacheStats.COUNTERS (since the cache was created, if it's
+        persistent) and, for persistent caches, of the number of stored
+        'entries', their size in 'bytes' and the number of
+        'expired_entries'.
+        """
+        return {}
+
+    def save_stats(self):
+        """Adds the counters of this process to the persisted ones."""
+        pass
+
+    def purge(self, families=None, expired_only=False):
+        """Removes the entries of families (all of them if None), or only
+        their expired ones. Returns the number of removed entries."""
+        return 0
+
 
 class EmptyCache(Cache):
 
@@ -69,13 +220,28 @@ class EmptyCache(Cache):
     def get_page_repertoire(self):
         return None
 
+    def get_emission_details(self, emission):
+        return None
+
+    def get_response(self, key):
+        return None
+
+    def get_playlist(self, key):
+        return None
+
 
 class ShelveCache(Cache):
 
-    _cache_version = 4
+    _cache_version = 6
+    _meta_keys = ['cache_version', 'cache_stats']
 
     def __init__(self, shelve_filename):
         self._logger = logging.getLogger(self.__class__.__name__)
+        self._stats = CacheStats()
+
+        # shelve objects can't be used by several threads at once (a
+        # client may refresh stale entries in the background)
+        self._lock = threading.RLock()
 
         try:
             self._logger.debug('Trying to open shelve at {}'.format(shelve_filename))
@@ -94,62 +260,676 @@ class ShelveCache(Cache):
         if self.shelve is not None:
             self.shelve.close()
 
-    def _has_key(self, key):
-        if key in self.shelve:
-            expire, value = self.shelve[key]
-            if datetime.now() < expire:
-                return True
+    def _get_stale(self, key, max_stale):
+        # A single lookup of the entry
+        with self._lock:
+            entry = self.shelve.get(key)
+
+        if entry is None:
+            self._stats.incr(key, 'misses')
+            return None, False
+
+        expire, value = entry
+        now = datetime.now()
+        if now < expire:
+            counter = 'hits'
+            is_stale = False
+        elif now < expire + max_stale:
+            self._stats.incr(key, 'expired')
+            counter = 'stale_hits'
+            is_stale = True
+        else:
+            self._stats.incr(key, 'expired')
+            self._stats.incr(key, 'misses')
+            return None, False
 
-        return False
+        try:
+            value = toutv.serialization.loads(value)
+        except toutv.serialization.SerializationError as e:
+            self._logger.warning('Removing unreadable cache entry {}: {}'.format(key, e))
+            self._stats.incr(key, 'misses')
+            self._del(key)
+            return None, False
 
-    def _get(self, key):
-        if not self._has_key(key):
-            return None
+        self._stats.incr(key, counter)
 
-        expire, value = self.shelve[key]
+        return value, is_stale
+
+    def _get(self, key):
+        value, is_stale = self._get_stale(key, timedelta())
 
         return value
 
+    def _set_many(self, items, expire=timedelta(hours=2)):
+        # items: list of (key, value), written at once
+        entries = []
+
+        for key, value in items:
+            value = toutv.serialization.dumps(value)
+            self._stats.incr(key, 'sets')
+            self._stats.incr(key, 'set_bytes', len(value))
+            entries.append((key, value))
+
+        expire = datetime.now() + expire
+
+        with self._lock:
+            for key, value in entries:
+                self.shelve[key] = (expire, value)
+
     def _set(self, key, value, expire=timedelta(hours=2)):
-        self.shelve[key] = (datetime.now() + expire, value)
+        self._set_many([(key, value)], expire)
 
     def _del(self, key):
-        if key in self.shelve:
-            del self.shelve[key]
+        with self._lock:
+            if key in self.shelve:
+                del self.shelve[key]
 
     def get_emissions(self):
         return self._get('emissions')
 
-    def get_emission_episodes(self, emission):
-        emid = emission.Id
-        emission_episodes = self._get('emission_episodes')
-        if emission_episodes is None:
-            return None
-        if emid not in emission_episodes:
-            return None
+    @staticmethod
+    def _emission_episodes_key(emission):
+        return 'emission_episodes/{}'.format(emission.Id)
 
-        return emission_episodes[emid]
+    def get_emission_episodes(self, emission):
+        return self._get(self._emission_episodes_key(emission))
 
     def get_page_repertoire(self):
         return self._get('page_repertoire')
 
+    def get_stale_emissions(self, max_stale):
+        return self._get_stale('emissions', max_stale)
+
+    def get_stale_emission_episodes(self, emission, max_stale):
+        return self._get_stale(self._emission_episodes_key(emission), max_stale)
+
     def set_emissions(self, emissions):
         self._set('emissions', emissions)
 
     def set_emission_episodes(self, emission, episodes):
-        emid = emission.Id
-        emission_episodes = self._get('emission_episodes')
-        if emission_episodes is None:
-            emission_episodes = {}
-        emission_episodes[emid] = episodes
-        self._set('emission_episodes', emission_episodes)
+        self._set(self._emission_episodes_key(emission), episodes)
+
+    def set_many_emission_episodes(self, emissions_episodes):
+        items = [(self._emission_episodes_key(emission), episodes)
+                 for emission, episodes in emissions_episodes]
+
+        with self._lock:
+            self._set_many(items)
+            self.shelve.sync()
 
     def set_page_repertoire(self, page_repertoire):
         self._set('page_repertoire', page_repertoire)
 
+    @staticmethod
+    def _emission_details_key(emission):
+        return 'emission_details/{}'.format(emission.Id)
+
+    def get_emission_details(self, emission):
+        return self._get(self._emission_details_key(emission))
+
+    def set_many_emission_details(self, emissions_details):
+        for emission, details in emissions_details:
+            self._set(self._emission_details_key(emission), details)
+
+    def get_response(self, key):
+        return self._get('response/{}'.format(key))
+
+    def set_response(self, key, response):
+        # responses are revalidated, they can be kept longer
+        self._set('response/{}'.format(key), response, timedelta(days=30))
+
+    def get_playlist(self, key):
+        return self._get('playlist/{}'.format(key))
+
+    def set_playlist(self, key, playlist, ttl):
+        self._set('playlist/{}'.format(key), playlist, ttl)
+
+    @staticmethod
+    def _missing_emission_key(emission):
+        return 'missing_emission/{}'.format(emission.Id)
+
+    def is_emission_missing(self, emission):
+        return self._get(self._missing_emission_key(emission)) is not None
+
+    def set_emission_missing(self, emission):
+        # the emission may come back: check again sooner than for episodes
+        self._set(self._missing_emission_key(emission), True,
+                  timedelta(minutes=30))
+
     def invalidate(self):
-        self._del('emissions')
-        self._del('emission_episodes')
-        self._del('page_repertoire')
-        self.shelve['cache_version'] = self._cache_version
-        self.shelve.sync()
+        with self._lock:
+            for key in list(self.shelve.keys()):
+                if key not in self._meta_keys:
+                    self._del(key)
+
+            self.shelve['cache_version'] = self._cache_version
+            self.shelve.sync()
+
+    def _get_entry_keys(self):
+        return [key for key in self.shelve.keys()
+                if key not in self._meta_keys]
+
+    def get_stats(self):
+        sizes = {}
+        now = datetime.now()
+
+        with self._lock:
+            saved_stats = self.shelve.get('cache_stats', {})
+
+            for key in self._get_entry_keys():
+                expire, value = self.shelve[key]
+                _add_entry_size(sizes, key, len(value), expire <= now)
+
+        return _merge_stats(saved_stats, self._stats.get(), sizes)
+
+    def save_stats(self):
+        with self._lock:
+            saved_stats = self.shelve.get('cache_stats', {})
+            self.shelve['cache_stats'] = _merge_stats(saved_stats,
+                                                      self._stats.pop())
+            self.shelve.sync()
+
+    def purge(self, families=None, expired_only=False):
+        num_purged = 0
+        now = datetime.now()
+
+        with self._lock:
+            for key in self._get_entry_keys():
+                if families is not None and _get_key_family(key) not in families:
+                    continue
+
+                if expired_only and self.shelve[key][0] > now:
+                    continue
+
+                self._del(key)
+                num_purged += 1
+
+            self.shelve.sync()
+
+        return num_purged
+
+
+class SqliteCache(Cache):
+
+    """Cache stored in an SQLite database.
+
+    The database is opened in WAL mode, so that several processes (and
+    threads) can read and write the same cache concurrently. Each entry
+    has its own expiration time, based on the TTL of its kind. Expired
+    entries are kept for keep_expired, so that they can be served stale.
+    """
+
+    _cache_version = 2
+
+    _default_ttls = {
+        'emissions': timedelta(hours=2),
+        'emission_episodes': timedelta(hours=2),
+        'emission_details': timedelta(hours=2),
+        'page_repertoire': timedelta(hours=2),
+        'responses': timedelta(days=30),
+        'missing_emissions': timedelta(minutes=30),
+    }
+
+    def __init__(self, db_filename, ttls=None, timeout=30,
+                 keep_expired=timedelta(days=7)):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._db_filename = db_filename
+        self._timeout = timeout
+        self._keep_expired = keep_expired
+        self._ttls = dict(self._default_ttls)
+        self._stats = CacheStats()
+
+        if ttls is not None:
+            self._ttls.update(ttls)
+
+        # sqlite3 connections cannot be shared between threads
+        self._local = threading.local()
+
+        self._logger.debug('Trying to open SQLite cache at {}'.format(db_filename))
+        conn = self._get_conn()
+
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta '
+                         '(name TEXT PRIMARY KEY, value)')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                         '(key TEXT PRIMARY KEY, expire REAL NOT NULL, '
+                         'value BLOB NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters '
+                         '(family TEXT, name TEXT, value INTEGER NOT NULL, '
+                         'PRIMARY KEY (family, name))')
+            row = conn.execute('SELECT value FROM meta WHERE name = ?',
+                               ('cache_version',)).fetchone()
+
+        if row is None or row[0] != self._cache_version:
+            self._logger.debug('Incompatible cache version, invalidating.')
+            self.invalidate()
+        else:
+            self._purge_expired()
+
+    def _get_conn(self):
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect(self._db_filename, timeout=self._timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+
+        return conn
+
+    def _purge_expired(self):
+        conn = self._get_conn()
+
+        oldest = time.time() - self._keep_expired.total_seconds()
+
+        with conn:
+            conn.execute('DELETE FROM entries WHERE expire <= ?', (oldest,))
+
+    def _get_stale(self, key, max_stale):
+        conn = self._get_conn()
+        row = conn.execute('SELECT expire, value FROM entries WHERE key = ?',
+                           (key,)).fetchone()
+
+        if row is None:
+            self._stats.incr(key, 'misses')
+            return None, False
+
+        expire, value = row
+        now = time.time()
+
+        if now < expire:
+            counter = 'hits'
+            is_stale = False
+        elif now < expire + max_stale.total_seconds():
+            self._stats.incr(key, 'expired')
+            counter = 'stale_hits'
+            is_stale = True
+        else:
+            self._stats.incr(key, 'expired')
+            self._stats.incr(key, 'misses')
+            return None, False
+
+        try:
+            value = toutv.serialization.loads(value)
+        except toutv.serialization.SerializationError as e:
+            self._logger.warning('Removing unreadable cache entry {}: {}'.format(key, e))
+            self._stats.incr(key, 'misses')
+
+            with conn:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+            return None, False
+
+        self._stats.incr(key, counter)
+
+        return value, is_stale
+
+    def _get(self, key):
+        value, is_stale = self._get_stale(key, timedelta())
+
+        return value
+
+    def _set_many(self, items, ttl):
+        # items: list of (key, value), written in a single transaction
+        conn = self._get_conn()
+        expire = time.time() + ttl.total_seconds()
+        rows = []
+
+        for key, value in items:
+            value = toutv.serialization.dumps(value)
+            self._stats.incr(key, 'sets')
+            self._stats.incr(key, 'set_bytes', len(value))
+            rows.append((key, expire, value))
+
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO entries (key, expire, value) '
+                             'VALUES (?, ?, ?)', rows)
+
+    def _set(self, key, value, ttl):
+        self._set_many([(key, value)], ttl)
+
+    @staticmethod
+    def _emission_episodes_key(emission):
+        return 'emission_episodes/{}'.format(emission.Id)
+
+    def get_emissions(self):
+        return self._get('emissions')
+
+    def get_emission_episodes(self, emission):
+        return self._get(self._emission_episodes_key(emission))
+
+    def get_page_repertoire(self):
+        return self._get('page_repertoire')
+
+    def get_stale_emissions(self, max_stale):
+        return self._get_stale('emissions', max_stale)
+
+    def get_stale_emission_episodes(self, emission, max_stale):
+        return self._get_stale(self._emission_episodes_key(emission), max_stale)
+
+    def set_emissions(self, emissions):
+        self._set('emissions', emissions, self._ttls['emissions'])
+
+    def set_emission_episodes(self, emission, episodes):
+        self._set(self._emission_episodes_key(emission), episodes,
+                  self._ttls['emission_episodes'])
+
+    def set_many_emission_episodes(self, emissions_episodes):
+        items = [(self._emission_episodes_key(emission), episodes)
+                 for emission, episodes in emissions_episodes]
+        self._set_many(items, self._ttls['emission_episodes'])
+
+    def set_page_repertoire(self, page_repertoire):
+        self._set('page_repertoire', page_repertoire,
+                  self._ttls['page_repertoire'])
+
+    @staticmethod
+    def _emission_details_key(emission):
+        return 'emission_details/{}'.format(emission.Id)
+
+    def get_emission_details(self, emission):
+        return self._get(self._emission_details_key(emission))
+
+    def set_many_emission_details(self, emissions_details):
+        items = [(self._emission_details_key(emission), details)
+                 for emission, details in emissions_details]
+        self._set_many(items, self._ttls['emission_details'])
+
+    def get_response(self, key):
+        return self._get('response/{}'.format(key))
+
+    def set_response(self, key, response):
+        self._set('response/{}'.format(key), response, self._ttls['responses'])
+
+    def get_playlist(self, key):
+        return self._get('playlist/{}'.format(key))
+
+    def set_playlist(self, key, playlist, ttl):
+        self._set('playlist/{}'.format(key), playlist, ttl)
+
+    @staticmethod
+    def _missing_emission_key(emission):
+        return 'missing_emission/{}'.format(emission.Id)
+
+    def is_emission_missing(self, emission):
+        return self._get(self._missing_emission_key(emission)) is not None
+
+    def set_emission_missing(self, emission):
+        self._set(self._missing_emission_key(emission), True,
+                  self._ttls['missing_emissions'])
+
+    def invalidate(self):
+        conn = self._get_conn()
+
+        with conn:
+            conn.execute('DELETE FROM entries')
+            conn.execute('INSERT OR REPLACE INTO meta (name, value) '
+                         'VALUES (?, ?)', ('cache_version', self._cache_version))
+
+    def get_stats(self):
+        conn = self._get_conn()
+        saved_stats = {}
+        sizes = {}
+        now = time.time()
+
+        for family, name, value in conn.execute('SELECT family, name, value '
+                                                'FROM counters'):
+            saved_stats.setdefault(family, {})[name] = value
+
+        for key, expire, size in conn.execute('SELECT key, expire, '
+                                              'LENGTH(value) FROM entries'):
+            _add_entry_size(sizes, key, size, expire <= now)
+
+        return _merge_stats(saved_stats, self._stats.get(), sizes)
+
+    def save_stats(self):
+        conn = self._get_conn()
+        keys = []
+        rows = []
+
+        for family, counters in self._stats.pop().items():
+            for name, value in counters.items():
+                keys.append((family, name))
+                rows.append((value, family, name))
+
+        # no upsert: it needs SQLite 3.24
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO counters (family, name, value) '
+                             'VALUES (?, ?, 0)', keys)
+            conn.executemany('UPDATE counters SET value = value + ? '
+                             'WHERE family = ? AND name = ?', rows)
+
+    def purge(self, families=None, expired_only=False):
+        conn = self._get_conn()
+        conditions = []
+        params = []
+
+        if families is not None:
+            # matches no entry if there's no family
+            family_conditions = ['0']
+
+            for family in families:
+                family_conditions.append('key = ? OR SUBSTR(key, 1, ?) = ?')
+                params += [family, len(family) + 1, family + '/']
+
+            conditions.append('({})'.format(' OR '.join(family_conditions)))
+
+        if expired_only:
+            conditions.append('expire <= ?')
+            params.append(time.time())
+
+        query = 'DELETE FROM entries'
+
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        with conn:
+            return conn.execute(query, params).rowcount
+
+
+class LruCache(Cache):
+
+    """Bounded in-memory LRU cache in front of another cache.
+
+    Entries are kept in memory for at most ttl (they may expire earlier in
+    the backing cache), and the least recently used ones are evicted when
+    there are more than max_entries of them or, if max_bytes is set, when
+    their serialized size exceeds max_bytes. Writes go through to the backing
+    cache.
+    """
+
+    def __init__(self, cache, max_entries=256, max_bytes=None,
+                 ttl=timedelta(minutes=10)):
+        self._cache = cache
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl.total_seconds()
+        self._entries = collections.OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_memory_stats(self):
+        """Returns the counters and size of the in-memory entries."""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'bytes': self._num_bytes,
+            }
+
+    def _evict(self, key):
+        expire, value, size = self._entries.pop(key)
+        self._num_bytes -= size
+
+    def _get_mem(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                expire, value, size = entry
+
+                if time.monotonic() < expire:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+
+                    return value
+
+                self._evict(key)
+
+            self._misses += 1
+
+            return None
+
+    def _is_full(self):
+        if len(self._entries) > self._max_entries:
+            return True
+
+        return self._max_bytes is not None and self._num_bytes > self._max_bytes
+
+    def _set_mem(self, key, value):
+        if value is None:
+            return
+
+        size = 0
+
+        if self._max_bytes is not None:
+            size = len(toutv.serialization.dumps(value))
+
+            if size > self._max_bytes:
+                return
+
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+
+            self._entries[key] = (time.monotonic() + self._ttl, value, size)
+            self._num_bytes += size
+
+            while self._is_full():
+                self._evict(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _get(self, key, get_backing):
+        value = self._get_mem(key)
+
+        if value is None:
+            value = get_backing()
+            self._set_mem(key, value)
+
+        return value
+
+    def _get_stale(self, key, get_backing_stale):
+        value = self._get_mem(key)
+
+        if value is not None:
+            return value, False
+
+        value, is_stale = get_backing_stale()
+
+        # only fresh entries are kept in memory
+        if not is_stale:
+            self._set_mem(key, value)
+
+        return value, is_stale
+
+    @staticmethod
+    def _emission_episodes_key(emission):
+        return 'emission_episodes/{}'.format(emission.Id)
+
+    @staticmethod
+    def _emission_details_key(emission):
+        return 'emission_details/{}'.format(emission.Id)
+
+    def get_emissions(self):
+        return self._get('emissions', self._cache.get_emissions)
+
+    def get_emission_episodes(self, emission):
+        return self._get(self._emission_episodes_key(emission),
+                         lambda: self._cache.get_emission_episodes(emission))
+
+    def get_page_repertoire(self):
+        return self._get('page_repertoire', self._cache.get_page_repertoire)
+
+    def get_stale_emissions(self, max_stale):
+        return self._get_stale('emissions',
+                               lambda: self._cache.get_stale_emissions(max_stale))
+
+    def get_stale_emission_episodes(self, emission, max_stale):
+        return self._get_stale(self._emission_episodes_key(emission),
+                               lambda: self._cache.get_stale_emission_episodes(emission, max_stale))
+
+    def get_emission_details(self, emission):
+        return self._get(self._emission_details_key(emission),
+                         lambda: self._cache.get_emission_details(emission))
+
+    def get_response(self, key):
+        return self._get('response/{}'.format(key),
+                         lambda: self._cache.get_response(key))
+
+    def set_emissions(self, emissions):
+        self._cache.set_emissions(emissions)
+        self._set_mem('emissions', emissions)
+
+    def set_emission_episodes(self, emission, episodes):
+        self._cache.set_emission_episodes(emission, episodes)
+        self._set_mem(self._emission_episodes_key(emission), episodes)
+
+    def set_many_emission_episodes(self, emissions_episodes):
+        self._cache.set_many_emission_episodes(emissions_episodes)
+
+        for emission, episodes in emissions_episodes:
+            self._set_mem(self._emission_episodes_key(emission), episodes)
+
+    def set_page_repertoire(self, page_repertoire):
+        self._cache.set_page_repertoire(page_repertoire)
+        self._set_mem('page_repertoire', page_repertoire)
+
+    def set_many_emission_details(self, emissions_details):
+        self._cache.set_many_emission_details(emissions_details)
+
+        for emission, details in emissions_details:
+            self._set_mem(self._emission_details_key(emission), details)
+
+    def set_response(self, key, response):
+        self._cache.set_response(key, response)
+        self._set_mem('response/{}'.format(key), response)
+
+    # Playlists expire on their own schedule, which may be shorter than
+    # ttl: they're not kept in memory.
+    def get_playlist(self, key):
+        return self._cache.get_playlist(key)
+
+    def set_playlist(self, key, playlist, ttl):
+        self._cache.set_playlist(key, playlist, ttl)
+
+    def is_emission_missing(self, emission):
+        return self._cache.is_emission_missing(emission)
+
+    def set_emission_missing(self, emission):
+        self._cache.set_emission_missing(emission)
+
+    def _clear_mem(self):
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    def invalidate(self):
+        self._clear_mem()
+        self._cache.invalidate()
+
+    def get_stats(self):
+        return self._cache.get_stats()
+
+    def save_stats(self):
+        self._cache.save_stats()
+
+    def purge(self, families=None, expired_only=False):
+        # the purged entries may be in memory too
+        self._clear_mem()
+
+        return self._cache.purge(families, expired_only)
@@ -0,0 +1,268 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+import requests.cookies
+import requests.models
+import requests.structures
+import requests.utils
+import toutv.exceptions
+import toutv.http
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+
+
+class MissingExchangeError(toutv.exceptions.NetworkError):
+
+    def __init__(self, method, url):
+        self._method = method
+        self._url = url
+
+    @property
+    def method(self):
+        return self._method
+
+    @property
+    def url(self):
+        return self._url
+
+    def __str__(self):
+        tmpl = 'No recorded response for {} "{}"'
+        return tmpl.format(self._method, self._url)
+
+
+class Cassette:
+
+    """Directory of recorded HTTP exchanges.
+
+    index.json maps each request (method, URL and parameters) to the
+    status code, headers and cookies of its response. Bodies are stored
+    once per distinct content in the bodies subdirectory, named after
+    their SHA-1 hash, so that identical segments or playlists don't take
+    more space.
+
+    A cassette may contain account-specific data (cookies, playlist URLs),
+    like the cache.
+    """
+
+    _INDEX_NAME = 'index.json'
+    _BODIES_DIR = 'bodies'
+    _KEPT_HEADERS = ['Content-Type', 'ETag', 'Last-Modified']
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._index = {}
+        index_path = self._get_index_path()
+
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self._index = json.load(f)
+
+    def _get_index_path(self):
+        return os.path.join(self._directory, Cassette._INDEX_NAME)
+
+    def _get_body_path(self, digest):
+        return os.path.join(self._directory, Cassette._BODIES_DIR, digest)
+
+    @staticmethod
+    def get_request_key(method, url, params=None):
+        if params:
+            if isinstance(params, dict):
+                params = sorted(params.items())
+
+            separator = '&' if '?' in url else '?'
+            url = url + separator + urlencode(params)
+
+        return '{} {}'.format(method, url)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def get(self, key):
+        """Returns the recorded exchange of key (a dict with status_code,
+        headers, cookies and body), or None."""
+        with self._lock:
+            entry = self._index.get(key)
+
+        if entry is None:
+            return None
+
+        with open(self._get_body_path(entry['body']), 'rb') as f:
+            body = f.read()
+
+        return {
+            'status_code': entry['status_code'],
+            'headers': entry['headers'],
+            'cookies': entry['cookies'],
+            'body': body,
+        }
+
+    def put(self, key, status_code, headers, cookies, body):
+        digest = hashlib.sha1(body).hexdigest()
+        body_path = self._get_body_path(digest)
+        kept_headers = {}
+
+        for name in Cassette._KEPT_HEADERS:
+            if name in headers:
+                kept_headers[name] = headers[name]
+
+        entry = {
+            'status_code': status_code,
+            'headers': kept_headers,
+            'cookies': dict(cookies),
+            'body': digest,
+        }
+
+        with self._lock:
+            if not os.path.exists(body_path):
+                os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+                with open(body_path, 'wb') as f:
+                    f.write(body)
+
+            self._index[key] = entry
+            self._save_index()
+
+    def _save_index(self):
+        index_path = self._get_index_path()
+        tmp_path = index_path + '.tmp'
+
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+
+        os.replace(tmp_path, index_path)
+
+
+class RecordingHttpClient(toutv.http.HttpClient):
+
+    """HTTP client which records all the exchanges into a cassette.
+
+    Conditional headers are dropped from the requests so that complete
+    responses are recorded. Use it as the default client
+    (toutv.http.set_default_client()) to record the JSON endpoints,
+    playlists, keys and segments.
+    """
+
+    _CONDITIONAL_HEADERS = ['If-None-Match', 'If-Modified-Since']
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self._cassette = Cassette(directory)
+
+    def request(self, method, url, params=None, headers=None,
+                ok_status_codes=(200,), **kwargs):
+        if headers is not None:
+            headers = {name: value for name, value in headers.items()
+                       if name not in RecordingHttpClient._CONDITIONAL_HEADERS}
+
+        r = super().request(method, url, params=params, headers=headers,
+                            ok_status_codes=None, **kwargs)
+        key = Cassette.get_request_key(method, url, params)
+        self._logger.debug('Recording {}'.format(key))
+
+        # reading the content here lets streamed responses be iterated
+        # over afterwards
+        self._cassette.put(key, r.status_code, r.headers, r.cookies,
+                           r.content)
+        self._check_status_code(urlparse(url).netloc, url, r, ok_status_codes)
+
+        return r
+
+
+class ReplayHttpClient(toutv.http.HttpClient):
+
+    """HTTP client which serves the exchanges of a cassette without
+    network access.
+
+    Each response takes latency seconds, plus its size divided by
+    bandwidth (bytes per second) if bandwidth is set, to simulate a
+    network. A request which wasn't recorded raises
+    MissingExchangeError.
+    """
+
+    def __init__(self, directory, latency=0, bandwidth=None, **kwargs):
+        super().__init__(**kwargs)
+        self._cassette = Cassette(directory)
+        self._latency = latency
+        self._bandwidth = bandwidth
+
+    def _get_delay(self, num_bytes):
+        delay = self._latency
+
+        if self._bandwidth:
+            delay += num_bytes / self._bandwidth
+
+        return delay
+
+    @staticmethod
+    def _build_response(url, entry):
+        r = requests.models.Response()
+        r.status_code = entry['status_code']
+        r.url = url
+        r.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers) or 'utf-8'
+        r.cookies = requests.cookies.cookiejar_from_dict(entry['cookies'])
+        r._content = entry['body']
+        r._content_consumed = True
+
+        return r
+
+    def request(self, method, url, params=None, timeout=None,
+                ok_status_codes=(200,), **kwargs):
+        host = urlparse(url).netloc
+        key = Cassette.get_request_key(method, url, params)
+        entry = self._cassette.get(key)
+        self._logger.debug('Replaying {}'.format(key))
+
+        if entry is None:
+            self._add_stats(host, requests=1, errors=1)
+            raise MissingExchangeError(method, url)
+
+        if timeout is None:
+            timeout = self._timeout
+
+        delay = self._get_delay(len(entry['body']))
+
+        if delay > timeout:
+            time.sleep(timeout)
+            self._add_stats(host, requests=1, errors=1, time=timeout)
+            raise toutv.exceptions.RequestTimeoutError(url, timeout)
+
+        time.sleep(delay)
+        self._add_stats(host, requests=1, bytes=len(entry['body']),
+                        time=delay)
+        r = ReplayHttpClient._build_response(url, entry)
+        self._check_status_code(host, url, r, ok_status_codes)
+
+        return r
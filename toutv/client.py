@@ -26,8 +26,13 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import re
+import copy
 import difflib
+import logging
+import threading
+import concurrent.futures
 import toutv.cache
+import toutv.http
 import toutv.mapper
 import toutv.transport
 import toutv.config
@@ -52,10 +57,40 @@ class ClientError(RuntimeError):
 
 class Client:
 
-    def __init__(self, transport=toutv.transport.JsonTransport(),
-                 cache=toutv.cache.EmptyCache(), proxies=None, auth=None):
+    """TOU.TV client.
+
+    If max_stale (a timedelta) is set, cached entries which expired less
+    than max_stale ago are returned immediately, and refreshed in a
+    background thread.
+
+    The returned emissions and episodes keep their thumbnails in
+    thumb_store (a toutv.thumbnails.ThumbnailStore), if set. If lazy is
+    set, the getters of their missing lazy fields fetch them on demand;
+    otherwise they return None until hydrate() is called, so that they
+    never block (in a GUI thread, for example).
+
+    A client can be used by several threads at once (set_proxies() and
+    set_auth() excepted): each call returns its own copies of the business
+    objects, and concurrent identical fetches are merged into a single
+    one. Its transport, caches, authentication and thumbnail store are
+    thread-safe too.
+    """
+
+    def __init__(self, transport=None,
+                 cache=toutv.cache.EmptyCache(), proxies=None, auth=None,
+                 max_stale=None, thumb_store=None, lazy=True):
+        if transport is None:
+            transport = toutv.transport.JsonTransport()
+
         self._transport = transport
         self._cache = cache
+        self._thumb_store = thumb_store
+        self._max_stale = max_stale
+        self._lazy = lazy
+        self._revalidations = {}
+        self._flights = toutv.http.SingleFlight()
+        self._revalidations_lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
 
         self.set_proxies(proxies)
         self.set_auth(auth)
@@ -71,74 +106,480 @@ class Client:
     def _set_bo_proxies(self, bo):
         bo.set_proxies(self._proxies)
 
-    def _set_bos_proxies(self, bos):
-        for bo in bos:
-            self._set_bo_proxies(bo)
-
-    def _set_bo_auth(self, bo):
+    def _setup_bo(self, bo):
+        # The business objects of the transport and of the cache may be
+        # shared with other threads (in-memory caches, merged concurrent
+        # calls): each call gets its own copies, set up for this client.
+        bo = copy.copy(bo)
+        self._set_bo_proxies(bo)
         bo.set_auth(self._auth)
+        bo.set_thumb_store(self._thumb_store)
 
-    def _set_bos_auth(self, bos):
-        for bo in bos:
-            self._set_bo_auth(bo)
+        if self._lazy:
+            bo.set_hydrator(self)
 
-    def get_emissions(self):
-        emissions = self._cache.get_emissions()
-        if emissions is None:
+        return bo
+
+    def _setup_emissions(self, emissions):
+        return [self._setup_bo(emission) for emission in emissions]
+
+    def _setup_episodes(self, episodes):
+        episodes = [self._setup_bo(episode) for episode in episodes]
+
+        # The validated playlists of the episodes go in the same cache
+        for episode in episodes:
+            episode.set_playlist_cache(self._cache)
+
+        return episodes
+
+    def _revalidate(self, key, refresh):
+        # Call refresh() in a background thread, unless it's already being
+        # done for this key.
+        def run():
+            try:
+                refresh()
+            except Exception as e:
+                self._logger.warning('Cannot refresh {}: {}'.format(key, e))
+            finally:
+                with self._revalidations_lock:
+                    del self._revalidations[key]
+
+        with self._revalidations_lock:
+            if key in self._revalidations:
+                return
+
+            self._logger.debug('Refreshing stale {} in background'.format(key))
+            thread = threading.Thread(target=run, name='revalidate {}'.format(key),
+                                      daemon=True)
+            self._revalidations[key] = thread
+
+        thread.start()
+
+    def wait_revalidations(self, timeout=None):
+        """Waits for the background refreshes of stale entries to finish."""
+        with self._revalidations_lock:
+            threads = list(self._revalidations.values())
+
+        for thread in threads:
+            thread.join(timeout)
+
+    def _refresh_emissions(self):
+        # Concurrent refreshes are merged.
+        def refresh():
             emissions = self._transport.get_emissions()
             self._cache.set_emissions(emissions)
 
-        self._set_bos_proxies(emissions)
-        self._set_bos_auth(emissions)
+            return emissions
+
+        return self._flights.do('emissions', refresh)
+
+    def refresh_emissions(self):
+        """Gets the emissions from the transport and caches them."""
+        return self._setup_emissions(self._refresh_emissions())
+
+    def refresh_emission_episodes(self, emission):
+        """Gets the episodes of emission from the transport and caches them."""
+        return self._setup_episodes(self._fetch_emission_episodes(emission, True, False))
+
+    def _fetch_emission_episodes(self, emission, short_version, use_cache,
+                                 store=True):
+        # Concurrent fetches of the same episodes are merged. If store is
+        # False, the caller caches the short episodes itself.
+        def fetch():
+            if use_cache:
+                # they may have been cached since the caller's lookup
+                episodes = self._cache.get_emission_episodes(emission)
+
+                if episodes is not None:
+                    return episodes
+
+            episodes = self._transport.get_emission_episodes(emission, short_version)
+
+            if short_version and store:
+                self._cache.set_emission_episodes(emission, episodes)
+
+            return episodes
+
+        key = 'emission_episodes/{}/{}/{}'.format(emission.Id, short_version,
+                                                  use_cache)
+
+        return self._flights.do(key, fetch)
+
+    def _get_emissions(self):
+        # Returns (emissions, is_stale), refreshing stale emissions in the
+        # background.
+        if self._max_stale is None:
+            emissions = self._cache.get_emissions()
+            is_stale = False
+        else:
+            emissions, is_stale = self._cache.get_stale_emissions(self._max_stale)
+
+        if emissions is None:
+            emissions = self._refresh_emissions()
+        elif is_stale:
+            self._revalidate('emissions', self._refresh_emissions)
+
+        return self._setup_emissions(emissions), is_stale
+
+    def get_emissions(self):
+        emissions, is_stale = self._get_emissions()
 
         return emissions
 
-    def get_emission_episodes(self, emission, short_version=False):
+    def iter_emissions(self):
+        """Generates the emissions.
+
+        Unlike get_emissions(), if they're not cached, they're generated
+        while the catalog is being received and parsed. They're cached
+        once they have all been generated.
+        """
+        if self._max_stale is None:
+            emissions = self._cache.get_emissions()
+            is_stale = False
+        else:
+            emissions, is_stale = self._cache.get_stale_emissions(self._max_stale)
+
+        if emissions is not None:
+            if is_stale:
+                self._revalidate('emissions', self._refresh_emissions)
+
+            iterable = emissions
+            emissions = None
+        else:
+            iterable = self._transport.iter_emissions()
+            emissions = []
+
+        for emission in iterable:
+            if emissions is not None:
+                emissions.append(emission)
+
+            yield self._setup_bo(emission)
+
+        if emissions is not None:
+            self._cache.set_emissions(emissions)
+
+    def _get_cached_emission_episodes(self, emission):
+        # Returns (episodes, is_stale) for the cached episodes of emission
+        # (None if there are none), refreshing them in the background if
+        # they're stale.
+        if self._max_stale is None:
+            return self._cache.get_emission_episodes(emission), False
+
+        episodes, is_stale = self._cache.get_stale_emission_episodes(emission,
+                                                                     self._max_stale)
+
+        if episodes is not None and is_stale:
+            key = 'episodes of emission {}'.format(emission.Id)
+            self._revalidate(key, lambda: self._fetch_emission_episodes(emission, True, False))
+
+        return episodes, is_stale
+
+    def _get_emission_episodes(self, emission, short_version):
+        # Returns (episodes, is_stale)
         episodes = None
+        is_stale = False
+
         if short_version:
-            episodes = self._cache.get_emission_episodes(emission)
+            episodes, is_stale = self._get_cached_emission_episodes(emission)
+
         if episodes is None:
-            episodes = self._transport.get_emission_episodes(emission, short_version)
-            if short_version:
-                self._cache.set_emission_episodes(emission, episodes)
+            episodes = self._fetch_emission_episodes(emission, short_version,
+                                                     short_version)
 
-        self._set_bos_proxies(episodes)
-        self._set_bos_auth(episodes)
+        return self._setup_episodes(episodes), is_stale
+
+    def get_emission_episodes(self, emission, short_version=False):
+        episodes, is_stale = self._get_emission_episodes(emission, short_version)
 
         return episodes
 
-    def search(self, query):
-        search = self._transport.search(query)
-        self._set_bo_proxies(search)
+    def get_many_emission_episodes(self, emissions, max_workers=8,
+                                   short_version=True):
+        """Generates (emission, episodes, error) for each emission of
+        emissions, as soon as its episodes are available.
+
+        The episodes which aren't cached are fetched by max_workers
+        threads. If they cannot be fetched, episodes is None and error is
+        the raised exception. The fetched episodes are cached at once at
+        the end (or when the generator is closed).
+        """
+        to_fetch = []
+
+        for emission in emissions:
+            episodes = None
+
+            if short_version:
+                episodes, is_stale = self._get_cached_emission_episodes(emission)
+
+            if episodes is None:
+                to_fetch.append(emission)
+            else:
+                yield emission, self._setup_episodes(episodes), None
+
+        if not to_fetch:
+            return
+
+        fetched = []
+        futures = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        try:
+
+            # merged with the identical fetches of get_emission_episodes()
+            for emission in to_fetch:
+                future = executor.submit(self._fetch_emission_episodes,
+                                         emission, short_version,
+                                         short_version, False)
+                futures[future] = emission
+
+            for future in concurrent.futures.as_completed(futures):
+                emission = futures[future]
 
-        # Add local emissions (to find Extra emissions & episodes)
-        emissions = self.get_emissions()
+                try:
+                    episodes = future.result()
+                except Exception as e:
+                    self._logger.warning('Cannot get episodes of {}: {}'.format(emission.Id, e))
+                    yield emission, None, e
+                    continue
+
+                fetched.append((emission, episodes))
+                yield emission, self._setup_episodes(episodes), None
+        finally:
+            # Don't make nor wait for the remaining requests if the caller
+            # stopped
+            for future in futures:
+                future.cancel()
+
+            executor.shutdown(wait=False)
+
+            if short_version and fetched:
+                self._cache.set_many_emission_episodes(fetched)
+
+    def _setup_search_result(self, sr):
+        sr = copy.copy(sr)
+
+        if sr.Emission is not None:
+            sr.Emission = self._setup_bo(sr.Emission)
+
+        if sr.Episode is not None:
+            sr.Episode = self._setup_bo(sr.Episode)
+
+        return sr
+
+    def _get_local_search_matches(self, query):
+        # Local emissions (to find Extra emissions & episodes) whose title
+        # matches query
         query_upper = query.upper()
+        matches = []
+
+        for emission in self.get_emissions():
+            if query_upper not in emission.get_title().upper():
+                continue
+
+            if self._cache.is_emission_missing(emission):
+                continue
+
+            matches.append(emission)
+
+        return matches
+
+    def _iter_search(self, query, max_workers):
+        # Generates (position, results), where position is the position of
+        # results in the ordered search results.
+        # The transport's result may be cached: don't modify it.
+        transport_search = self._transport.search(query)
+        search = toutv.bos.SearchResults()
+        search.ModifiedQuery = transport_search.ModifiedQuery
+        search.Results = [self._setup_search_result(sr)
+                          for sr in transport_search.Results]
+        self._set_bo_proxies(search)
+
+        yield 0, search
+
+        matches = self._get_local_search_matches(query)
+        positions = {id(emission): i + 1 for i, emission in enumerate(matches)}
+
+        for emission, episodes, error in self.get_many_emission_episodes(matches, max_workers):
+            if error is not None:
+                if isinstance(error, toutv.exceptions.UnexpectedHttpStatusCodeError) and error.status_code == 404:
+                    # Show returned by search was not found on new API; just skip this result,
+                    # and don't ask again for a while
+                    self._cache.set_emission_missing(emission)
+                    continue
+
+                raise error
+
+            # Add this emission and its episodes to the search results
+            search = toutv.bos.SearchResults()
+            search.ModifiedQuery = transport_search.ModifiedQuery
+            search.Results = []
+
+            sr = toutv.bos.SearchResultData()
+            sr.Emission = emission
+            search.Results.append(sr)
+
+            for episode in episodes:
+                sr = toutv.bos.SearchResultData()
+                sr.Episode = episode
+                search.Results.append(sr)
+
+            yield positions[id(emission)], search
+
+    def iter_search(self, query, max_workers=8):
+        """Generates the results of a search, as SearchResults objects.
+
+        The first one contains the results of the TOU.TV search. Then,
+        for each local emission whose title contains query, one contains
+        the emission and its episodes, as soon as they're available:
+        they're fetched concurrently by max_workers threads.
+        """
+        for position, search in self._iter_search(query, max_workers):
+            yield search
+
+    def search(self, query, max_workers=8):
+        parts = sorted(self._iter_search(query, max_workers),
+                       key=lambda part: part[0])
+        search = parts[0][1]
+
+        for position, part in parts[1:]:
+            search.Results += part.Results
+
+        return search
+
+    @staticmethod
+    def _set_emission_details(emissions, details):
         for emission in emissions:
-            if query_upper in emission.get_title().upper():
+            for name, value in details.items():
+                setattr(emission, name, value)
+
+            emission.set_hydrated()
+
+    def hydrate(self, bos, max_workers=8):
+        """Fetches the missing lazy fields (see
+        toutv.bos._Bo.get_missing_fields()) of bos, a list of emissions
+        and episodes.
+
+        This is done in a single round of concurrent requests made by
+        max_workers threads: one per emission whose details aren't cached,
+        and one per emission of the episodes. The fetched emission details
+        are cached. Objects whose fields can't be fetched are considered
+        hydrated anyway. Emissions and episodes set up by a lazy client are
+        hydrated on demand, but calling this first for many of them is
+        faster.
+        """
+        emissions_to_hydrate = {}
+        episodes_to_hydrate = {}
+        emissions_by_id = None
+
+        for bo in bos:
+            if not bo.get_missing_fields():
+                continue
+
+            if not isinstance(bo, toutv.bos.Episode):
+                emissions_to_hydrate.setdefault(bo.Id, []).append(bo)
+                continue
+
+            # Episodes of search results only know their emission's ID
+            emission = bo.get_emission()
+
+            if emission is None and bo.get_emission_id() is not None:
+                if emissions_by_id is None:
+                    emissions_by_id = {str(e.Id): e for e in self.get_emissions()}
+
+                emission = emissions_by_id.get(str(bo.get_emission_id()))
+
+            if emission is None:
+                bo.set_hydrated()
+                continue
+
+            episodes_to_hydrate.setdefault(emission.Id, (emission, []))[1].append(bo)
+
+        # The details are cached per emission, apart from the catalog
+        for emid, emissions in list(emissions_to_hydrate.items()):
+            fields = self._cache.get_emission_details(emissions[0])
+
+            if fields is not None:
+                self._set_emission_details(emissions, fields)
+                del emissions_to_hydrate[emid]
+
+        if not emissions_to_hydrate and not episodes_to_hydrate:
+            return
+
+        details = []
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        try:
+            details_futures = {}
+            episodes_futures = {}
+
+            for emissions in emissions_to_hydrate.values():
+                future = executor.submit(self._transport.get_emission_details,
+                                         emissions[0])
+                details_futures[future] = emissions
+
+            # The full episode lists only serve to hydrate the caller's
+            # episodes: like in get_emission_episodes(), they're not cached
+            for emission, episodes in episodes_to_hydrate.values():
+                future = executor.submit(self._fetch_emission_episodes,
+                                         emission, False, False)
+                episodes_futures[future] = (emission, episodes)
+
+            for future, emissions in details_futures.items():
                 try:
-                    # Load this emission' episodes, and add those to the search results too
-                    episodes = self._transport.get_emission_episodes(emission, True)
+                    fields = future.result()
+                except Exception as e:
+                    self._logger.warning('Cannot get details of emission {}: {}'.format(emissions[0].Id, e))
+
+                    # don't try again on each getter call
+                    self._set_emission_details(emissions, {})
+                    continue
 
-                    sr = toutv.bos.SearchResultData()
-                    sr.Emission = emission
-                    search.Results.append(sr)
+                self._set_emission_details(emissions, fields)
+                details.append((emissions[0], fields))
+
+            for future, (emission, episodes) in episodes_futures.items():
+                try:
+                    all_episodes = future.result()
+                except Exception as e:
+                    self._logger.warning('Cannot get episodes of {}: {}'.format(emission.Id, e))
 
                     for episode in episodes:
-                        sr = toutv.bos.SearchResultData()
-                        sr.Episode = episode
-                        search.Results.append(sr)
-                except toutv.exceptions.UnexpectedHttpStatusCodeError as e:
-                    if e.status_code == 404:
-                        # Show returned by search was not found on new API; just skip this result
-                        pass
-                    else:
-                        raise e
+                        episode.set_hydrated()
 
-        return search
+                    continue
+
+                by_id = {str(episode.Id): episode for episode in all_episodes}
+
+                for episode in episodes:
+                    full_episode = by_id.get(str(episode.Id))
+
+                    if full_episode is not None:
+                        for name in episode.get_missing_fields():
+                            setattr(episode, name, getattr(full_episode, name))
+
+                    episode.set_hydrated()
+        finally:
+            executor.shutdown()
+
+        if details:
+            self._cache.set_many_emission_details(details)
 
     def get_emission_by_whatever(self, query):
-        shows = self.get_emissions()
+        shows, is_stale = self._get_emissions()
+
+        try:
+            return self._match_emission(shows, query)
+        except NoMatchException:
+            if not is_stale:
+                raise
+
+        # It may be a new emission: don't wait for the background refresh
+        self._logger.debug('No match for {} in stale emissions, refreshing'.format(query))
+
+        return self._match_emission(self.refresh_emissions(), query)
+
+    @staticmethod
+    def _match_emission(shows, query):
         query_upper = query.upper()
         # Map candidates to shows, so that when we get a match between the
         # query string and a candidate string, it's easy to go back to the<
@@ -171,7 +612,22 @@ class Client:
         return candidates_to_shows[first_match]
 
     def get_episode_by_name(self, emission, episode_name, short_version=False):
-        episodes = self.get_emission_episodes(emission, short_version)
+        episodes, is_stale = self._get_emission_episodes(emission, short_version)
+
+        try:
+            return self._match_episode(episodes, episode_name)
+        except NoMatchException:
+            if not is_stale:
+                raise
+
+        # It may be a new episode: don't wait for the background refresh
+        self._logger.debug('No match for {} in stale episodes, refreshing'.format(episode_name))
+
+        return self._match_episode(self.refresh_emission_episodes(emission),
+                                   episode_name)
+
+    @staticmethod
+    def _match_episode(episodes, episode_name):
         episode_name_upper = episode_name.upper()
         candidates = []
 
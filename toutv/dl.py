@@ -28,14 +28,18 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import re
+import json
+import time
 import errno
 import struct
 import logging
-import requests
 import functools
+import threading
+import collections
 from Crypto.Cipher import AES
-import toutv.config
 import toutv.exceptions
+import toutv.http
 import toutv.m3u8
 
 
@@ -102,6 +106,11 @@ class SegmentHandler:
         """
         raise NotImplementedError()
 
+    def set_metadata(self, metadata):
+        """Called with the segment provider's metadata (a dict) before
+        finalize."""
+        pass
+
     def finalize(self, num_segments):
         """Called once all the segments have been successfully downloaded."""
         raise NotImplementedError()
@@ -115,14 +124,21 @@ class FilesystemSegmentHandler(SegmentHandler):
                  bitrate,
                  output_dir,
                  filename,
-                 overwrite=False):
+                 overwrite=False,
+                 start=None,
+                 end=None,
+                 live=False):
         self._episode = episode
         self._bitrate = bitrate
         self._output_dir = output_dir
         self._overwrite = overwrite
+        self._start = start
+        self._end = end
+        self._live = live
 
         self._filename = filename
         self._output_path = os.path.join(self._output_dir, self._filename)
+        self._metadata = None
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -138,11 +154,24 @@ class FilesystemSegmentHandler(SegmentHandler):
     def output_dir(self):
         return self._output_dir
 
+    @property
+    def metadata_path(self):
+        return self._output_path + '.json'
+
     def _get_segment_file_path(self, segindex):
+        bitrate = self._bitrate
+
+        # Segment indexes of a time range download are relative to the
+        # range, so they must not collide with those of a full download.
+        if self._live:
+            bitrate = '{}-live'.format(bitrate)
+        elif self._start is not None or self._end is not None:
+            bitrate = '{}-{}-{}'.format(bitrate, self._start, self._end)
+
         fmt = '.toutv-{}-{}-{}-{}.ts'
         segname = fmt.format(self._episode.get_emission().get_id(),
                              self._episode.get_id(),
-                             self._bitrate,
+                             bitrate,
                              segindex)
 
         return os.path.join(self._output_dir, segname)
@@ -164,6 +193,12 @@ class FilesystemSegmentHandler(SegmentHandler):
 
         os.rename(part_output_path, self._output_path)
 
+    def _write_metadata(self):
+        self._logger.debug('writing metadata file "{}"'.format(self.metadata_path))
+
+        with open(self.metadata_path, 'w') as f:
+            json.dump(self._metadata, f, indent=2)
+
     def _remove_segment_file(self, segindex):
         segpath = self._get_segment_file_path(segindex)
         self._logger.debug('removing segment file "{}"'.format(segpath))
@@ -185,6 +220,7 @@ class FilesystemSegmentHandler(SegmentHandler):
         self._logger.debug('bitrate: {}'.format(self._bitrate))
         self._logger.debug('output path: {}'.format(self._output_path))
         self._logger.debug('overwrite: {}'.format(self._overwrite))
+        self._logger.debug('time range: [{}, {})'.format(self._start, self._end))
 
         # Ensure the output directory exists.
         os.makedirs(self._output_dir, exist_ok=True)
@@ -194,6 +230,11 @@ class FilesystemSegmentHandler(SegmentHandler):
             raise FileExistsError(self._output_path)
 
     def has_segment(self, segindex):
+        # Indexes of a live capture depend on when it started, so segment
+        # files of a previous capture can't be reused.
+        if self._live:
+            return False
+
         segpath = self._get_segment_file_path(segindex)
 
         self._logger.debug('segment file path: "{}"'.format(segpath))
@@ -223,11 +264,18 @@ class FilesystemSegmentHandler(SegmentHandler):
             else:
                 raise
 
+    def set_metadata(self, metadata):
+        self._metadata = metadata
+
     def finalize(self, num_segments):
         try:
             # stitch individual segment files as a complete file
             self._stitch_segment_files(num_segments)
 
+            # write the sidecar metadata file, if there's anything to say
+            if self._metadata:
+                self._write_metadata()
+
             # remove segment files
             self._remove_segment_files(num_segments)
         except OSError as e:
@@ -237,6 +285,52 @@ class FilesystemSegmentHandler(SegmentHandler):
                 raise
 
 
+class KeyCache:
+    """Bounded cache of decryption keys, keyed by key URI.
+
+    A key is fetched once, even when several threads need it at the same
+    time, and the least recently used keys are evicted first.
+    """
+
+    def __init__(self, fetch_key, max_keys=16):
+        self._fetch_key = fetch_key
+        self._max_keys = max_keys
+        self._keys = collections.OrderedDict()
+        self._uri_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, uri):
+        with self._lock:
+            if uri in self._keys:
+                self._keys.move_to_end(uri)
+                return self._keys[uri]
+
+            uri_lock = self._uri_locks.setdefault(uri, threading.Lock())
+
+        # Only one thread fetches a given key; the others wait for it.
+        with uri_lock:
+            with self._lock:
+                if uri in self._keys:
+                    self._keys.move_to_end(uri)
+                    return self._keys[uri]
+
+            key = self._fetch_key(uri)
+
+            with self._lock:
+                self._keys[uri] = key
+
+                while len(self._keys) > self._max_keys:
+                    self._keys.popitem(last=False)
+
+                del self._uri_locks[uri]
+
+        return key
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+
 class SegmentProvider:
 
     def __init__(self):
@@ -248,50 +342,117 @@ class SegmentProvider:
     def num_segments(self):
         raise NotImplementedError()
 
+    def wait_for_segment(self, segindex):
+        """Return whether segment with index segindex exists.
+
+        Providers of live streams block here until the segment becomes
+        available, and return False once the stream has ended.
+        """
+        return segindex < self.num_segments()
+
     def download_segment(self, segindex, progress):
         raise NotImplementedError()
 
+    def get_metadata(self):
+        """Return a dict of metadata about the downloaded segments."""
+        return {}
+
     def finalize(self):
         raise NotImplementedError()
 
 
 class ToutvApiSegmentProvider(SegmentProvider):
-    """Segment provider that fetches segments using the Tou.tv API"""
+    """Segment provider that fetches segments using the Tou.tv API
+
+    In live mode, the media playlist is reloaded every target duration
+    until it ends (or until end seconds were captured), and new segments
+    are provided as they appear.
+
+    In adaptive mode, the media playlists of the variants neighbouring the
+    current one are kept loaded. When the measured throughput falls below
+    down_ratio times the current bitrate, the next segments are fetched
+    from the lower variant; it goes back up (never above bitrate) when
+    the throughput exceeds up_ratio times the higher bitrate.
+    """
 
     _seg_aes_iv = struct.Struct('>IIII')
 
-    def __init__(self, episode, bitrate, proxies=None, timeout=15):
+    # Don't hammer playlists with a tiny (or missing) target duration
+    _min_reload_delay = 1
+
+    def __init__(self, episode, bitrate, proxies=None, timeout=15,
+                 start=None, end=None, live=False, adaptive=False,
+                 down_ratio=1.2, up_ratio=2):
         super().__init__()
 
         self._episode = episode
         self._bitrate = bitrate
         self._proxies = proxies
         self._timeout = timeout
+        self._start = start
+        self._end = end
+        self._live = live
+        self._first_segindex = 0
+        self._end_segindex = None
 
         self._cookies = None
         self._video_playlist = None
+        self._video_playlist_uri = None
+        self._last_reload_time = None
+        self._reload_delay = None
         self._segments = None
-        self._key = None
+        self._key_cache = KeyCache(self._fetch_key)
+
+        self._adaptive = adaptive and not live
+        self._down_ratio = down_ratio
+        self._up_ratio = up_ratio
+        self._variants = None
+        self._variant_index = None
+        self._max_variant_index = None
+        self._variant_segments = {}
+        self._throughput = None
+        self._switches = []
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    def _do_request(self, url, params=None, stream=False):
-        self._logger.debug('HTTP GET request @ {}'.format(url))
+    def _do_request(self, url, params=None, stream=False, num_tries=None):
+        http_client = toutv.http.get_default_client()
 
-        try:
-            r = requests.get(url, params=params, headers=toutv.config.HEADERS,
-                             proxies=self._proxies, cookies=self._cookies,
-                             timeout=self._timeout, stream=stream)
+        return http_client.get(url, params=params, proxies=self._proxies,
+                               cookies=self._cookies, timeout=self._timeout,
+                               stream=stream, num_tries=num_tries)
+
+    def _fetch_key(self, uri):
+        key = self._do_request(uri).content
+        self._logger.debug('decryption key for "{}": {}'.format(uri, key))
+
+        return key
+
+    def _decrypt_segment(self, segment, segindex, data):
+        if not segment.is_encrypted():
+            return data
 
-            if r.status_code != 200:
-                raise toutv.exceptions.UnexpectedHttpStatusCodeError(url,
-                                                                     r.status_code)
-        except requests.exceptions.Timeout:
-            raise toutv.exceptions.RequestTimeoutError(url, self._timeout)
-        except requests.exceptions.ConnectionError as e:
-            raise toutv.exceptions.NetworkError() from e
+        key = segment.key
 
-        return r
+        if key.method != toutv.m3u8.Key.METHOD_AES_128:
+            raise DownloadError('Unsupported encryption method "{}"'.format(key.method))
+
+        aes_iv = key.get_iv_bytes()
+
+        # Without an explicit IV, it is derived from the segment's index in
+        # the complete playlist, or from its media sequence number for a
+        # live playlist.
+        if aes_iv is None:
+            if self._live:
+                iv_seq = segment.sequence
+            else:
+                iv_seq = self._first_segindex + segindex + 1
+
+            aes_iv = self._seg_aes_iv.pack(0, 0, 0, iv_seq)
+
+        aes = AES.new(self._key_cache.get(key.uri), AES.MODE_CBC, aes_iv)
+
+        return aes.decrypt(data)
 
     @staticmethod
     def _get_video_stream(playlist, bitrate):
@@ -301,6 +462,98 @@ class ToutvApiSegmentProvider(SegmentProvider):
 
         raise DownloadError('Cannot find stream for bitrate {} bps'.format(bitrate))
 
+    def _get_variant_segments(self, variant_index):
+        # load (and keep) the media playlist of a variant
+        if variant_index not in self._variant_segments:
+            stream = self._variants[variant_index]
+            m3u8_file = self._do_request(stream.uri).text
+            playlist = toutv.m3u8.parse(m3u8_file, os.path.dirname(stream.uri))
+            self._variant_segments[variant_index] = playlist.segments
+
+        return self._variant_segments[variant_index]
+
+    def _is_variant_usable(self, variant_index):
+        if variant_index < 0 or variant_index >= len(self._variants):
+            return False
+
+        try:
+            segments = self._get_variant_segments(variant_index)
+        except toutv.exceptions.NetworkError as e:
+            self._logger.warning('cannot load variant playlist: {}'.format(e))
+            return False
+
+        # Segments of another variant replace ours index for index, so
+        # they must be aligned.
+        if len(segments) != len(self._segments):
+            tmpl = 'variant {} bps is not aligned with the current one'
+            self._logger.debug(tmpl.format(self._variants[variant_index].bandwidth))
+            return False
+
+        return True
+
+    def _switch_variant(self, segindex, variant_index):
+        old_bitrate = self._variants[self._variant_index].bandwidth
+        new_bitrate = self._variants[variant_index].bandwidth
+        abs_segindex = self._first_segindex + segindex
+        tmpl = 'switching from {} bps to {} bps at segment {} (throughput: {:.0f} bps)'
+        self._logger.info(tmpl.format(old_bitrate, new_bitrate, abs_segindex,
+                                      self._throughput))
+
+        self._switches.append({
+            'segment': abs_segindex,
+            'time': self._video_playlist.get_segment_start_time(abs_segindex),
+            'from_bitrate': old_bitrate,
+            'to_bitrate': new_bitrate,
+            'throughput': round(self._throughput),
+        })
+        self._variant_index = variant_index
+        self._segments = self._get_variant_segments(variant_index)
+
+        # keep the new neighbours loaded
+        for neighbour in [variant_index - 1, variant_index + 1]:
+            if neighbour != self._max_variant_index + 1:
+                self._is_variant_usable(neighbour)
+
+    def _adapt(self, next_segindex):
+        # Pick the variant for the segment with index next_segindex from
+        # the smoothed throughput.
+        cur_bitrate = self._variants[self._variant_index].bandwidth
+
+        if self._throughput < self._down_ratio * cur_bitrate:
+            if self._is_variant_usable(self._variant_index - 1):
+                self._switch_variant(next_segindex, self._variant_index - 1)
+        elif self._variant_index < self._max_variant_index:
+            up_bitrate = self._variants[self._variant_index + 1].bandwidth
+
+            if self._throughput > self._up_ratio * up_bitrate:
+                if self._is_variant_usable(self._variant_index + 1):
+                    self._switch_variant(next_segindex, self._variant_index + 1)
+
+    def _update_throughput(self, num_bytes, seconds):
+        # exponentially weighted moving average, in bits/s
+        throughput = num_bytes * 8 / max(seconds, 1e-3)
+
+        if self._throughput is None:
+            self._throughput = throughput
+        else:
+            self._throughput = (self._throughput + throughput) / 2
+
+    def _init_variants(self, playlist, stream):
+        # candidate video variants, up to the requested bitrate
+        streams = [s for s in playlist.streams
+                   if re.search(r'_av\.m3u8', s.uri) and s.bandwidth <= self._bitrate]
+
+        if stream not in streams:
+            streams.append(stream)
+
+        self._variants = sorted(streams, key=lambda s: s.bandwidth)
+        self._variant_index = self._variants.index(stream)
+        self._max_variant_index = self._variant_index
+        self._variant_segments[self._variant_index] = self._segments
+
+        # preload the lower variant
+        self._is_variant_usable(self._variant_index - 1)
+
     def _download_segment(self, segindex, progress):
         self._logger.debug('downloading segment {}'.format(segindex))
 
@@ -309,8 +562,9 @@ class ToutvApiSegmentProvider(SegmentProvider):
         num_bytes = 0
 
         # Obtain the URI to download this segment.
-        segment = self._segments[segindex]
-        request = self._do_request(segment.uri, stream=True)
+        segment = self._segments[self._first_segindex + segindex]
+        # _download_segment_with_retry() retries, possibly at a lower quality
+        request = self._do_request(segment.uri, stream=True, num_tries=1)
 
         # Fetch by chunks of 8 kiB
         for chunk in request.iter_content(8192):
@@ -327,28 +581,39 @@ class ToutvApiSegmentProvider(SegmentProvider):
             chunks_count += 1
 
         # We have the whole segment, decrypt it if needed.
-        if self._key:
-            aes_iv = self._seg_aes_iv.pack(0, 0, 0, segindex + 1)
-            aes = AES.new(self._key, AES.MODE_CBC, aes_iv)
-            ts_segment = aes.decrypt(bytes(encrypted_ts_segment))
-        else:
-            ts_segment = bytes(encrypted_ts_segment)
-
-        return ts_segment
+        return self._decrypt_segment(segment, segindex,
+                                     bytes(encrypted_ts_segment))
 
     def _download_segment_with_retry(self, segindex, progress, num_tries=3):
         for i in range(num_tries):
+            start_time = time.monotonic()
+
             try:
-                return self._download_segment(segindex, progress)
+                segment = self._download_segment(segindex, progress)
             except toutv.exceptions.NetworkError:
                 # If it was our last retry, give up and propagate the exception.
                 if i + 1 == num_tries:
                     raise
 
+                # A failed attempt is the worst throughput: retry lower.
+                if self._adaptive:
+                    self._throughput = 0
+                    self._adapt(segindex)
+
+                continue
+
+            if self._adaptive:
+                self._update_throughput(len(segment),
+                                        time.monotonic() - start_time)
+                self._adapt(segindex + 1)
+
+            return segment
+
     def initialize(self):
         self._logger.debug('episode: {}'.format(self._episode))
         self._logger.debug('bitrate: {}'.format(self._bitrate))
         self._logger.debug('timeout: {}'.format(self._timeout))
+        self._logger.debug('live: {}'.format(self._live))
 
         playlist, cookies = self._episode.get_playlist_cookies()
         self._cookies = cookies
@@ -357,26 +622,122 @@ class ToutvApiSegmentProvider(SegmentProvider):
         stream = self._get_video_stream(playlist, self._bitrate)
 
         # get video playlist
+        self._video_playlist_uri = stream.uri
+        self._last_reload_time = time.monotonic()
         m3u8_file = self._do_request(stream.uri).text
         self._video_playlist = toutv.m3u8.parse(m3u8_file,
                                                 os.path.dirname(stream.uri))
         self._segments = self._video_playlist.segments
+        self._set_reload_delay(self._video_playlist.target_duration)
         self._logger.debug('parsed M3U8 file: {} total segments'.format(self.num_segments()))
 
-        # get decryption key
-        if self._segments[0].key:
-            uri = self._segments[0].key.uri
-            self._key = self._do_request(uri).content
-            self._logger.debug('decryption key: {}'.format(self._key))
+        if not self._segments:
+            raise DownloadError('Media playlist has no segments')
+
+        # only keep the segments covering the requested time range (the
+        # end of a live capture is only known once it's reached)
+        if not self._live and (self._start is not None or self._end is not None):
+            try:
+                first, last = self._video_playlist.get_segment_range(self._start,
+                                                                     self._end)
+            except ValueError as e:
+                raise DownloadError(str(e)) from e
+
+            self._first_segindex = first
+            self._end_segindex = last
+            tmpl = 'time range [{}, {}): segments {} to {}'
+            self._logger.debug(tmpl.format(self._start, self._end, first,
+                                           last - 1))
+
+        if self._adaptive:
+            self._init_variants(playlist, stream)
+
+        # get the first decryption key now, so that we fail early (the
+        # other ones are fetched when a segment needs them)
+        first_segment = self._segments[self._first_segindex]
+
+        if first_segment.is_encrypted():
+            self._key_cache.get(first_segment.key.uri)
         else:
-            self._logger.debug('no decryption key found')
+            self._logger.debug('first segment is not encrypted')
 
     def num_segments(self):
-        return len(self._segments)
+        end_segindex = self._end_segindex
+
+        if end_segindex is None:
+            end_segindex = len(self._segments)
+
+        return end_segindex - self._first_segindex
+
+    def _sleep_until_reload(self):
+        reload_time = self._last_reload_time + self._reload_delay
+
+        while True:
+            if self.cancel:
+                raise CancelledByUserError()
+
+            remaining = reload_time - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            time.sleep(min(remaining, .25))
+
+    def _reload_video_playlist(self):
+        self._sleep_until_reload()
+        self._last_reload_time = time.monotonic()
+        uri = self._video_playlist_uri
+        m3u8_file = self._do_request(uri).text
+        num_new_segments = toutv.m3u8.update(self._video_playlist, m3u8_file,
+                                             os.path.dirname(uri))
+        self._logger.debug('reloaded M3U8 file: {} new segments'.format(num_new_segments))
+
+        # As recommended by the HLS RFC, wait half the target duration
+        # before reloading again when the playlist did not change.
+        target_duration = self._video_playlist.target_duration
+
+        if num_new_segments > 0:
+            self._set_reload_delay(target_duration)
+        else:
+            self._set_reload_delay(target_duration / 2)
+
+    def _set_reload_delay(self, delay):
+        self._reload_delay = max(delay, self._min_reload_delay)
+
+    def wait_for_segment(self, segindex):
+        if not self._live:
+            return segindex < self.num_segments()
+
+        # stop once the requested duration was captured
+        if self._end is not None:
+            duration = self._video_playlist.get_segment_start_time(segindex)
+
+            if duration >= self._end:
+                self._end_segindex = segindex
+
+                return False
+
+        # an ended (or VOD) playlist won't get any new segment
+        while segindex >= self.num_segments():
+            if not self._video_playlist.is_live():
+                return False
+
+            self._reload_video_playlist()
+
+        return True
 
     def download_segment(self, segindex, progress):
         return self._download_segment_with_retry(segindex, progress)
 
+    def get_metadata(self):
+        if not self._switches:
+            return {}
+
+        return {
+            'bitrate': self._bitrate,
+            'bitrate_switches': self._switches,
+        }
+
     def finalize(self):
         pass
 
@@ -395,8 +756,27 @@ class Downloader:
         self._on_dl_start = on_dl_start
 
         self._do_cancel = False
+        self._num_downloaded_bytes = 0
+        self._download_time = 0
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    @property
+    def num_downloaded_bytes(self):
+        """Number of bytes actually downloaded (skipped segments excluded)."""
+        return self._num_downloaded_bytes
+
+    @property
+    def download_time(self):
+        """Time (s) spent downloading segments."""
+        return self._download_time
+
+    def get_throughput(self):
+        """Returns the measured throughput (bytes/s), or None."""
+        if self._download_time <= 0:
+            return None
+
+        return self._num_downloaded_bytes / self._download_time
+
     def cancel(self):
         self._logger.info('cancelling download')
         self._seg_provider.cancel = True
@@ -418,7 +798,7 @@ class Downloader:
         self._seg_handler.initialize()
         self._seg_provider.initialize()
 
-        # Get the number of segments.
+        # Get the number of segments (known so far, for a live stream).
         num_segments = self._seg_provider.num_segments()
 
         # Notify of the download start.
@@ -430,8 +810,10 @@ class Downloader:
         # Number of bytes in the completely downloaded segments.
         done_segment_bytes = 0
 
+        segindex = 0
+
         try:
-            for segindex in range(num_segments):
+            while self._seg_provider.wait_for_segment(segindex):
 
                 if self._do_cancel:
                     raise CancelledByUserError()
@@ -439,6 +821,7 @@ class Downloader:
                 if self._seg_handler.has_segment(segindex):
                     self._logger.debug('segment handler already has segment; skipping')
                     done_segment_bytes += self._seg_handler.segment_size(segindex)
+                    segindex += 1
                     continue
 
                 # Function called by the segment provider to notify of progress
@@ -447,7 +830,10 @@ class Downloader:
                                              segindex, done_segment_bytes)
 
                 # Get the segment.
+                start_time = time.monotonic()
                 segment = self._seg_provider.download_segment(segindex, progress)
+                self._download_time += time.monotonic() - start_time
+                self._num_downloaded_bytes += len(segment)
 
                 # Update running sum of bytes.
                 done_segment_bytes += len(segment)
@@ -458,9 +844,12 @@ class Downloader:
                 # Do something with the segment.
                 self._seg_handler.on_segment(segindex, segment)
 
+                segindex += 1
+
             # All the segments were fetched.
             self._seg_provider.finalize()
-            self._seg_handler.finalize(num_segments)
+            self._seg_handler.set_metadata(self._seg_provider.get_metadata())
+            self._seg_handler.finalize(segindex)
         except DownloadError as e:
             # If the exception is already a DownloadError, just propagate it...
             raise e
@@ -66,3 +66,22 @@ class UnexpectedHttpStatusCodeError(NetworkError):
     def __str__(self):
         tmpl = 'Unexpected HTTP response code {} for "{}"'
         return tmpl.format(self._status_code, self._url)
+
+
+class CircuitOpenError(NetworkError):
+
+    def __init__(self, host, retry_after):
+        self._host = host
+        self._retry_after = retry_after
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def retry_after(self):
+        return self._retry_after
+
+    def __str__(self):
+        tmpl = 'Host "{}" is unavailable (retry in {:.0f} s)'
+        return tmpl.format(self._host, self._retry_after)
@@ -0,0 +1,411 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import http.cookiejar
+import logging
+import threading
+import time
+import requests
+import requests.adapters
+import toutv.config
+import toutv.exceptions
+from urllib.parse import urlparse
+
+
+class CircuitBreaker:
+
+    """Circuit breaker of a host.
+
+    After failure_threshold consecutive failures (network errors,
+    timeouts and server errors), the circuit opens: requests fail
+    immediately for reset_timeout seconds. Then a single trial request
+    goes through (half-open): the circuit closes if it succeeds, and opens
+    again otherwise.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30):
+        self._host = host
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CircuitBreaker.CLOSED
+        self._num_failures = 0
+        self._open_time = None
+        self._trial_in_progress = False
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _get_state(self):
+        if self._state == CircuitBreaker.OPEN:
+            if time.monotonic() - self._open_time >= self._reset_timeout:
+                return CircuitBreaker.HALF_OPEN
+
+        return self._state
+
+    def get_state(self):
+        with self._lock:
+            return self._get_state()
+
+    def before_request(self):
+        """Raises toutv.exceptions.CircuitOpenError if no request may be
+        sent to the host now."""
+        with self._lock:
+            state = self._get_state()
+
+            if state == CircuitBreaker.CLOSED:
+                return
+
+            if state == CircuitBreaker.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return
+
+            elapsed = time.monotonic() - self._open_time
+            retry_after = max(self._reset_timeout - elapsed, 0)
+
+        raise toutv.exceptions.CircuitOpenError(self._host, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN:
+                self._logger.info('Closing circuit of {}'.format(self._host))
+
+            self._state = CircuitBreaker.CLOSED
+            self._num_failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._num_failures += 1
+
+            if self._trial_in_progress or self._num_failures >= self._failure_threshold:
+                if self._state != CircuitBreaker.OPEN:
+                    tmpl = 'Opening circuit of {} after {} failures'
+                    self._logger.warning(tmpl.format(self._host, self._num_failures))
+
+                self._state = CircuitBreaker.OPEN
+                self._open_time = time.monotonic()
+                self._trial_in_progress = False
+
+
+class HttpClient:
+
+    """HTTP client shared by the transports, business objects, segment
+    providers and authentication.
+
+    Connections are pooled in one requests session per host, so that they
+    are reused from a request to the next one (catalog, playlists,
+    segments). The headers of toutv.config.HEADERS are sent with each
+    request. Cookies are never kept between requests: the ones of a
+    response are available in its cookies attribute.
+
+    Idempotent requests which fail because of a network error, a timeout
+    or a server error (retry_status_codes) are tried up to num_tries
+    times, waiting retry_delay, then twice as long, and so on, between
+    tries.
+
+    Each host has a CircuitBreaker (see failure_threshold and
+    reset_timeout): while a host is considered down, requests to it fail
+    immediately with toutv.exceptions.CircuitOpenError.
+
+    get_stats() returns counters per host.
+    """
+
+    retry_status_codes = [502, 503, 504]
+
+    def __init__(self, timeout=30, num_tries=2, retry_delay=0.5,
+                 pool_size=16, failure_threshold=5, reset_timeout=30):
+        self._timeout = timeout
+        self._num_tries = num_tries
+        self._retry_delay = retry_delay
+        self._pool_size = pool_size
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _create_session(self):
+        session = requests.Session()
+        session.headers.update(toutv.config.HEADERS)
+
+        # Reject all cookies: they're passed explicitly when needed
+        policy = http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+        session.cookies.set_policy(policy)
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=self._pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def _get_session(self, host):
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._create_session()
+
+            return self._sessions[host]
+
+    def _get_breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self._failure_threshold,
+                                                      self._reset_timeout)
+
+            return self._breakers[host]
+
+    def get_circuit_state(self, host):
+        """Returns the state of the circuit breaker of host."""
+        return self._get_breaker(host).get_state()
+
+    def _add_stats(self, host, **counters):
+        with self._lock:
+            if host not in self._stats:
+                self._stats[host] = {
+                    'requests': 0,
+                    'retries': 0,
+                    'errors': 0,
+                    'bytes': 0,
+                    'time': 0,
+                }
+
+            for name, value in counters.items():
+                self._stats[host][name] += value
+
+    def get_stats(self):
+        """Returns the counters (requests, retries, errors, received bytes
+        and time in seconds) of each host."""
+        with self._lock:
+            return {host: dict(stats) for host, stats in self._stats.items()}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions = {}
+
+    def request(self, method, url, params=None, headers=None, data=None,
+                cookies=None, proxies=None, timeout=None, stream=False,
+                allow_redirects=True, num_tries=None, ok_status_codes=(200,)):
+        """Sends a request and returns its response.
+
+        Raises toutv.exceptions.RequestTimeoutError on timeout,
+        toutv.exceptions.NetworkError on other network errors and, unless
+        ok_status_codes is None, toutv.exceptions.UnexpectedHttpStatusCodeError
+        if the response's status code isn't in ok_status_codes.
+        """
+        host = urlparse(url).netloc
+        session = self._get_session(host)
+        breaker = self._get_breaker(host)
+
+        if timeout is None:
+            timeout = self._timeout
+
+        if num_tries is None:
+            if method in ['GET', 'HEAD']:
+                num_tries = self._num_tries
+            else:
+                num_tries = 1
+
+        for i in range(num_tries):
+            is_last_try = i + 1 == num_tries
+
+            if i > 0:
+                self._add_stats(host, retries=1)
+                time.sleep(self._retry_delay * 2 ** (i - 1))
+
+            breaker.before_request()
+            self._logger.debug('HTTP {} request @ {}'.format(method, url))
+            start = time.monotonic()
+
+            try:
+                r = session.request(method, url, params=params, headers=headers,
+                                    data=data, cookies=cookies, proxies=proxies,
+                                    timeout=timeout, stream=stream,
+                                    allow_redirects=allow_redirects)
+                num_bytes = 0
+
+                if not stream:
+                    num_bytes = len(r.content)
+            except requests.exceptions.Timeout as e:
+                breaker.record_failure()
+                self._add_stats(host, requests=1, errors=1,
+                                time=time.monotonic() - start)
+
+                if is_last_try:
+                    raise toutv.exceptions.RequestTimeoutError(url, timeout) from e
+
+                self._logger.warning('Timeout with {}; will retry...'.format(url))
+                continue
+            except requests.exceptions.ConnectionError as e:
+                breaker.record_failure()
+                self._add_stats(host, requests=1, errors=1,
+                                time=time.monotonic() - start)
+
+                if is_last_try:
+                    raise toutv.exceptions.NetworkError() from e
+
+                self._logger.warning('Connection error with {}; will retry...'.format(url))
+                continue
+            except Exception:
+                # too many redirects, invalid URL, broken body, etc.: don't
+                # leave a half-open circuit waiting for this trial forever
+                breaker.record_failure()
+                self._add_stats(host, requests=1, errors=1,
+                                time=time.monotonic() - start)
+                raise
+
+            self._add_stats(host, requests=1, bytes=num_bytes,
+                            time=time.monotonic() - start)
+
+            if r.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if r.status_code in self.retry_status_codes and not is_last_try:
+                self._add_stats(host, errors=1)
+                tmpl = 'HTTP status code {} with {}; will retry...'
+                self._logger.warning(tmpl.format(r.status_code, url))
+                continue
+
+            self._check_status_code(host, url, r, ok_status_codes)
+
+            return r
+
+    def _check_status_code(self, host, url, r, ok_status_codes):
+        if ok_status_codes is not None and r.status_code not in ok_status_codes:
+            self._add_stats(host, errors=1)
+            raise toutv.exceptions.UnexpectedHttpStatusCodeError(url,
+                                                                 r.status_code)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    """Merges concurrent identical calls.
+
+    do(key, func) returns func(), unless a call with the same key is
+    already in progress in another thread: then it waits for this call
+    and returns its result (or raises its exception) instead.
+
+    get_stats() returns the number of actual 'calls' and of 'saved' ones.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._num_calls = 0
+        self._num_saved = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'calls': self._num_calls,
+                'saved': self._num_saved,
+            }
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self._num_calls += 1
+                is_waiter = False
+            else:
+                self._num_saved += 1
+                is_waiter = True
+
+        if is_waiter:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+        return call.result
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Returns the HTTP client shared by the whole process."""
+    global _default_client
+
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+
+        return _default_client
+
+
+def set_default_client(client):
+    """Replaces the HTTP client shared by the whole process (for example
+    with a toutv.cassette.RecordingHttpClient) and returns the previous
+    one."""
+    global _default_client
+
+    with _default_client_lock:
+        previous = _default_client
+        _default_client = client
+
+        return previous
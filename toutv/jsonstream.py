@@ -0,0 +1,118 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import codecs
+import json
+
+
+_BEFORE_ARRAY = 0
+_BEFORE_FIRST_ITEM = 1
+_BEFORE_ITEM = 2
+_AFTER_ITEM = 3
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+def iter_array(chunks):
+    """Generates the items of the JSON array contained in chunks (an
+    iterable of UTF-8 encoded bytes, like a streamed response's
+    iter_content()), parsing them one at a time.
+
+    Only the current item is kept in memory: the whole document is never
+    decoded at once. Raises ValueError if the document isn't a JSON
+    array.
+    """
+    chunks = iter(chunks)
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    json_decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    state = _BEFORE_ARRAY
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+
+        need_more = pos == len(buf)
+
+        if not need_more:
+            c = buf[pos]
+
+            if state == _BEFORE_ARRAY:
+                if c != '[':
+                    raise ValueError('Expecting a JSON array')
+
+                pos += 1
+                state = _BEFORE_FIRST_ITEM
+                continue
+
+            if c == ']' and state in [_BEFORE_FIRST_ITEM, _AFTER_ITEM]:
+                return
+
+            if state == _AFTER_ITEM:
+                if c != ',':
+                    raise ValueError('Expecting "," or "]" in JSON array')
+
+                pos += 1
+                state = _BEFORE_ITEM
+                continue
+
+            try:
+                item, end = json_decoder.raw_decode(buf, pos)
+            except ValueError:
+                # json.JSONDecodeError (Python 3.5+) is a ValueError
+                if eof:
+                    raise
+
+                # incomplete item
+                need_more = True
+            else:
+                # a number isn't complete until it's followed by a
+                # delimiter ("1" may be the start of "1.5")
+                if eof or (end < len(buf) and buf[end] in _DELIMITERS):
+                    yield item
+                    pos = end
+                    state = _AFTER_ITEM
+                    continue
+
+                need_more = True
+
+        if eof:
+            raise ValueError('Unexpected end of JSON array')
+
+        chunk = next(chunks, None)
+
+        if chunk is None:
+            eof = True
+            text = text_decoder.decode(b'', final=True)
+        else:
+            text = text_decoder.decode(chunk)
+
+        buf = buf[pos:] + text
+        pos = 0
@@ -25,12 +25,17 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import bisect
+import itertools
+import logging
 import re
 
 
 SIGNATURE = '#EXTM3U'
 EXT_PREFIX = '#EXT'
 
+_logger = logging.getLogger(__name__)
+
 
 class Tags:
 
@@ -99,6 +104,9 @@ class Key:
     URI = 'URI'
     IV = 'IV'
 
+    METHOD_NONE = 'NONE'
+    METHOD_AES_128 = 'AES-128'
+
     def __init__(self):
         self.method = None
         self.uri = None
@@ -112,6 +120,18 @@ class Key:
         elif name == self.IV:
             self.iv = value
 
+    def get_iv_bytes(self):
+        """Returns the explicit IV as 16 bytes, or None."""
+        if self.iv is None:
+            return None
+
+        iv = self.iv
+
+        if iv[0:2] in ['0x', '0X']:
+            iv = iv[2:]
+
+        return bytes.fromhex(iv.zfill(32))
+
 
 class Segment:
 
@@ -122,9 +142,10 @@ class Segment:
         self.duration = None
         self.title = None
         self.uri = None
+        self.sequence = None
 
     def is_encrypted(self):
-        return self.key is not None
+        return self.key is not None and self.key.method != Key.METHOD_NONE
 
 
 class Playlist:
@@ -132,7 +153,7 @@ class Playlist:
     """An M3U8 playlist."""
 
     def __init__(self, target_duration, media_sequence, allow_cache,
-                 playlist_type, version, streams, segments):
+                 playlist_type, version, streams, segments, ended=False):
         self.target_duration = target_duration
         self.media_sequence = media_sequence
         self.allow_cache = allow_cache
@@ -140,6 +161,78 @@ class Playlist:
         self.version = version
         self.streams = streams
         self.segments = segments
+        self.ended = ended
+        self._segment_end_times = []
+
+    def is_live(self):
+        return not self.ended and self.playlist_type != 'VOD'
+
+    def _get_segment_end_times(self):
+        # Cumulative segment durations: element i is the time at which
+        # segment i ends.  Segments are only ever appended, so we only need
+        # to extend the index with the new ones.
+        num_indexed = len(self._segment_end_times)
+
+        if num_indexed > len(self.segments):
+            num_indexed = 0
+            self._segment_end_times = []
+
+        if num_indexed < len(self.segments):
+            start = self._segment_end_times[-1] if num_indexed else 0
+            durations = [s.duration for s in self.segments[num_indexed:]]
+            ends = itertools.accumulate(durations)
+            self._segment_end_times += [start + end for end in ends]
+
+        return self._segment_end_times
+
+    def get_duration(self):
+        ends = self._get_segment_end_times()
+
+        if not ends:
+            return 0
+
+        return ends[-1]
+
+    def get_segment_start_time(self, segindex):
+        if segindex == 0:
+            return 0
+
+        return self._get_segment_end_times()[segindex - 1]
+
+    def get_segment_index_at(self, time):
+        """Returns the index of the segment playing at time (seconds)."""
+        ends = self._get_segment_end_times()
+
+        if not ends:
+            raise ValueError('Playlist has no segments')
+
+        index = bisect.bisect_right(ends, time)
+
+        return min(max(index, 0), len(ends) - 1)
+
+    def get_segment_range(self, start=None, end=None):
+        """Returns the (first, last + 1) indexes of the segments covering the
+        [start, end) time range (seconds).
+
+        A start or end of None means the beginning or the end of the
+        playlist.
+        """
+        ends = self._get_segment_end_times()
+
+        if start is None:
+            start = 0
+
+        if end is None:
+            end = self.get_duration()
+
+        if start < 0 or end <= start or start >= self.get_duration():
+            tmpl = 'Invalid time range [{}, {}) for a {} s playlist'
+            raise ValueError(tmpl.format(start, end, self.get_duration()))
+
+        first = self.get_segment_index_at(start)
+        last = bisect.bisect_left(ends, end)
+
+        return first, min(last, len(ends) - 1) + 1
 
 
 def _validate(lines):
@@ -165,6 +258,36 @@ def _line_is_relative_uri(line):
     return line[0:4] != 'http'
 
 
+def _parse_key(attributes, base_uri):
+    key = Key()
+
+    # Quoted values (like URI) may contain ','
+    regex = r'([\w-]+)=("[^"]*"|[^,]*)'
+    for name, value in re.findall(regex, attributes):
+        name = name.strip()
+        value = value.strip('"').strip()
+        key.set_attribute(name, value)
+
+    if key.uri is not None and _line_is_relative_uri(key.uri):
+        key.uri = '/'.join([base_uri, key.uri])
+
+    return key
+
+
+def _parse_segment(attributes, uri, key, sequence, base_uri):
+    duration, title = attributes.split(',', 1)
+    segment = Segment()
+    segment.key = key
+    segment.duration = float(duration.strip())
+    segment.title = title.strip()
+    segment.sequence = sequence
+    segment.uri = uri
+    if _line_is_relative_uri(segment.uri):
+        segment.uri = '/'.join([base_uri, segment.uri])
+
+    return segment
+
+
 def parse(data, base_uri):
     streams = []
     segments = []
@@ -174,6 +297,7 @@ def parse(data, base_uri):
     media_sequence = 0
     version = 0
     playlist_type = None
+    ended = False
     lines = data.split('\n')
 
     if not _validate(lines):
@@ -191,19 +315,13 @@ def parse(data, base_uri):
         elif tagname == Tags.EXT_X_MEDIA_SEQUENCE:
             media_sequence = int(attributes)
         elif tagname == Tags.EXT_X_KEY:
-            current_key = Key()
-
-            # TODO: do not use split since a URL may contain ','
-            attributes = attributes.split(',', 1)
-            for attribute in attributes:
-                name, value = attribute.split('=', 1)
-                name = name.strip()
-                value = value.strip('"').strip()
-                current_key.set_attribute(name, value)
+            current_key = _parse_key(attributes, base_uri)
         elif tagname == Tags.EXT_X_ALLOW_CACHE:
             allow_cache = (attributes.strip() == 'YES')
         elif tagname == Tags.EXT_X_PLAYLIST_TYPE:
             playlist_type = attributes.strip()
+        elif tagname == Tags.EXT_X_ENDLIST:
+            ended = True
         elif tagname == Tags.EXT_X_STREAM_INF:
             # Will match <PROGRAM-ID=1,BANDWIDTH=461000,RESOLUTION=480x270,CODECS="avc1.66.30, mp4a.40.5">
             regex = r'([\w-]+=(?:[a-zA-Z0-9]|"[a-zA-Z0-9,. ]*")+),?'
@@ -222,18 +340,68 @@ def parse(data, base_uri):
         elif tagname == Tags.EXT_X_VERSION:
             version = attributes
         elif tagname == Tags.EXTINF:
-            duration, title = attributes.split(',')
-            segment = Segment()
-            segment.key = current_key
-            segment.duration = float(duration.strip())
-            segment.title = title.strip()
-            segment.uri = lines[count + 1]
-            if _line_is_relative_uri(segment.uri):
-                segment.uri = '/'.join([base_uri, segment.uri])
+            sequence = media_sequence + len(segments)
+            segment = _parse_segment(attributes, lines[count + 1],
+                                     current_key, sequence, base_uri)
             segments.append(segment)
         else:
             # Ignore as specified in the RFC
             continue
 
     return Playlist(target_duration, media_sequence, allow_cache,
-                    playlist_type, version, streams, segments)
+                    playlist_type, version, streams, segments, ended)
+
+
+def update(playlist, data, base_uri):
+    """Appends to playlist the new segments of data, a reloaded version of
+    the same (live) media playlist.
+
+    Segments are identified by their media sequence number, so only the
+    lines of segments which playlist doesn't have yet are parsed. Segments
+    which slid out of the reloaded window are kept in playlist. Returns the
+    number of new segments.
+    """
+    lines = data.split('\n')
+
+    if not _validate(lines):
+        raise RuntimeError('Invalid M3U8 file: "{}"'.format(lines[0]))
+
+    if playlist.segments:
+        next_sequence = playlist.segments[-1].sequence + 1
+    else:
+        next_sequence = playlist.media_sequence
+
+    current_key = None
+    sequence = 0
+    num_new_segments = 0
+
+    for count in range(1, len(lines)):
+        line = lines[count]
+        if not _line_is_tag(line):
+            continue
+
+        tagname, attributes = _get_line_tagname_attributes(line)
+
+        if tagname == Tags.EXTINF:
+            if sequence >= next_sequence:
+                if num_new_segments == 0 and sequence > next_sequence:
+                    # We reloaded too late and missed some segments.
+                    tmpl = 'Missed M3U8 segments {} to {}'
+                    _logger.warning(tmpl.format(next_sequence, sequence - 1))
+
+                segment = _parse_segment(attributes, lines[count + 1],
+                                         current_key, sequence, base_uri)
+                playlist.segments.append(segment)
+                num_new_segments += 1
+
+            sequence += 1
+        elif tagname == Tags.EXT_X_MEDIA_SEQUENCE:
+            sequence = int(attributes)
+        elif tagname == Tags.EXT_X_KEY:
+            current_key = _parse_key(attributes, base_uri)
+        elif tagname == Tags.EXT_X_TARGETDURATION:
+            playlist.target_duration = int(attributes)
+        elif tagname == Tags.EXT_X_ENDLIST:
+            playlist.ended = True
+
+    return num_new_segments
@@ -0,0 +1,227 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import lzma
+import pickle
+import zlib
+import toutv.bos
+
+
+# Compact serialization of business objects, used by the caches.
+#
+# Business objects are encoded as tuples holding their class name and only
+# the attributes which differ from the defaults set by their constructor,
+# and transient attributes (auth, proxies, downloaded data) are dropped.
+# The encoded tree only contains builtin types; it's pickled and
+# compressed. The first bytes of the result are a magic number, the
+# format version and the compression method.
+
+_MAGIC = b'TVB'
+_VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+
+_BO_CLASSES = {klass.__name__: klass for klass in [
+    toutv.bos.Emission,
+    toutv.bos.EmissionRepertoire,
+    toutv.bos.Episode,
+    toutv.bos.Genre,
+    toutv.bos.Repertoire,
+    toutv.bos.SearchResultData,
+    toutv.bos.SearchResults,
+]}
+
+_TRANSIENT_ATTRS = {
+    '_auth',
+    '_proxies',
+    '_playlist',
+    '_cookies',
+    '_medium_thumb_data',
+    '_thumb_store',
+    '_hydrator',
+    '_playlist_cache',
+}
+
+# encoded value tags
+_TAG_LIST = 0
+_TAG_TUPLE = 1
+_TAG_DICT = 2
+_TAG_BO = 3
+_TAG_REF = 4
+_TAG_PICKLE = 5
+
+_SCALAR_TYPES = (type(None), bool, int, float, str, bytes)
+
+
+class SerializationError(RuntimeError):
+    pass
+
+
+class _Encoder:
+
+    def __init__(self):
+        self._refs = {}
+        self._defaults = {}
+
+    def _get_defaults(self, klass):
+        if klass not in self._defaults:
+            self._defaults[klass] = vars(klass())
+
+        return self._defaults[klass]
+
+    def _encode_bo(self, bo):
+        # Business objects can refer to each other (episode -> emission
+        # -> episodes), so the ones already encoded are referred to by
+        # index.
+        if id(bo) in self._refs:
+            return (_TAG_REF, self._refs[id(bo)])
+
+        ref = len(self._refs)
+        self._refs[id(bo)] = ref
+        defaults = self._get_defaults(type(bo))
+        fields = []
+
+        for name, value in vars(bo).items():
+            if name in _TRANSIENT_ATTRS:
+                continue
+
+            if name in defaults and defaults[name] == value:
+                continue
+
+            fields.append((name, self.encode(value)))
+
+        return (_TAG_BO, ref, type(bo).__name__, tuple(fields))
+
+    def encode(self, value):
+        if isinstance(value, _SCALAR_TYPES):
+            return value
+
+        if type(value).__name__ in _BO_CLASSES:
+            return self._encode_bo(value)
+
+        if isinstance(value, list):
+            return (_TAG_LIST, tuple(self.encode(v) for v in value))
+
+        if isinstance(value, tuple):
+            return (_TAG_TUPLE, tuple(self.encode(v) for v in value))
+
+        if isinstance(value, dict):
+            items = tuple((self.encode(k), self.encode(v))
+                          for k, v in value.items())
+
+            return (_TAG_DICT, items)
+
+        # anything else (dict views, dates, ...)
+        return (_TAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+class _Decoder:
+
+    def __init__(self):
+        self._refs = {}
+
+    def _decode_bo(self, ref, class_name, fields):
+        if class_name not in _BO_CLASSES:
+            raise SerializationError('Unknown class "{}"'.format(class_name))
+
+        bo = _BO_CLASSES[class_name]()
+        self._refs[ref] = bo
+
+        for name, value in fields:
+            setattr(bo, name, self.decode(value))
+
+        return bo
+
+    def decode(self, value):
+        if not isinstance(value, tuple):
+            return value
+
+        tag = value[0]
+
+        if tag == _TAG_BO:
+            return self._decode_bo(*value[1:])
+        elif tag == _TAG_REF:
+            return self._refs[value[1]]
+        elif tag == _TAG_LIST:
+            return [self.decode(v) for v in value[1]]
+        elif tag == _TAG_TUPLE:
+            return tuple(self.decode(v) for v in value[1])
+        elif tag == _TAG_DICT:
+            return {self.decode(k): self.decode(v) for k, v in value[1]}
+        elif tag == _TAG_PICKLE:
+            return pickle.loads(value[1])
+
+        raise SerializationError('Unknown tag {}'.format(tag))
+
+
+def dumps(value, compression=COMPRESSION_ZLIB):
+    """Serializes value, which may contain business objects."""
+    data = pickle.dumps(_Encoder().encode(value), pickle.HIGHEST_PROTOCOL)
+
+    if compression == COMPRESSION_ZLIB:
+        data = zlib.compress(data)
+    elif compression == COMPRESSION_LZMA:
+        data = lzma.compress(data)
+    elif compression != COMPRESSION_NONE:
+        raise ValueError('Unknown compression {}'.format(compression))
+
+    return _MAGIC + bytes([_VERSION, compression]) + data
+
+
+def loads(data):
+    """Deserializes data returned by dumps()."""
+    header_len = len(_MAGIC) + 2
+
+    if len(data) < header_len or data[:len(_MAGIC)] != _MAGIC:
+        raise SerializationError('Not serialized business objects')
+
+    version = data[len(_MAGIC)]
+    compression = data[len(_MAGIC) + 1]
+    data = data[header_len:]
+
+    if version != _VERSION:
+        raise SerializationError('Unsupported format version {}'.format(version))
+
+    try:
+        if compression == COMPRESSION_ZLIB:
+            data = zlib.decompress(data)
+        elif compression == COMPRESSION_LZMA:
+            data = lzma.decompress(data)
+        elif compression != COMPRESSION_NONE:
+            raise SerializationError('Unknown compression {}'.format(compression))
+    except (zlib.error, lzma.LZMAError) as e:
+        raise SerializationError('Cannot decompress: {}'.format(e)) from e
+
+    try:
+        return _Decoder().decode(pickle.loads(data))
+    except SerializationError:
+        raise
+    except Exception as e:
+        # truncated or otherwise corrupted data
+        raise SerializationError('Cannot decode: {}'.format(e)) from e
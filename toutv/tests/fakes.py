@@ -0,0 +1,40 @@
+import requests
+from toutv import bos
+
+
+class FakeResponse:
+
+    def __init__(self, text=None, json_obj=None, content=b''):
+        self.text = text
+        self.content = content
+        self._json_obj = json_obj
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.cookies.set('session', 'abc')
+
+    def json(self):
+        return self._json_obj
+
+
+class FakeEpisode(bos.Episode):
+
+    """Episode whose requests are answered by respond(url, params) instead
+    of the network."""
+
+    def __init__(self, respond, thumb_urls=None):
+        super().__init__()
+        self.PID = 'pid1'
+        self._respond = respond
+        self._thumb_urls = thumb_urls
+        self.requested_urls = []
+
+    def get_medium_thumb_urls(self):
+        if self._thumb_urls is None:
+            return super().get_medium_thumb_urls()
+
+        return self._thumb_urls
+
+    def _do_request(self, url, timeout=None, params=None, cookies=None,
+                    num_tries=None):
+        self.requested_urls.append(url)
+
+        return self._respond(url, params)
@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import threading
+import time
+import unittest
+from toutv import bos
+from toutv import client
+from toutv import exceptions
+from toutv import transport
+
+# toutv.aio uses the async/await syntax of Python 3.5. The tests don't, so
+# that this module can be imported by Python 3.4.
+has_aio = sys.version_info >= (3, 5)
+
+if has_aio:
+    from toutv import aio
+
+
+class _SlowTransport(transport.Transport):
+
+    def __init__(self, delay):
+        self._delay = delay
+        self._lock = threading.Lock()
+        self.num_running = 0
+        self.max_running = 0
+
+    def set_proxies(self, proxies):
+        pass
+
+    def set_auth(self, auth):
+        pass
+
+    def get_emissions(self):
+        emissions = []
+
+        for emid in range(8):
+            emission = bos.Emission()
+            emission.Id = emid
+            emission.Title = 'Emission {}'.format(emid)
+            emissions.append(emission)
+
+        return emissions
+
+    def get_emission_episodes(self, emission, short_version=False):
+        with self._lock:
+            self.num_running += 1
+            self.max_running = max(self.max_running, self.num_running)
+
+        time.sleep(self._delay)
+
+        with self._lock:
+            self.num_running -= 1
+
+        if emission.Id == 7:
+            raise exceptions.UnexpectedHttpStatusCodeError('http://api', 404)
+
+        episode = bos.Episode()
+        episode.Id = emission.Id * 10
+
+        return [episode]
+
+
+@unittest.skipIf(not has_aio, 'toutv.aio needs Python 3.5+')
+class AioClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self._loop.close()
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
+
+    def test_concurrent(self):
+        t = _SlowTransport(0.1)
+        c = aio.Client(client.Client(transport=t), max_concurrency=8)
+
+        try:
+            emissions = self._run(c.get_emissions())
+            start = time.monotonic()
+            results = self._run(c.get_many_emission_episodes(emissions,
+                                                             return_exceptions=True))
+            duration = time.monotonic() - start
+        finally:
+            c.close()
+
+        self.assertEqual([r[0].Id for r in results[:7]], list(range(0, 70, 10)))
+        self.assertIsInstance(results[7], exceptions.UnexpectedHttpStatusCodeError)
+        self.assertLess(duration, 0.5)
+
+    def test_max_concurrency(self):
+        t = _SlowTransport(0.05)
+        c = aio.Client(client.Client(transport=t), max_concurrency=2)
+
+        try:
+            emissions = self._run(c.get_emissions())
+            self._run(c.get_many_emission_episodes(emissions[:6]))
+        finally:
+            c.close()
+
+        self.assertEqual(t.max_running, 2)
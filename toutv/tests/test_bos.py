@@ -0,0 +1,104 @@
+import base64
+import datetime
+import json
+import unittest
+from toutv import auth
+from toutv import bos
+from toutv import cache
+from toutv.tests import fakes
+
+
+_MASTER_PLAYLIST = '''#EXTM3U
+#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=500000,RESOLUTION=640x360
+index_1_av.m3u8
+'''
+
+
+def _make_episode(playlist_url):
+    def respond(url, params):
+        if params is not None:
+            return fakes.FakeResponse(json_obj={'errorCode': 0,
+                                                'url': playlist_url})
+
+        return fakes.FakeResponse(text=_MASTER_PLAYLIST)
+
+    return fakes.FakeEpisode(respond)
+
+
+class _DictCache(cache.Cache):
+
+    def __init__(self):
+        self.playlists = {}
+
+    def get_playlist(self, key):
+        return self.playlists.get(key, (None, None))[0]
+
+    def set_playlist(self, key, playlist, ttl):
+        self.playlists[key] = (playlist, ttl)
+
+
+def _make_jwt(exp):
+    payload = json.dumps({'exp': exp}).encode()
+    payload = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    return 'header.{}.signature'.format(payload)
+
+
+class PlaylistCacheTest(unittest.TestCase):
+
+    def test_url_expiration(self):
+        url = 'http://cdn/master.m3u8?hdnea=exp=1500000000~acl=/*~hmac=ab'
+        expiration = bos._get_url_expiration(url)
+        self.assertEqual(expiration, datetime.datetime.fromtimestamp(1500000000))
+        self.assertIsNone(bos._get_url_expiration('http://cdn/master.m3u8'))
+
+    def test_token_expiration(self):
+        expiration = bos._get_token_expiration(_make_jwt(1500000000))
+        self.assertEqual(expiration, datetime.datetime.fromtimestamp(1500000000))
+        self.assertIsNone(bos._get_token_expiration('opaque-token'))
+
+    def test_cached(self):
+        exp = int(datetime.datetime.now().timestamp()) + 3600
+        url = 'http://cdn/master.m3u8?hdnea=exp={}~hmac=ab'.format(exp)
+        playlist_cache = _DictCache()
+
+        episode = _make_episode(url)
+        episode.set_playlist_cache(playlist_cache)
+        episode.get_playlist_cookies()
+        self.assertEqual(len(episode.requested_urls), 2)
+
+        playlist, ttl = playlist_cache.playlists['pid1/anonymous']
+        self.assertGreater(ttl, datetime.timedelta(minutes=55))
+        self.assertLess(ttl, datetime.timedelta(minutes=60))
+
+        # a new episode object doesn't validate the playlist again
+        episode = _make_episode(url)
+        episode.set_playlist_cache(playlist_cache)
+        playlist, cookies = episode.get_playlist_cookies()
+        self.assertEqual(episode.requested_urls, [])
+        self.assertEqual(len(playlist.streams), 1)
+        self.assertEqual(cookies['session'], 'abc')
+
+    def test_auth_identity(self):
+        exp = int(datetime.datetime.now().timestamp()) + 120
+        playlist_cache = _DictCache()
+
+        episode = _make_episode('http://cdn/master.m3u8')
+        episode.set_playlist_cache(playlist_cache)
+        episode.set_auth(auth.Auth(_make_jwt(exp)))
+        episode.get_playlist_cookies()
+
+        self.assertNotIn('pid1/anonymous', playlist_cache.playlists)
+        (key, (playlist, ttl)), = playlist_cache.playlists.items()
+        self.assertTrue(key.startswith('pid1/'))
+
+        # expires with the token
+        self.assertLessEqual(ttl, datetime.timedelta(minutes=1))
+
+    def test_expired_not_cached(self):
+        url = 'http://cdn/master.m3u8?hdnea=exp=1500000000~hmac=ab'
+        playlist_cache = _DictCache()
+        episode = _make_episode(url)
+        episode.set_playlist_cache(playlist_cache)
+        episode.get_playlist_cookies()
+        self.assertEqual(playlist_cache.playlists, {})
@@ -0,0 +1,284 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from datetime import timedelta
+from toutv import bos
+from toutv import cache
+from toutv import serialization
+
+
+def _make_emission(emid):
+    emission = bos.Emission()
+    emission.Id = emid
+    emission.Title = 'Emission {}'.format(emid)
+
+    return emission
+
+
+def _make_episode(epid):
+    episode = bos.Episode()
+    episode.Id = epid
+    episode.Title = 'Episode {}'.format(epid)
+
+    return episode
+
+
+def _write_emission_episodes(db_filename, emid):
+    c = cache.SqliteCache(db_filename)
+    c.set_emission_episodes(_make_emission(emid), [_make_episode(emid)])
+
+
+class _CacheTest:
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._filename = os.path.join(self._dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_emissions(self):
+        c = self._make_cache()
+        self.assertIsNone(c.get_emissions())
+        c.set_emissions([_make_emission(1), _make_emission(2)])
+        del c
+
+        # another instance sees the same entries
+        c = self._make_cache()
+        emissions = c.get_emissions()
+        self.assertEqual([e.Title for e in emissions], ['Emission 1', 'Emission 2'])
+
+    def test_emission_episodes(self):
+        c = self._make_cache()
+        emission1 = _make_emission(1)
+        emission2 = _make_emission(2)
+        c.set_emission_episodes(emission1, [_make_episode(10)])
+        self.assertIsNone(c.get_emission_episodes(emission2))
+        c.set_emission_episodes(emission2, [_make_episode(20)])
+        self.assertEqual(c.get_emission_episodes(emission1)[0].Id, 10)
+        self.assertEqual(c.get_emission_episodes(emission2)[0].Id, 20)
+
+    def test_emission_details(self):
+        c = self._make_cache()
+        details = {'Description': 'Description 1', 'Country': 'Canada'}
+        c.set_many_emission_details([(_make_emission(1), details)])
+        self.assertEqual(c.get_emission_details(_make_emission(1)), details)
+        self.assertIsNone(c.get_emission_details(_make_emission(2)))
+
+    def test_invalidate(self):
+        c = self._make_cache()
+        emission = _make_emission(1)
+        c.set_emissions([emission])
+        c.set_emission_episodes(emission, [_make_episode(10)])
+        c.invalidate()
+        self.assertIsNone(c.get_emissions())
+        self.assertIsNone(c.get_emission_episodes(emission))
+
+    def test_stats(self):
+        c = self._make_cache()
+        emission = _make_emission(1)
+        c.get_emissions()
+        c.set_emissions([emission])
+        c.get_emissions()
+        c.set_emission_episodes(emission, [_make_episode(10)])
+        c._set('emission_episodes/2', [], timedelta(seconds=-1))
+        c.get_stale_emission_episodes(_make_emission(2), timedelta(hours=1))
+
+        stats = c.get_stats()
+        self.assertEqual(stats['emissions']['hits'], 1)
+        self.assertEqual(stats['emissions']['misses'], 1)
+        self.assertEqual(stats['emissions']['sets'], 1)
+        self.assertEqual(stats['emissions']['entries'], 1)
+        self.assertGreater(stats['emissions']['bytes'], 0)
+        self.assertEqual(stats['emission_episodes']['entries'], 2)
+        self.assertEqual(stats['emission_episodes']['expired_entries'], 1)
+        self.assertEqual(stats['emission_episodes']['stale_hits'], 1)
+
+        # saved counters are seen by other instances, and not counted twice
+        c.save_stats()
+        c.save_stats()
+        del c
+        c = self._make_cache()
+        c.get_emissions()
+        self.assertEqual(c.get_stats()['emissions']['hits'], 2)
+
+        # saved counters are added to the previously saved ones
+        c.save_stats()
+        del c
+        c = self._make_cache()
+        self.assertEqual(c.get_stats()['emissions']['hits'], 2)
+
+    def test_unreadable_entry(self):
+        c = self._make_cache()
+        c.set_emissions([_make_emission(1)])
+        with mock.patch('toutv.serialization.loads',
+                        side_effect=serialization.SerializationError):
+            self.assertIsNone(c.get_emissions())
+
+        # the entry was removed
+        self.assertIsNone(c.get_emissions())
+        self.assertEqual(c.get_stats()['emissions']['misses'], 2)
+
+    def test_playlist(self):
+        c = self._make_cache()
+        entry = {'url': 'http://cdn/master.m3u8', 'cookies': {'a': 'b'}}
+        c.set_playlist('pid/anonymous', entry, timedelta(minutes=5))
+        c.set_playlist('pid/user', entry, timedelta(seconds=-1))
+        self.assertEqual(c.get_playlist('pid/anonymous'), entry)
+        self.assertIsNone(c.get_playlist('pid/user'))
+
+    def test_missing_emission(self):
+        c = self._make_cache()
+        self.assertFalse(c.is_emission_missing(_make_emission(1)))
+        c.set_emission_missing(_make_emission(1))
+        self.assertTrue(c.is_emission_missing(_make_emission(1)))
+        self.assertFalse(c.is_emission_missing(_make_emission(2)))
+
+    def test_purge(self):
+        c = self._make_cache()
+        c.set_emissions([_make_emission(1)])
+        c.set_emission_episodes(_make_emission(1), [_make_episode(10)])
+        c._set('emission_episodes/2', [], timedelta(seconds=-1))
+
+        self.assertEqual(c.purge(['emission_episodes'], expired_only=True), 1)
+        self.assertEqual(c.purge(['emission_episodes']), 1)
+        self.assertIsNotNone(c.get_emissions())
+        self.assertEqual(c.purge(), 1)
+        self.assertIsNone(c.get_emissions())
+
+
+class ShelveCacheTest(_CacheTest, unittest.TestCase):
+
+    def _make_cache(self):
+        return cache.ShelveCache(self._filename)
+
+    def test_expiration(self):
+        c = self._make_cache()
+        c._set('emissions', [_make_emission(1)], timedelta(seconds=-1))
+        self.assertIsNone(c.get_emissions())
+
+    def test_many_emission_episodes(self):
+        c = self._make_cache()
+        emissions_episodes = [(_make_emission(emid), [_make_episode(emid * 10)])
+                              for emid in range(3)]
+
+        with mock.patch.object(c.shelve, 'sync', wraps=c.shelve.sync) as sync:
+            c.set_many_emission_episodes(emissions_episodes)
+
+        self.assertEqual(sync.call_count, 1)
+        self.assertEqual(c.get_emission_episodes(_make_emission(2))[0].Id, 20)
+
+
+class SqliteCacheTest(_CacheTest, unittest.TestCase):
+
+    def _make_cache(self, ttls=None):
+        return cache.SqliteCache(self._filename, ttls=ttls)
+
+    def test_expiration(self):
+        c = self._make_cache({'emissions': timedelta(seconds=-1)})
+        c.set_emissions([_make_emission(1)])
+        self.assertIsNone(c.get_emissions())
+
+    def test_concurrent_processes(self):
+        self._make_cache()
+        processes = [multiprocessing.Process(target=_write_emission_episodes,
+                                             args=(self._filename, emid))
+                     for emid in range(8)]
+
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        c = self._make_cache()
+
+        for emid in range(8):
+            episodes = c.get_emission_episodes(_make_emission(emid))
+            self.assertEqual(episodes[0].Id, emid)
+
+
+class CountingCache(cache.Cache):
+
+    def __init__(self):
+        self.emissions = None
+        self.episodes = {}
+        self.num_gets = 0
+
+    def get_emissions(self):
+        self.num_gets += 1
+        return self.emissions
+
+    def set_emissions(self, emissions):
+        self.emissions = emissions
+
+    def get_emission_episodes(self, emission):
+        self.num_gets += 1
+        return self.episodes.get(emission.Id)
+
+    def set_emission_episodes(self, emission, episodes):
+        self.episodes[emission.Id] = episodes
+
+
+class LruCacheTest(unittest.TestCase):
+
+    def test_hits(self):
+        backing = CountingCache()
+        c = cache.LruCache(backing)
+        self.assertIsNone(c.get_emissions())
+        c.set_emissions([_make_emission(1)])
+
+        for i in range(3):
+            self.assertEqual(c.get_emissions()[0].Id, 1)
+
+        self.assertEqual(backing.num_gets, 1)
+        stats = c.get_memory_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_read_through(self):
+        backing = CountingCache()
+        backing.set_emissions([_make_emission(1)])
+        c = cache.LruCache(backing)
+        c.get_emissions()
+        c.get_emissions()
+        self.assertEqual(backing.num_gets, 1)
+
+    def test_max_entries(self):
+        backing = CountingCache()
+        c = cache.LruCache(backing, max_entries=2)
+
+        for emid in range(3):
+            c.set_emission_episodes(_make_emission(emid), [_make_episode(emid)])
+
+        stats = c.get_memory_stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+        # the first one was evicted, but is still in the backing cache
+        c.get_emission_episodes(_make_emission(0))
+        self.assertEqual(backing.num_gets, 1)
+        c.get_emission_episodes(_make_emission(2))
+        self.assertEqual(backing.num_gets, 1)
+
+    def test_max_bytes(self):
+        backing = CountingCache()
+        c = cache.LruCache(backing, max_bytes=300)
+
+        for emid in range(10):
+            c.set_emission_episodes(_make_emission(emid), [_make_episode(emid)])
+
+        stats = c.get_memory_stats()
+        self.assertLessEqual(stats['bytes'], 300)
+        self.assertLess(stats['entries'], 10)
+
+    def test_ttl(self):
+        backing = CountingCache()
+        c = cache.LruCache(backing, ttl=timedelta(seconds=-1))
+        c.set_emissions([_make_emission(1)])
+        c.get_emissions()
+        self.assertEqual(backing.num_gets, 1)
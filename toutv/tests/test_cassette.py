@@ -0,0 +1,152 @@
+import http.server
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from toutv import cassette
+from toutv import client as toutv_client
+from toutv import exceptions
+from toutv import http as toutv_http
+from toutv import transport
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+
+        if self.path.startswith('/json'):
+            body = json.dumps({'path': self.path}).encode()
+            content_type = 'application/json; charset=utf-8'
+        elif self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        else:
+            body = b'segment'
+            content_type = 'video/MP2T'
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.send_header('Set-Cookie', 'session=abc')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CassetteTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.paths = []
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,),
+                                        daemon=True)
+        self._thread.start()
+        self._url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._dir.cleanup()
+
+    def _record(self):
+        client = cassette.RecordingHttpClient(self._dir.name)
+        r = client.get(self._url + '/json', params={'b': '2', 'a': '1'},
+                       headers={'If-None-Match': '"v0"'})
+        self.assertEqual(r.json(), {'path': '/json?b=2&a=1'})
+        r = client.get(self._url + '/seg1.ts', stream=True)
+        self.assertEqual(b''.join(r.iter_content(3)), b'segment')
+        client.get(self._url + '/seg2.ts')
+
+        with self.assertRaises(exceptions.UnexpectedHttpStatusCodeError):
+            client.get(self._url + '/missing')
+
+        client.close()
+
+    def test_record(self):
+        self._record()
+        bodies = os.listdir(os.path.join(self._dir.name, 'bodies'))
+
+        # JSON, segment (both segments have the same content) and empty
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(len(cassette.Cassette(self._dir.name)), 4)
+
+    def test_replay(self):
+        self._record()
+        self._server.paths = []
+        client = cassette.ReplayHttpClient(self._dir.name)
+        r = client.get(self._url + '/json', params={'a': '1', 'b': '2'})
+        self.assertEqual(r.json(), {'path': '/json?b=2&a=1'})
+        self.assertEqual(r.headers['etag'], '"v1"')
+        self.assertEqual(r.cookies['session'], 'abc')
+        r = client.get(self._url + '/seg2.ts', stream=True)
+        self.assertEqual(b''.join(r.iter_content(3)), b'segment')
+
+        with self.assertRaises(exceptions.UnexpectedHttpStatusCodeError):
+            client.get(self._url + '/missing')
+
+        with self.assertRaises(cassette.MissingExchangeError):
+            client.get(self._url + '/seg3.ts')
+
+        self.assertEqual(self._server.paths, [])
+
+    def test_replay_transport(self):
+        self._record()
+        self._server.paths = []
+        previous = toutv_http.set_default_client(
+            cassette.ReplayHttpClient(self._dir.name))
+
+        try:
+            t = transport.JsonTransport()
+            result = t._do_query_url(self._url + '/json', {'b': '2', 'a': '1'})
+        finally:
+            toutv_http.set_default_client(previous)
+
+        self.assertEqual(result.json(), {'path': '/json?b=2&a=1'})
+        self.assertEqual(self._server.paths, [])
+
+    def test_replay_client(self):
+        dtos = [
+            {'Key': 'program-1', 'Id': 1, 'DisplayText': 'Infoman',
+             'Url': '/infoman'},
+            {'Key': 'genre-2', 'Id': 2, 'DisplayText': 'Humour',
+             'Url': '/humour'},
+        ]
+        key = cassette.Cassette.get_request_key('GET',
+                                                transport.JsonTransport._emissions_url,
+                                                transport.JsonTransport._emissions_params)
+        cassette.Cassette(self._dir.name).put(key, 200, {}, {},
+                                              json.dumps(dtos).encode())
+
+        # the default client is replaced after the module was imported
+        previous = toutv_http.set_default_client(
+            cassette.ReplayHttpClient(self._dir.name))
+
+        try:
+            emissions = toutv_client.Client().get_emissions()
+        finally:
+            toutv_http.set_default_client(previous)
+
+        self.assertEqual([e.Title for e in emissions], ['Infoman'])
+
+    def test_simulated_network(self):
+        self._record()
+        client = cassette.ReplayHttpClient(self._dir.name, latency=0.05,
+                                           bandwidth=70)
+        start = time.monotonic()
+        client.get(self._url + '/seg1.ts')
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+        with self.assertRaises(exceptions.RequestTimeoutError):
+            client.get(self._url + '/seg1.ts', timeout=0.1)
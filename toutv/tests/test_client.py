@@ -0,0 +1,620 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
+from toutv import auth
+from toutv import bos
+from toutv import cache
+from toutv import client
+from toutv import exceptions
+from toutv import transport
+
+
+class FakeTransport(transport.Transport):
+
+    def __init__(self):
+        self.num_get_emissions = 0
+        self.num_get_emission_episodes = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def set_proxies(self, proxies):
+        pass
+
+    def set_auth(self, auth):
+        pass
+
+    def get_emissions(self):
+        self.release.wait()
+        self.num_get_emissions += 1
+        emission = bos.Emission()
+        emission.Id = self.num_get_emissions
+        emission.Title = 'Emission'
+
+        return [emission]
+
+    def get_emission_episodes(self, emission, short_version=False):
+        self.num_get_emission_episodes += 1
+        episode = bos.Episode()
+        episode.Id = self.num_get_emission_episodes
+
+        return [episode]
+
+
+class StaleWhileRevalidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        ttls = {
+            'emissions': timedelta(seconds=-1),
+            'emission_episodes': timedelta(seconds=-1),
+        }
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'), ttls=ttls)
+        self._transport = FakeTransport()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_no_max_stale(self):
+        c = client.Client(transport=self._transport, cache=self._cache)
+        c.get_emissions()
+        c.get_emissions()
+        self.assertEqual(self._transport.num_get_emissions, 2)
+
+    def test_iter_emissions(self):
+        c = client.Client(transport=self._transport, cache=self._cache,
+                          max_stale=timedelta(days=1))
+        self.assertEqual([e.Id for e in c.iter_emissions()], [1])
+        self.assertEqual(self._transport.num_get_emissions, 1)
+
+        # cached once generated
+        self.assertEqual([e.Id for e in c.iter_emissions()], [1])
+        c.wait_revalidations()
+        self.assertEqual(self._transport.num_get_emissions, 2)
+
+    def test_stale_emissions(self):
+        c = client.Client(transport=self._transport, cache=self._cache,
+                          max_stale=timedelta(hours=1))
+
+        # nothing cached: must wait
+        self.assertEqual(c.get_emissions()[0].Id, 1)
+
+        # expired: the stale value is returned while refreshing
+        self._transport.release.clear()
+        self.assertEqual(c.get_emissions()[0].Id, 1)
+        self.assertEqual(c.get_emissions()[0].Id, 1)
+        self._transport.release.set()
+        c.wait_revalidations()
+        self.assertEqual(self._transport.num_get_emissions, 2)
+        self.assertEqual(c.get_emissions()[0].Id, 2)
+        c.wait_revalidations()
+
+    def test_too_stale(self):
+        c = client.Client(transport=self._transport, cache=self._cache,
+                          max_stale=timedelta())
+        c.get_emissions()
+        c.get_emissions()
+        self.assertEqual(self._transport.num_get_emissions, 2)
+
+    def test_stale_emission_episodes(self):
+        c = client.Client(transport=self._transport, cache=self._cache,
+                          max_stale=timedelta(hours=1))
+        emission = bos.Emission()
+        emission.Id = 1
+        self.assertEqual(c.get_emission_episodes(emission, True)[0].Id, 1)
+        self.assertEqual(c.get_emission_episodes(emission, True)[0].Id, 1)
+        c.wait_revalidations()
+        self.assertEqual(c.get_emission_episodes(emission, True)[0].Id, 2)
+        c.wait_revalidations()
+
+
+class _GrowingTransport(FakeTransport):
+
+    # Each fetch has one more emission, and one more episode
+
+    def get_emissions(self):
+        self.num_get_emissions += 1
+        emissions = []
+
+        for emid in range(1, self.num_get_emissions + 1):
+            emission = bos.Emission()
+            emission.Id = emid
+            emission.Title = 'Emission {}'.format(emid)
+            emission.Url = '/emission-{}'.format(emid)
+            emissions.append(emission)
+
+        return emissions
+
+    def get_emission_episodes(self, emission, short_version=False):
+        self.num_get_emission_episodes += 1
+        episodes = []
+
+        for epid in range(1, self.num_get_emission_episodes + 1):
+            episode = bos.Episode()
+            episode.Id = epid
+            episode.Title = 'Episode {}'.format(epid)
+            episodes.append(episode)
+
+        return episodes
+
+
+class StaleMissTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        ttls = {
+            'emissions': timedelta(seconds=-1),
+            'emission_episodes': timedelta(seconds=-1),
+        }
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'), ttls=ttls)
+        self._transport = _GrowingTransport()
+        self._client = client.Client(transport=self._transport, cache=self._cache,
+                                     max_stale=timedelta(hours=1))
+
+    def tearDown(self):
+        self._client.wait_revalidations()
+        shutil.rmtree(self._dir)
+
+    def test_new_emission(self):
+        self.assertEqual(self._client.get_emission_by_whatever('1').Id, 1)
+
+        # not in the stale emissions
+        self.assertEqual(self._client.get_emission_by_whatever('2').Id, 2)
+
+        with self.assertRaises(client.NoMatchException):
+            self._client.get_emission_by_whatever('10')
+
+    def test_new_episode(self):
+        emission = self._client.get_emissions()[0]
+        episode = self._client.get_episode_by_name(emission, 'Episode 1', True)
+        self.assertEqual(episode.Id, 1)
+        episode = self._client.get_episode_by_name(emission, 'Episode 2', True)
+        self.assertEqual(episode.Id, 2)
+
+
+class _SearchTransport(FakeTransport):
+
+    def search(self, query):
+        results = bos.SearchResults()
+        results.ModifiedQuery = query
+        results.Results = []
+
+        return results
+
+    def get_emission_episodes(self, emission, short_version=False):
+        self.num_get_emission_episodes += 1
+        url = 'http://api/emission/{}'.format(emission.Id)
+
+        raise exceptions.UnexpectedHttpStatusCodeError(url, 404)
+
+
+class MissingEmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'))
+        self._transport = _SearchTransport()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_search_skips_missing(self):
+        c = client.Client(transport=self._transport, cache=self._cache)
+        self.assertEqual(c.search('emission').Results, [])
+        self.assertEqual(c.search('emission').Results, [])
+        self.assertEqual(self._transport.num_get_emission_episodes, 1)
+        self.assertTrue(self._cache.is_emission_missing(c.get_emissions()[0]))
+
+    def test_missing_expires(self):
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'),
+                                        ttls={'missing_emissions': timedelta(seconds=-1)})
+        c = client.Client(transport=self._transport, cache=self._cache)
+        c.search('emission')
+        c.search('emission')
+        self.assertEqual(self._transport.num_get_emission_episodes, 2)
+
+
+class _BulkTransport(FakeTransport):
+
+    def __init__(self):
+        super().__init__()
+        self.fetched_ids = []
+
+    def get_emission_episodes(self, emission, short_version=False):
+        self.fetched_ids.append(emission.Id)
+
+        if emission.Id == 3:
+            raise exceptions.UnexpectedHttpStatusCodeError('http://api', 500)
+
+        episode = bos.Episode()
+        episode.Id = emission.Id * 10
+
+        return [episode]
+
+
+class ManyEmissionEpisodesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'))
+        self._transport = _BulkTransport()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _make_emissions(self):
+        emissions = []
+
+        for emid in range(5):
+            emission = bos.Emission()
+            emission.Id = emid
+            emissions.append(emission)
+
+        return emissions
+
+    def test_many(self):
+        emissions = self._make_emissions()
+        cached_episode = bos.Episode()
+        cached_episode.Id = 1234
+        self._cache.set_emission_episodes(emissions[0], [cached_episode])
+
+        c = client.Client(transport=self._transport, cache=self._cache)
+
+        with mock.patch.object(self._cache, '_set_many',
+                               wraps=self._cache._set_many) as set_many:
+            results = list(c.get_many_emission_episodes(emissions, max_workers=2))
+
+        self.assertEqual(set_many.call_count, 1)
+
+        # the cached episodes come first
+        self.assertEqual(results[0][1][0].Id, 1234)
+        self.assertEqual(sorted(self._transport.fetched_ids), [1, 2, 3, 4])
+
+        by_id = {emission.Id: (episodes, error) for emission, episodes, error in results}
+        self.assertEqual(by_id[2][0][0].Id, 20)
+        self.assertIsNone(by_id[3][0])
+        self.assertEqual(by_id[3][1].status_code, 500)
+
+        for emid in [1, 2, 4]:
+            episodes = self._cache.get_emission_episodes(emissions[emid])
+            self.assertEqual(episodes[0].Id, emid * 10)
+
+        self.assertIsNone(self._cache.get_emission_episodes(emissions[3]))
+
+    def test_close_early(self):
+        emissions = self._make_emissions()[1:]
+        get_emission_episodes = self._transport.get_emission_episodes
+        self._transport.release.clear()
+
+        def slow_get_emission_episodes(emission, short_version=False):
+            if emission.Id > 1:
+                self._transport.release.wait()
+
+            return get_emission_episodes(emission, short_version)
+
+        self._transport.get_emission_episodes = slow_get_emission_episodes
+        c = client.Client(transport=self._transport, cache=self._cache)
+        results = c.get_many_emission_episodes(emissions, max_workers=1)
+        self.assertEqual(next(results)[0].Id, 1)
+        results.close()
+        self._transport.release.set()
+        time.sleep(0.1)
+
+        # the queued fetches were cancelled
+        self.assertEqual(self._transport.fetched_ids, [1, 2])
+
+
+class _IterSearchTransport(_BulkTransport):
+
+    def search(self, query):
+        sr = bos.SearchResultData()
+        sr.Emission = bos.Emission()
+        sr.Emission.Id = 100
+        results = bos.SearchResults()
+        results.ModifiedQuery = query
+        results.Results = [sr]
+
+        return results
+
+    def get_emissions(self):
+        emissions = []
+
+        for emid, title in enumerate(['Infoman', 'Info Matin', 'Infoman 2']):
+            emission = bos.Emission()
+            emission.Id = emid
+            emission.Title = title
+            emissions.append(emission)
+
+        return emissions
+
+    def get_emission_episodes(self, emission, short_version=False):
+        # the first local match is the slowest one
+        if emission.Id == 0:
+            self.release.wait()
+
+        return super().get_emission_episodes(emission, short_version)
+
+
+class IterSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self._transport = _IterSearchTransport()
+        self._client = client.Client(transport=self._transport)
+
+    def test_iter_search(self):
+        self._transport.release.clear()
+        it = self._client.iter_search('infoman')
+        first = next(it)
+        self.assertEqual(first.ModifiedQuery, 'infoman')
+        self.assertEqual(first.Results[0].Emission.Id, 100)
+
+        # local matches come as soon as they're fetched
+        second = next(it)
+        self.assertEqual(second.Results[0].Emission.Id, 2)
+        self.assertEqual(second.Results[1].Episode.Id, 20)
+        self._transport.release.set()
+        third = next(it)
+        self.assertEqual(third.Results[0].Emission.Id, 0)
+        self.assertEqual(list(it), [])
+
+    def test_search_order(self):
+        search = self._client.search('infoman')
+        ids = [(sr.Emission or sr.Episode).Id for sr in search.Results]
+        self.assertEqual(ids, [100, 0, 0, 2, 20])
+
+
+class _SlowTransport(FakeTransport):
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def get_emission_episodes(self, emission, short_version=False):
+        with self._lock:
+            self.num_get_emission_episodes += 1
+
+        time.sleep(0.05)
+        episodes = []
+
+        for epid in range(20):
+            episode = bos.Episode()
+            episode.Id = emission.Id * 100 + epid
+            episode.Title = 'Episode {}'.format(epid)
+            episode.set_emission(emission)
+            episodes.append(episode)
+
+        return episodes
+
+
+class ConcurrencyTest(unittest.TestCase):
+
+    num_threads = 16
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _stress(self, the_cache):
+        the_transport = _SlowTransport()
+        c = client.Client(transport=the_transport, cache=the_cache,
+                          auth=object(), proxies={'http': 'proxy'})
+        emissions = []
+
+        for emid in range(4):
+            emission = bos.Emission()
+            emission.Id = emid
+            emissions.append(emission)
+
+        barrier = threading.Barrier(self.num_threads)
+        results = []
+        errors = []
+
+        def run(i):
+            barrier.wait()
+
+            try:
+                for j in range(3):
+                    emission = emissions[(i + j) % len(emissions)]
+                    episodes = c.get_emission_episodes(emission, True)
+                    results.append((emission.Id, episodes))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(self.num_threads)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.num_threads * 3)
+
+        # a single fetch per emission
+        self.assertEqual(the_transport.num_get_emission_episodes, len(emissions))
+
+        by_emission = {}
+
+        for emid, episodes in results:
+            summary = [(e.Id, e.Title, e.get_proxies()) for e in episodes]
+            by_emission.setdefault(emid, []).append(summary)
+
+        for summaries in by_emission.values():
+            self.assertEqual(len(set(map(repr, summaries))), 1)
+
+        # each call has its own copies
+        all_episodes = [e for emid, episodes in results for e in episodes]
+        self.assertEqual(len(set(map(id, all_episodes))), len(all_episodes))
+
+    def test_sqlite_cache(self):
+        self._stress(cache.SqliteCache(os.path.join(self._dir, 'cache')))
+
+    def test_shelve_cache(self):
+        self._stress(cache.ShelveCache(os.path.join(self._dir, 'cache')))
+
+    def test_lru_cache(self):
+        backing = cache.SqliteCache(os.path.join(self._dir, 'cache'))
+        self._stress(cache.LruCache(backing))
+
+    def test_auth_claims(self):
+        the_auth = auth.Auth('token')
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'claims': 'claims'}
+
+        def slow_get(*args, **kwargs):
+            time.sleep(0.05)
+
+            return response
+
+        barrier = threading.Barrier(self.num_threads)
+        claims = []
+
+        def run():
+            barrier.wait()
+            claims.append(the_auth.get_claims('token'))
+
+        with mock.patch('toutv.http.HttpClient.get', side_effect=slow_get) as get:
+            threads = [threading.Thread(target=run) for i in range(self.num_threads)]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(claims, ['claims'] * self.num_threads)
+
+
+class _HydrationTransport(FakeTransport):
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.details_ids = []
+        self.episodes_ids = []
+
+    def get_emissions(self):
+        emissions = []
+
+        for emid in range(3):
+            emission = bos.Emission()
+            emission.Id = emid
+            emission.Title = 'Emission {}'.format(emid)
+            emissions.append(emission)
+
+        return emissions
+
+    def get_emission_details(self, emission):
+        with self._lock:
+            self.details_ids.append(emission.Id)
+
+        return {
+            'Description': 'Description {}'.format(emission.Id),
+            'Country': 'Canada',
+        }
+
+    def get_emission_episodes(self, emission, short_version=False):
+        with self._lock:
+            self.episodes_ids.append(emission.Id)
+
+        episodes = []
+
+        for epid in range(3):
+            episode = bos.Episode()
+            episode.Id = str(emission.Id * 10 + epid)
+            episode.PID = 'pid-{}'.format(episode.Id)
+            episode.set_emission(emission)
+            episodes.append(episode)
+
+        return episodes
+
+
+class HydrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'))
+        self._transport = _HydrationTransport()
+        self._client = client.Client(transport=self._transport, cache=self._cache)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_lazy_emission(self):
+        emission = self._client.get_emissions()[1]
+        self.assertEqual(emission.get_missing_fields(), ['Description', 'Country'])
+        self.assertEqual(emission.get_country(), 'Canada')
+        self.assertEqual(emission.get_description(), 'Description 1')
+        self.assertEqual(emission.get_missing_fields(), [])
+        self.assertEqual(self._transport.details_ids, [1])
+
+        # cached apart from the catalog, which is left as is
+        self.assertIsNone(self._cache.get_emissions()[1].Description)
+        emissions = self._client.get_emissions()
+        self.assertEqual(emissions[1].get_description(), 'Description 1')
+        self.assertEqual(emissions[0].get_missing_fields(), ['Description', 'Country'])
+        self.assertEqual(self._transport.details_ids, [1])
+
+    def test_failed_details(self):
+        self._transport.get_emission_details = mock.Mock(side_effect=RuntimeError)
+        emission = self._client.get_emissions()[1]
+        self.assertIsNone(emission.get_description())
+        self.assertIsNone(emission.get_country())
+        self.assertEqual(self._transport.get_emission_details.call_count, 1)
+
+    def test_not_lazy(self):
+        c = client.Client(transport=self._transport, cache=self._cache,
+                          lazy=False)
+        emission = c.get_emissions()[1]
+        self.assertIsNone(emission.get_description())
+        self.assertEqual(self._transport.details_ids, [])
+
+        c.hydrate([emission])
+        self.assertEqual(emission.get_description(), 'Description 1')
+        self.assertEqual(self._transport.details_ids, [1])
+
+    def test_batched_episodes(self):
+        # like episodes of search results
+        episodes = []
+
+        for emid, epid in [(0, 1), (2, 0), (2, 2)]:
+            episode = bos.Episode()
+            episode.Id = emid * 10 + epid
+            episode.CategoryId = emid
+            episode.set_hydrator(self._client)
+            episodes.append(episode)
+
+        self.assertEqual(episodes[0].get_missing_fields(), ['PID'])
+        self._client.hydrate(episodes + self._client.get_emissions()[:1])
+        self.assertEqual([e.PID for e in episodes], ['pid-1', 'pid-20', 'pid-22'])
+        self.assertEqual(sorted(self._transport.episodes_ids), [0, 2])
+        self.assertEqual(self._transport.details_ids, [0])
+
+        # nothing left to fetch
+        self._client.hydrate(episodes)
+        self.assertEqual(episodes[0].get_pid(), 'pid-1')
+        self.assertEqual(len(self._transport.episodes_ids), 2)
+
+    def test_short_episodes_slot(self):
+        emission = self._client.get_emissions()[2]
+        short = self._client.get_emission_episodes(emission, True)
+        episode = bos.Episode()
+        episode.Id = 21
+        episode.CategoryId = 2
+        self._client.hydrate([episode])
+        self.assertEqual(episode.PID, 'pid-21')
+
+        # the full episodes don't go where the short ones are cached
+        cached = self._cache.get_emission_episodes(emission)
+        self.assertEqual([e.Id for e in cached], [e.Id for e in short])
+        self.assertTrue(all(not e.is_hydrated() for e in cached))
+        self.assertEqual(len(self._transport.episodes_ids), 2)
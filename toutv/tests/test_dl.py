@@ -1,5 +1,10 @@
+import threading
+import time
 import unittest
+from unittest import mock
+from Crypto.Cipher import AES
 from toutv import dl
+from toutv import m3u8
 
 
 class DummySegmentProvider(dl.SegmentProvider):
@@ -29,6 +34,29 @@ class DummySegmentProvider(dl.SegmentProvider):
         pass
 
 
+class DummyLiveSegmentProvider(DummySegmentProvider):
+
+    def __init__(self):
+        super().__init__()
+        self._num_available = 1
+        self.num_waits = 0
+
+    def num_segments(self):
+        return self._num_available
+
+    def wait_for_segment(self, segindex):
+        self.num_waits += 1
+
+        # A new segment appears each time the downloader waits.
+        if segindex >= self._num_available:
+            if self._num_available == len(self._segments):
+                return False
+
+            self._num_available += 1
+
+        return True
+
+
 class DummySegmentHandler(dl.SegmentHandler):
 
     def __init__(self):
@@ -61,6 +89,14 @@ class DlTest(unittest.TestCase):
         downloader.download()
         assert seg_provider._segments == seg_handler._segments
 
+    def test_live_download(self):
+        seg_provider = DummyLiveSegmentProvider()
+        seg_handler = DummySegmentHandler()
+        downloader = dl.Downloader(seg_provider, seg_handler)
+        downloader.download()
+        assert seg_provider._segments == seg_handler._segments
+        assert seg_provider.num_waits == 5
+
     def test_on_progress_update(self):
 
         seg_provider = DummySegmentProvider()
@@ -96,3 +132,204 @@ class DlTest(unittest.TestCase):
 
         downloader = dl.Downloader(seg_provider, seg_handler, on_progress_update=p.progress)
         downloader.download()
+
+
+class KeyCacheTest(unittest.TestCase):
+
+    def test_fetch_once(self):
+        fetched = []
+
+        def fetch_key(uri):
+            fetched.append(uri)
+
+            # Give the other threads a chance to ask for the same key.
+            time.sleep(.05)
+
+            return uri.encode()
+
+        cache = dl.KeyCache(fetch_key)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('k1')))
+                   for i in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetched, ['k1'])
+        self.assertEqual(results, [b'k1'] * 8)
+
+    def test_eviction(self):
+        fetched = []
+
+        def fetch_key(uri):
+            fetched.append(uri)
+            return uri.encode()
+
+        cache = dl.KeyCache(fetch_key, max_keys=2)
+        cache.get('k1')
+        cache.get('k2')
+        cache.get('k1')
+        cache.get('k3')
+        self.assertEqual(len(cache), 2)
+
+        # k2 was the least recently used one
+        cache.get('k1')
+        cache.get('k2')
+        self.assertEqual(fetched, ['k1', 'k2', 'k3', 'k2'])
+
+
+class DecryptTest(unittest.TestCase):
+
+    def _segment(self, method, iv=None):
+        segment = m3u8.Segment()
+        segment.key = m3u8.Key()
+        segment.key.method = method
+        segment.key.uri = 'http://example.com/key'
+        segment.key.iv = iv
+        segment.sequence = 7
+
+        return segment
+
+    def setUp(self):
+        self._key = bytes(range(16))
+        self._provider = dl.ToutvApiSegmentProvider(None, None)
+        self._provider._fetch_key = lambda uri: self._key
+        self._provider._key_cache = dl.KeyCache(self._provider._fetch_key)
+
+    def test_explicit_iv(self):
+        iv = bytes(15) + b'\x2a'
+        data = AES.new(self._key, AES.MODE_CBC, iv).encrypt(b'0123456789abcdef')
+        segment = self._segment(m3u8.Key.METHOD_AES_128, '0x2A')
+        self.assertEqual(self._provider._decrypt_segment(segment, 0, data),
+                         b'0123456789abcdef')
+
+    def test_derived_iv(self):
+        iv = bytes(15) + b'\x04'
+        data = AES.new(self._key, AES.MODE_CBC, iv).encrypt(b'0123456789abcdef')
+        segment = self._segment(m3u8.Key.METHOD_AES_128)
+        self.assertEqual(self._provider._decrypt_segment(segment, 3, data),
+                         b'0123456789abcdef')
+
+    def test_method_none(self):
+        segment = self._segment(m3u8.Key.METHOD_NONE)
+        self.assertEqual(self._provider._decrypt_segment(segment, 0, b'data'),
+                         b'data')
+
+
+class LiveTest(unittest.TestCase):
+
+    def _provider(self, playlist_type, ended):
+        segment = m3u8.Segment()
+        segment.duration = 10
+        segment.sequence = 0
+        provider = dl.ToutvApiSegmentProvider(None, 1000000, live=True)
+        provider._video_playlist = m3u8.Playlist(10, 0, False, playlist_type,
+                                                 3, [], [segment], ended)
+        provider._segments = provider._video_playlist.segments
+        provider._reload_video_playlist = mock.Mock()
+
+        return provider
+
+    def test_wait_for_segment(self):
+        provider = self._provider(None, False)
+        self.assertTrue(provider.wait_for_segment(0))
+
+        def end_playlist():
+            provider._video_playlist.ended = True
+
+        provider._reload_video_playlist.side_effect = end_playlist
+        self.assertFalse(provider.wait_for_segment(1))
+        provider._reload_video_playlist.assert_called_once_with()
+
+    def test_min_reload_delay(self):
+        provider = self._provider(None, False)
+        del provider._reload_video_playlist
+        provider._video_playlist.target_duration = 0
+        provider._video_playlist_uri = 'http://example.com/index.m3u8'
+        provider._sleep_until_reload = mock.Mock()
+        provider._do_request = mock.Mock()
+        provider._do_request.return_value.text = '#EXTM3U\n'
+        provider._reload_video_playlist()
+        self.assertEqual(provider._reload_delay, 1)
+
+    def test_wait_for_segment_vod(self):
+        provider = self._provider('VOD', False)
+        self.assertFalse(provider.wait_for_segment(1))
+        self.assertFalse(provider._reload_video_playlist.called)
+
+
+class AdaptiveTest(unittest.TestCase):
+
+    def _variant(self, bandwidth, num_segments=10):
+        stream = m3u8.Stream()
+        stream.bandwidth = bandwidth
+        stream.uri = 'http://example.com/index_{}_av.m3u8'.format(bandwidth)
+        segments = []
+
+        for i in range(num_segments):
+            segment = m3u8.Segment()
+            segment.duration = 10
+            segment.uri = 'http://example.com/{}/{}.ts'.format(bandwidth, i)
+            segments.append(segment)
+
+        return stream, segments
+
+    def setUp(self):
+        low, low_segments = self._variant(500000)
+        high, high_segments = self._variant(1000000)
+        provider = dl.ToutvApiSegmentProvider(None, 1000000, adaptive=True)
+        provider._segments = high_segments
+        provider._video_playlist = m3u8.Playlist(10, 0, False, 'VOD', 3, [],
+                                                 high_segments, True)
+        provider._variant_segments[0] = low_segments
+        playlist = m3u8.Playlist(0, 0, False, None, 3, [low, high], [])
+        provider._init_variants(playlist, high)
+        self._provider = provider
+        self._low_segments = low_segments
+        self._high_segments = high_segments
+
+    def test_switch_down_and_up(self):
+        provider = self._provider
+
+        # 100 kB in 1 s: 800 kbps, too slow for 1 Mbps
+        provider._update_throughput(100000, 1)
+        provider._adapt(3)
+        self.assertIs(provider._segments, self._low_segments)
+
+        # back to a fast link
+        for i in range(4):
+            provider._update_throughput(1000000, 1)
+
+        provider._adapt(5)
+        self.assertIs(provider._segments, self._high_segments)
+
+        metadata = provider.get_metadata()
+        switches = metadata['bitrate_switches']
+        self.assertEqual(metadata['bitrate'], 1000000)
+        self.assertEqual(len(switches), 2)
+        self.assertEqual(switches[0]['segment'], 3)
+        self.assertEqual(switches[0]['time'], 30)
+        self.assertEqual(switches[0]['to_bitrate'], 500000)
+        self.assertEqual(switches[1]['segment'], 5)
+        self.assertEqual(switches[1]['to_bitrate'], 1000000)
+
+    def test_switch_after_start(self):
+        provider = self._provider
+        provider._first_segindex = 2
+        provider._update_throughput(100000, 1)
+        provider._adapt(1)
+
+        switches = provider.get_metadata()['bitrate_switches']
+        self.assertEqual(switches[0]['segment'], 3)
+        self.assertEqual(switches[0]['time'], 30)
+
+    def test_no_switch_to_unaligned_variant(self):
+        provider = self._provider
+        provider._variant_segments[0] = self._low_segments[:5]
+        provider._update_throughput(100000, 1)
+        provider._adapt(3)
+        self.assertIs(provider._segments, self._high_segments)
+        self.assertEqual(provider.get_metadata(), {})
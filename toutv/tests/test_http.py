@@ -0,0 +1,240 @@
+import http.server
+import threading
+import time
+import unittest
+import requests
+from unittest import mock
+from toutv import exceptions
+from toutv import http as toutv_http
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.client_ports.add(self.client_address[1])
+        server.cookie_headers.append(self.headers.get('Cookie'))
+
+        if server.statuses:
+            status = server.statuses.pop(0)
+        else:
+            status = 200
+
+        if self.path == '/slow':
+            time.sleep(0.5)
+
+        body = b'hello'
+
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Set-Cookie', 'session=abc')
+            self.end_headers()
+            self.wfile.write(body)
+        except BrokenPipeError:
+            # the client timed out
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.client_ports = set()
+        self._server.cookie_headers = []
+        self._server.statuses = []
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,),
+                                        daemon=True)
+        self._thread.start()
+        self._url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        self._client = toutv_http.HttpClient(retry_delay=0)
+
+    def tearDown(self):
+        self._client.close()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def test_connection_reuse(self):
+        for i in range(3):
+            r = self._client.get(self._url + '/')
+            self.assertEqual(r.content, b'hello')
+
+        self.assertEqual(len(self._server.client_ports), 1)
+
+        host = self._url[len('http://'):]
+        stats = self._client.get_stats()[host]
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['bytes'], 15)
+
+    def test_no_cookies_kept(self):
+        r = self._client.get(self._url + '/')
+        self.assertEqual(r.cookies['session'], 'abc')
+        self._client.get(self._url + '/')
+        self._client.get(self._url + '/', cookies={'explicit': '1'})
+        self.assertEqual(self._server.cookie_headers, [None, None, 'explicit=1'])
+
+    def test_retry_server_error(self):
+        self._server.statuses = [503]
+        r = self._client.get(self._url + '/')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(list(self._client.get_stats().values())[0]['retries'], 1)
+
+    def test_unexpected_status_code(self):
+        self._server.statuses = [404]
+
+        with self.assertRaises(exceptions.UnexpectedHttpStatusCodeError) as cm:
+            self._client.get(self._url + '/')
+
+        self.assertEqual(cm.exception.status_code, 404)
+
+        # not retried
+        self.assertEqual(len(self._server.cookie_headers), 1)
+
+    def test_timeout(self):
+        with self.assertRaises(exceptions.RequestTimeoutError):
+            self._client.get(self._url + '/slow', timeout=0.1, num_tries=1)
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def _run_concurrently(self, func, num_threads=4):
+        results = []
+        barrier = threading.Barrier(num_threads)
+
+        def run():
+            barrier.wait()
+
+            try:
+                results.append(func())
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=run) for i in range(num_threads)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_merged(self):
+        flights = toutv_http.SingleFlight()
+        num_calls = []
+
+        def call():
+            num_calls.append(1)
+            time.sleep(0.2)
+
+            return 'result'
+
+        results = self._run_concurrently(lambda: flights.do('key', call))
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(len(num_calls), 1)
+        self.assertEqual(flights.get_stats(), {'calls': 1, 'saved': 3})
+
+        # not in flight anymore
+        flights.do('key', call)
+        self.assertEqual(len(num_calls), 2)
+
+    def test_error(self):
+        flights = toutv_http.SingleFlight()
+
+        def call():
+            time.sleep(0.2)
+            raise ValueError('failed')
+
+        results = self._run_concurrently(lambda: flights.do('key', call))
+        self.assertEqual(len(results), 4)
+
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_states(self):
+        breaker = toutv_http.CircuitBreaker('host', failure_threshold=2,
+                                            reset_timeout=0.2)
+        breaker.before_request()
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), breaker.OPEN)
+
+        with self.assertRaises(exceptions.CircuitOpenError) as cm:
+            breaker.before_request()
+
+        self.assertGreater(cm.exception.retry_after, 0)
+
+        # a single trial request once the reset timeout expired
+        time.sleep(0.2)
+        self.assertEqual(breaker.get_state(), breaker.HALF_OPEN)
+        breaker.before_request()
+
+        with self.assertRaises(exceptions.CircuitOpenError):
+            breaker.before_request()
+
+        # a failed trial opens the circuit again
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), breaker.OPEN)
+
+        time.sleep(0.2)
+        breaker.before_request()
+        breaker.record_success()
+        self.assertEqual(breaker.get_state(), breaker.CLOSED)
+        breaker.before_request()
+
+    def test_success_resets_failures(self):
+        breaker = toutv_http.CircuitBreaker('host', failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.get_state(), breaker.CLOSED)
+
+    def test_client_fails_fast(self):
+        client = toutv_http.HttpClient(retry_delay=0, failure_threshold=2)
+
+        # nothing listens on this port
+        url = 'http://127.0.0.1:9/'
+
+        with self.assertRaises(exceptions.NetworkError):
+            client.get(url)
+
+        self.assertEqual(client.get_circuit_state('127.0.0.1:9'), 'open')
+
+        with self.assertRaises(exceptions.CircuitOpenError):
+            client.get(url)
+
+        self.assertEqual(client.get_stats()['127.0.0.1:9']['requests'], 2)
+
+    def test_unexpected_error_ends_trial(self):
+        client = toutv_http.HttpClient(retry_delay=0, failure_threshold=1,
+                                       reset_timeout=0.1)
+        url = 'http://host/'
+        error = requests.exceptions.TooManyRedirects()
+
+        with mock.patch('requests.Session.request', side_effect=error):
+            with self.assertRaises(requests.exceptions.TooManyRedirects):
+                client.get(url)
+
+            self.assertEqual(client.get_circuit_state('host'), 'open')
+            time.sleep(0.1)
+
+            # the failed trial opens the circuit again, until the next one
+            with self.assertRaises(requests.exceptions.TooManyRedirects):
+                client.get(url)
+
+            self.assertEqual(client.get_circuit_state('host'), 'open')
+            time.sleep(0.1)
+            self.assertEqual(client.get_circuit_state('host'), 'half-open')
+
+            with self.assertRaises(requests.exceptions.TooManyRedirects):
+                client.get(url)
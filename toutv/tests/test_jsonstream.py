@@ -0,0 +1,37 @@
+import json
+import unittest
+from toutv import jsonstream
+
+
+class IterArrayTest(unittest.TestCase):
+
+    def _chunks(self, doc, size):
+        return [doc[i:i + size] for i in range(0, len(doc), size)]
+
+    def test_items(self):
+        items = [{'Key': 'program-1', 'DisplayText': 'Génial'}, [1, [2]],
+                 12345, -1.5e-3, 'a], "b', True, None, {}]
+        doc = json.dumps(items, ensure_ascii=False).encode()
+
+        for size in [1, 2, 3, 7, len(doc)]:
+            chunks = self._chunks(doc, size)
+            self.assertEqual(list(jsonstream.iter_array(chunks)), items)
+
+    def test_empty(self):
+        self.assertEqual(list(jsonstream.iter_array([b' [', b' ] \n'])), [])
+
+    def test_incremental(self):
+        def chunks():
+            yield b'[{"a": 1}, '
+            chunks.done = True
+            yield b'{"b": 2}]'
+
+        chunks.done = False
+        it = jsonstream.iter_array(chunks())
+        self.assertEqual(next(it), {'a': 1})
+        self.assertFalse(chunks.done)
+
+    def test_invalid(self):
+        for doc in [b'', b'{}', b'[1,', b'[1 2]', b'[{"a": ']:
+            with self.assertRaises(ValueError):
+                list(jsonstream.iter_array(self._chunks(doc, 2)))
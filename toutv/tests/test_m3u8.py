@@ -0,0 +1,143 @@
+import unittest
+from toutv import m3u8
+
+
+_MEDIA_PLAYLIST = '''#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXT-X-MEDIA-SEQUENCE:0
+#EXT-X-KEY:METHOD=AES-128,URI="http://example.com/key"
+#EXTINF:10,
+segment0.ts
+#EXTINF:10,
+segment1.ts
+#EXTINF:10,
+segment2.ts
+#EXTINF:5.5,
+segment3.ts
+#EXT-X-ENDLIST
+'''
+
+
+class M3u8Test(unittest.TestCase):
+
+    def setUp(self):
+        self._playlist = m3u8.parse(_MEDIA_PLAYLIST, 'http://example.com')
+
+    def test_segments(self):
+        segments = self._playlist.segments
+        self.assertEqual(len(segments), 4)
+        self.assertEqual(segments[1].uri, 'http://example.com/segment1.ts')
+        self.assertEqual(segments[3].duration, 5.5)
+        self.assertEqual(segments[0].key.uri, 'http://example.com/key')
+
+    def test_duration(self):
+        self.assertEqual(self._playlist.get_duration(), 35.5)
+        self.assertEqual(self._playlist.get_segment_start_time(0), 0)
+        self.assertEqual(self._playlist.get_segment_start_time(2), 20)
+
+    def test_segment_index_at(self):
+        self.assertEqual(self._playlist.get_segment_index_at(0), 0)
+        self.assertEqual(self._playlist.get_segment_index_at(9.9), 0)
+        self.assertEqual(self._playlist.get_segment_index_at(10), 1)
+        self.assertEqual(self._playlist.get_segment_index_at(34), 3)
+        self.assertEqual(self._playlist.get_segment_index_at(100), 3)
+
+    def test_segment_range(self):
+        self.assertEqual(self._playlist.get_segment_range(), (0, 4))
+        self.assertEqual(self._playlist.get_segment_range(12, 18), (1, 2))
+        self.assertEqual(self._playlist.get_segment_range(12, 20), (1, 2))
+        self.assertEqual(self._playlist.get_segment_range(12, 20.5), (1, 3))
+        self.assertEqual(self._playlist.get_segment_range(start=25), (2, 4))
+        self.assertEqual(self._playlist.get_segment_range(end=100), (0, 4))
+
+        with self.assertRaises(ValueError):
+            self._playlist.get_segment_range(18, 12)
+
+        with self.assertRaises(ValueError):
+            self._playlist.get_segment_range(40)
+
+    def test_index_follows_appended_segments(self):
+        self.assertEqual(self._playlist.get_duration(), 35.5)
+
+        segment = m3u8.Segment()
+        segment.duration = 4.5
+        self._playlist.segments.append(segment)
+
+        self.assertEqual(self._playlist.get_duration(), 40)
+        self.assertEqual(self._playlist.get_segment_index_at(36), 4)
+
+
+_LIVE_PLAYLIST = '''#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXT-X-MEDIA-SEQUENCE:{}
+{}'''
+
+
+def _live_playlist(first_sequence, num_segments, ended=False):
+    segments = ''
+
+    for sequence in range(first_sequence, first_sequence + num_segments):
+        segments += '#EXTINF:10,\nsegment{}.ts\n'.format(sequence)
+
+    if ended:
+        segments += '#EXT-X-ENDLIST\n'
+
+    return _LIVE_PLAYLIST.format(first_sequence, segments)
+
+
+class M3u8LiveTest(unittest.TestCase):
+
+    def test_live(self):
+        playlist = m3u8.parse(_live_playlist(5, 3), 'http://example.com')
+        self.assertTrue(playlist.is_live())
+        self.assertEqual([s.sequence for s in playlist.segments], [5, 6, 7])
+
+    def test_update(self):
+        playlist = m3u8.parse(_live_playlist(5, 3), 'http://example.com')
+
+        # the window slid by two segments
+        num_new = m3u8.update(playlist, _live_playlist(7, 3), 'http://example.com')
+        self.assertEqual(num_new, 2)
+        self.assertEqual([s.sequence for s in playlist.segments], [5, 6, 7, 8, 9])
+        self.assertEqual(playlist.segments[-1].uri, 'http://example.com/segment9.ts')
+        self.assertEqual(playlist.get_duration(), 50)
+
+        # nothing changed
+        num_new = m3u8.update(playlist, _live_playlist(7, 3), 'http://example.com')
+        self.assertEqual(num_new, 0)
+        self.assertTrue(playlist.is_live())
+
+        # the stream ended
+        num_new = m3u8.update(playlist, _live_playlist(8, 3, True), 'http://example.com')
+        self.assertEqual(num_new, 1)
+        self.assertFalse(playlist.is_live())
+        self.assertEqual(len(playlist.segments), 6)
+
+
+_ROTATING_KEYS_PLAYLIST = '''#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXT-X-KEY:METHOD=AES-128,URI="http://example.com/key?a=1,b=2",IV=0x0000000000000000000000000000000A
+#EXTINF:10,
+segment0.ts
+#EXT-X-KEY:METHOD=AES-128,URI="key2"
+#EXTINF:10,
+segment1.ts
+#EXT-X-KEY:METHOD=NONE
+#EXTINF:10,
+segment2.ts
+'''
+
+
+class M3u8KeyTest(unittest.TestCase):
+
+    def test_key_rotation(self):
+        playlist = m3u8.parse(_ROTATING_KEYS_PLAYLIST, 'http://example.com')
+        segments = playlist.segments
+
+        self.assertEqual(segments[0].key.uri, 'http://example.com/key?a=1,b=2')
+        self.assertEqual(segments[0].key.get_iv_bytes(), bytes(15) + b'\x0a')
+        self.assertEqual(segments[1].key.uri, 'http://example.com/key2')
+        self.assertIsNone(segments[1].key.get_iv_bytes())
+        self.assertTrue(segments[1].is_encrypted())
+        self.assertEqual(segments[2].key.method, m3u8.Key.METHOD_NONE)
+        self.assertFalse(segments[2].is_encrypted())
@@ -0,0 +1,83 @@
+import pickle
+import unittest
+from toutv import bos
+from toutv import serialization
+
+
+def _make_emission(emid):
+    emission = bos.Emission()
+    emission.Id = emid
+    emission.Title = 'Emission {}'.format(emid)
+
+    return emission
+
+
+def _make_episode(emission, epid):
+    episode = bos.Episode()
+    episode.Id = epid
+    episode.Title = 'Episode {}'.format(epid)
+    episode.PID = 'pid-{}'.format(epid)
+    episode.set_emission(emission)
+    episode._auth = object()
+    episode._proxies = {'http': 'http://proxy'}
+
+    return episode
+
+
+class SerializationTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        emission = _make_emission(1)
+        emission.Country = 'Canada'
+        episodes = [_make_episode(emission, 10), _make_episode(emission, 11)]
+
+        for compression in [serialization.COMPRESSION_NONE,
+                            serialization.COMPRESSION_ZLIB,
+                            serialization.COMPRESSION_LZMA]:
+            data = serialization.dumps(episodes, compression)
+            loaded = serialization.loads(data)
+            self.assertEqual([e.Id for e in loaded], [10, 11])
+            self.assertEqual(loaded[0].PID, 'pid-10')
+            self.assertIsNone(loaded[0].Description)
+
+            # both episodes still share the same emission
+            self.assertIs(loaded[0].get_emission(), loaded[1].get_emission())
+            self.assertEqual(loaded[0].get_emission().Country, 'Canada')
+
+    def test_transient_attrs(self):
+        episode = _make_episode(_make_emission(1), 10)
+        loaded = serialization.loads(serialization.dumps(episode))
+        self.assertIsNone(loaded.get_auth())
+        self.assertIsNone(loaded.get_proxies())
+
+    def test_cycles(self):
+        emission = _make_emission(1)
+        episode = _make_episode(emission, 10)
+        emission.add_episode(episode)
+        loaded = serialization.loads(serialization.dumps(emission))
+        self.assertIs(list(loaded.get_episodes())[0].get_emission(), loaded)
+
+    def test_containers(self):
+        value = {'etag': '"abc"', 'body': b'{}', 'result': (1, [2.5, None])}
+        self.assertEqual(serialization.loads(serialization.dumps(value)), value)
+
+    def test_smaller_than_pickle(self):
+        emissions = [_make_emission(emid) for emid in range(100)]
+        data = serialization.dumps(emissions)
+        self.assertLess(len(data) * 10, len(pickle.dumps(emissions)))
+
+    def test_bad_data(self):
+        with self.assertRaises(serialization.SerializationError):
+            serialization.loads(b'garbage')
+
+        data = serialization.dumps([1, 2])
+        bad_version = data[:3] + bytes([255]) + data[4:]
+
+        with self.assertRaises(serialization.SerializationError):
+            serialization.loads(bad_version)
+
+        # truncated
+        data = serialization.dumps([1, 2], serialization.COMPRESSION_NONE)
+
+        with self.assertRaises(serialization.SerializationError):
+            serialization.loads(data[:-3])
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from toutv import throughput
+
+
+class ThroughputTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'throughput')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_no_samples(self):
+        history = throughput.ThroughputHistory(self._path)
+        self.assertIsNone(history.get_throughput())
+
+    def test_persistence(self):
+        history = throughput.ThroughputHistory(self._path, min_sample_bytes=0)
+        history.add_sample(1000, 1)
+        history.add_sample(3000, 1)
+
+        # harmonic mean of 1000 and 3000 B/s
+        history = throughput.ThroughputHistory(self._path)
+        self.assertAlmostEqual(history.get_throughput(), 1500)
+
+    def test_invalid_file(self):
+        for data in ['{"a": 1}', '[[1, 2]]', '[["a", 1, 1]]', '[null]', '42']:
+            with open(self._path, 'w') as f:
+                f.write(data)
+
+            history = throughput.ThroughputHistory(self._path)
+            self.assertIsNone(history.get_throughput())
+
+    def test_small_samples_ignored(self):
+        history = throughput.ThroughputHistory(self._path, min_sample_bytes=100)
+        history.add_sample(10, 1)
+        self.assertIsNone(history.get_throughput())
+
+    def test_max_samples(self):
+        history = throughput.ThroughputHistory(self._path, max_samples=2,
+                                               min_sample_bytes=0)
+
+        for num_bytes in [10, 1000, 1000]:
+            history.add_sample(num_bytes, 1)
+
+        self.assertEqual(len(history.get_samples()), 2)
+        self.assertAlmostEqual(history.get_throughput(), 1000)
+
+    def test_choose_bitrate(self):
+        bitrates = [500000, 1000000, 2000000]
+
+        # 1 h of video, 100 kB/s
+        choose = throughput.choose_bitrate
+        self.assertEqual(choose(bitrates, 3600, 7200, 100000), 1000000)
+        self.assertEqual(choose(bitrates, 3600, 3600, 100000), 500000)
+        self.assertEqual(choose(bitrates, 3600, 14400, 100000), 2000000)
+
+        # nothing is fast enough
+        self.assertEqual(choose(bitrates, 3600, 60, 100000), 500000)
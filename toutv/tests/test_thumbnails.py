@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from toutv import bos
+from toutv import thumbnails
+from toutv.tests import fakes
+
+
+class ThumbnailStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_get_put(self):
+        store = thumbnails.ThumbnailStore(self._dir)
+        self.assertIsNone(store.get('http://a/1.jpg'))
+        store.put('http://a/1.jpg', b'jpeg 1')
+        self.assertEqual(store.get('http://a/1.jpg'), b'jpeg 1')
+
+        # another instance sees the same thumbnails
+        store = thumbnails.ThumbnailStore(self._dir)
+        self.assertEqual(store.get('http://a/1.jpg'), b'jpeg 1')
+        self.assertEqual(store.get_size(), 6)
+
+        # replacing a thumbnail doesn't count it twice
+        store.put('http://a/1.jpg', b'jpeg')
+        self.assertEqual(store.get_size(), 4)
+
+    def test_lru_eviction(self):
+        store = thumbnails.ThumbnailStore(self._dir, max_bytes=300)
+
+        for i in range(3):
+            store.put('http://a/{}.jpg'.format(i), bytes(100))
+            path = store._get_path('http://a/{}.jpg'.format(i))
+            os.utime(path, (i, i))
+
+        # 0 is now the most recently used one
+        store.get('http://a/0.jpg')
+        store.put('http://a/3.jpg', bytes(100))
+
+        self.assertLessEqual(store.get_size(), 300)
+        self.assertIsNotNone(store.get('http://a/0.jpg'))
+        self.assertIsNotNone(store.get('http://a/3.jpg'))
+        self.assertIsNone(store.get('http://a/1.jpg'))
+
+    def test_too_big(self):
+        store = thumbnails.ThumbnailStore(self._dir, max_bytes=10)
+        store.put('http://a/1.jpg', bytes(11))
+        self.assertIsNone(store.get('http://a/1.jpg'))
+
+
+def _make_episode(delays):
+    # delays maps thumbnail URLs to their response time (None: dead URL)
+    def respond(url, params):
+        delay = delays[url]
+
+        if delay is None:
+            raise IOError('dead URL')
+
+        time.sleep(delay)
+
+        return fakes.FakeResponse(content=url.encode())
+
+    return fakes.FakeEpisode(respond, list(delays.keys()))
+
+
+class ThumbnailProviderTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_first_good_response(self):
+        episode = _make_episode({'http://slow': 1, 'http://dead': None,
+                                'http://fast': 0})
+        start = time.monotonic()
+        self.assertEqual(episode.get_medium_thumb_data(), b'http://fast')
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_single_try(self):
+        http_client = mock.Mock()
+        http_client.get.return_value = fakes.FakeResponse(content=b'jpeg')
+
+        with mock.patch('toutv.http.get_default_client', return_value=http_client):
+            url, data = bos.Episode()._fetch_first_thumb(['http://thumb'])
+
+        self.assertEqual(data, b'jpeg')
+        self.assertEqual(http_client.get.call_args[1]['num_tries'], 1)
+
+    def test_store(self):
+        store = thumbnails.ThumbnailStore(self._dir)
+        episode = _make_episode({'http://thumb': 0})
+        episode.set_thumb_store(store)
+        episode.get_medium_thumb_data()
+
+        episode = _make_episode({'http://thumb': 0})
+        episode.set_thumb_store(store)
+        self.assertEqual(episode.get_medium_thumb_data(), b'http://thumb')
+        self.assertEqual(episode.requested_urls, [])
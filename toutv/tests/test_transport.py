@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from toutv import bos
+from toutv import cache
+from toutv import transport
+
+
+_SEARCH_DTO = [
+    {'Key': 'program-1', 'DisplayText': 'Infoman', 'Id': 1, 'Url': 'infoman'},
+    {'Key': 'person-2', 'DisplayText': 'Someone', 'Id': 2, 'Url': 'someone'},
+]
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, json=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b'body'
+        self._json = json
+        self.num_json_calls = 0
+
+    def json(self):
+        self.num_json_calls += 1
+        return self._json
+
+    def iter_content(self, chunk_size):
+        doc = json.dumps(self._json).encode()
+
+        for i in range(0, len(doc), chunk_size):
+            yield doc[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class ConditionalRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache = cache.SqliteCache(os.path.join(self._dir, 'cache'))
+        self._transport = transport.JsonTransport(response_cache=self._cache)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_not_modified(self):
+        ok = FakeResponse(200, _SEARCH_DTO, {'ETag': '"v1"'})
+        not_modified = FakeResponse(304)
+
+        with mock.patch('requests.Session.request', side_effect=[ok, not_modified]) as get:
+            emissions = self._transport.get_emissions()
+            self.assertEqual([e.Title for e in emissions], ['Infoman'])
+            self.assertNotIn('If-None-Match', get.call_args[1]['headers'])
+
+            emissions = self._transport.get_emissions()
+            self.assertEqual([e.Title for e in emissions], ['Infoman'])
+            self.assertEqual(get.call_args[1]['headers']['If-None-Match'], '"v1"')
+            self.assertEqual(not_modified.num_json_calls, 0)
+
+    def test_modified(self):
+        ok = FakeResponse(200, _SEARCH_DTO, {'Last-Modified': 'yesterday'})
+        changed_dto = [dict(_SEARCH_DTO[0], DisplayText='Infoman 2')]
+        changed = FakeResponse(200, changed_dto, {'Last-Modified': 'today'})
+
+        with mock.patch('requests.Session.request', side_effect=[ok, changed]) as get:
+            self._transport.get_emissions()
+            emissions = self._transport.get_emissions()
+            self.assertEqual(get.call_args[1]['headers']['If-Modified-Since'], 'yesterday')
+            self.assertEqual([e.Title for e in emissions], ['Infoman 2'])
+
+    def test_no_validators(self):
+        ok = FakeResponse(200, _SEARCH_DTO)
+
+        with mock.patch('requests.Session.request', side_effect=[ok, ok]) as get:
+            self._transport.get_emissions()
+            self._transport.get_emissions()
+            self.assertNotIn('If-None-Match', get.call_args[1]['headers'])
+            self.assertNotIn('If-Modified-Since', get.call_args[1]['headers'])
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def test_concurrent_identical_queries(self):
+        t = transport.JsonTransport()
+        results = []
+
+        def slow_request(*args, **kwargs):
+            time.sleep(0.2)
+
+            return FakeResponse(200, _SEARCH_DTO)
+
+        def get_emissions():
+            results.append(t.get_emissions())
+
+        with mock.patch('requests.Session.request', side_effect=slow_request) as request:
+            threads = [threading.Thread(target=get_emissions) for i in range(3)]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(t.get_coalescing_stats(), {'calls': 1, 'saved': 2})
+
+
+class StreamingEmissionsTest(unittest.TestCase):
+
+    def test_iter_emissions(self):
+        t = transport.JsonTransport()
+        response = FakeResponse(200, _SEARCH_DTO * 100)
+
+        with mock.patch('requests.Session.request', return_value=response) as request:
+            emissions = list(t.iter_emissions())
+
+        self.assertTrue(request.call_args[1]['stream'])
+        self.assertEqual(response.num_json_calls, 0)
+        self.assertEqual(len(emissions), 100)
+        self.assertEqual(emissions[0].Title, 'Infoman')
+        self.assertEqual(emissions[0].Url, 'infoman')
+
+
+class EmissionDetailsTest(unittest.TestCase):
+
+    def test_get_emission_details(self):
+        t = transport.JsonTransport()
+        emission = bos.Emission()
+        emission.Url = '/infoman'
+        dto = {'Details': {'Description': 'Infoman', 'Country': 'Canada', 'Other': 1}}
+
+        with mock.patch('requests.Session.request', return_value=FakeResponse(200, dto)) as request:
+            details = t.get_emission_details(emission)
+
+        self.assertTrue(request.call_args[0][1].endswith('/presentation/infoman'))
+        self.assertEqual(details, {'Description': 'Infoman', 'Country': 'Canada'})
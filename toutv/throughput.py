@@ -0,0 +1,126 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import logging
+import os
+import time
+
+
+class ThroughputHistory:
+
+    """Persistent history of the throughput measured by recent downloads."""
+
+    def __init__(self, path, max_samples=20, max_age=7 * 24 * 3600,
+                 min_sample_bytes=1 << 20):
+        self._path = path
+        self._max_samples = max_samples
+        self._min_sample_bytes = min_sample_bytes
+        self._max_age = max_age
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._samples = self._load()
+
+    def _load(self):
+        try:
+            with open(self._path, 'r') as f:
+                samples = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            self._logger.warning('Cannot read throughput history: {}'.format(e))
+            return []
+
+        # Forget old measurements: the link may have changed since.
+        oldest = time.time() - self._max_age
+
+        try:
+            samples = [(float(t), float(num_bytes), float(seconds))
+                       for t, num_bytes, seconds in samples]
+        except (TypeError, KeyError, IndexError, ValueError) as e:
+            self._logger.warning('Invalid throughput history: {}'.format(e))
+            return []
+
+        return [s for s in samples if s[0] >= oldest]
+
+    def _save(self):
+        tmp_path = self._path + '.part'
+
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._samples, f)
+
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            self._logger.warning('Cannot save throughput history: {}'.format(e))
+
+    def add_sample(self, num_bytes, seconds):
+        # Small downloads are dominated by latency, not throughput.
+        if num_bytes < self._min_sample_bytes or seconds <= 0:
+            return
+
+        self._samples.append((time.time(), num_bytes, seconds))
+        self._samples = self._samples[-self._max_samples:]
+        self._save()
+
+    def get_samples(self):
+        return list(self._samples)
+
+    def get_throughput(self):
+        """Returns the estimated throughput (bytes/s), or None if unknown.
+
+        The estimate is the harmonic mean of the recent samples, which is
+        dominated by the slow ones: it's better to underestimate.
+        """
+        if not self._samples:
+            return None
+
+        inverse_sum = sum(seconds / num_bytes for _, num_bytes, seconds in self._samples)
+
+        return len(self._samples) / inverse_sum
+
+
+def get_download_time(bitrate, duration, throughput):
+    """Returns the estimated time (s) to download duration seconds of a
+    bitrate bps stream with a throughput of throughput bytes/s."""
+    return bitrate * duration / 8 / throughput
+
+
+def choose_bitrate(bitrates, duration, deadline, throughput):
+    """Returns the highest bitrate (bps) of bitrates for which a duration
+    seconds stream is expected to download within deadline seconds with
+    a throughput of throughput bytes/s.
+
+    The lowest bitrate is returned if none of them is expected to
+    download in time.
+    """
+    bitrates = sorted(bitrates)
+
+    for bitrate in reversed(bitrates):
+        if get_download_time(bitrate, duration, throughput) <= deadline:
+            return bitrate
+
+    return bitrates[0]
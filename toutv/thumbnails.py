@@ -0,0 +1,146 @@
+# Copyright (c) 2012, Benjamin Vanheuverzwijn <bvanheu@gmail.com>
+# All rights reserved.
+#
+# Thanks to Marc-Etienne M. Leveille
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of pytoutv nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Benjamin Vanheuverzwijn BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import logging
+import os
+import threading
+
+
+class ThumbnailStore:
+
+    """On-disk store of thumbnails, keyed by URL.
+
+    When the stored thumbnails take more than max_bytes, the least
+    recently used ones are removed. Several processes may share the same
+    directory.
+    """
+
+    def __init__(self, directory, max_bytes=64 << 20):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._num_bytes = sum(size for mtime, size, path in self._get_files())
+
+    def _get_path(self, url):
+        name = hashlib.sha1(url.encode()).hexdigest()
+
+        return os.path.join(self._directory, name)
+
+    def _get_files(self):
+        files = []
+
+        for name in os.listdir(self._directory):
+            if name.endswith('.tmp'):
+                continue
+
+            path = os.path.join(self._directory, name)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # removed by another process
+                continue
+
+            if os.path.isfile(path):
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        return files
+
+    def get_size(self):
+        """Returns the size of the stored thumbnails, in bytes."""
+        with self._lock:
+            return self._num_bytes
+
+    def get(self, url):
+        path = self._get_path(url)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            # The modification time is the last use time
+            os.utime(path)
+        except OSError:
+            return None
+
+        return data
+
+    def put(self, url, data):
+        if len(data) > self._max_bytes:
+            return
+
+        path = self._get_path(url)
+        tmp_path = '{}.{}-{}.tmp'.format(path, os.getpid(),
+                                         threading.get_ident())
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+
+            # the thumbnail may be replaced
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._logger.warning('Cannot store thumbnail of "{}": {}'.format(url, e))
+            return
+
+        with self._lock:
+            self._num_bytes += len(data) - old_size
+
+            if self._num_bytes > self._max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Evict down to 3/4 of the budget, so that the directory isn't
+        # scanned again on the next put().
+        files = sorted(self._get_files())
+        num_bytes = sum(size for mtime, size, path in files)
+        target = self._max_bytes * 3 // 4
+
+        for mtime, size, path in files:
+            if num_bytes <= target:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # removed by another process
+                pass
+
+            num_bytes -= size
+
+        tmpl = 'Evicted thumbnails: {} -> {} bytes'
+        self._logger.debug(tmpl.format(self._num_bytes, num_bytes))
+        self._num_bytes = num_bytes
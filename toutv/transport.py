@@ -25,9 +25,11 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import copy
 import logging
-import requests
 import toutv.exceptions
+import toutv.http
+import toutv.jsonstream
 import toutv.mapper
 import toutv.config
 import toutv.bos as bos
@@ -38,9 +40,17 @@ class Transport:
     def get_emissions(self):
         raise NotImplementedError()
 
+    def iter_emissions(self):
+        return iter(self.get_emissions())
+
     def get_emission_episodes(self, emission_id):
         raise NotImplementedError()
 
+    def get_emission_details(self, emission):
+        """Returns the lazy fields of emission (see
+        toutv.bos.Emission._lazy_fields), as a dict."""
+        raise NotImplementedError()
+
     def get_page_repertoire(self):
         raise NotImplementedError()
 
@@ -50,11 +60,26 @@ class Transport:
 
 class JsonTransport(Transport):
 
-    def __init__(self, proxies=None, auth=None):
+    """Transport using the TOU.TV JSON APIs.
+
+    If a response cache (a toutv.cache.Cache) is set, the validators
+    (ETag/Last-Modified) of the responses are stored along with their
+    mapped results, and the requests are made conditional:
+    a 304 response returns the stored result without parsing anything.
+
+    Requests are made by http_client (a toutv.http.HttpClient) or, if
+    it's None, by the default client of the time of each request.
+    """
+
+    def __init__(self, proxies=None, auth=None, response_cache=None,
+                 http_client=None):
         self._mapper = toutv.mapper.JsonMapper()
+        self._http_client = http_client
+        self._flights = toutv.http.SingleFlight()
 
         self.set_proxies(proxies)
         self.set_auth(auth)
+        self.set_response_cache(response_cache)
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -64,63 +89,160 @@ class JsonTransport(Transport):
     def set_auth(self, auth):
         self._auth = auth
 
-    def _do_query_url(self, url, params=None, num_tries=1):
+    def set_response_cache(self, response_cache):
+        self._response_cache = response_cache
+
+    def _get_http_client(self):
+        # The default client may be replaced after this transport is
+        # created (by --record/--replay, for example)
+        if self._http_client is None:
+            return toutv.http.get_default_client()
+
+        return self._http_client
+
+    def _do_query_url(self, url, params=None, num_tries=1, headers=None):
         if num_tries > 1:
             timeout = 5
         else:
             timeout = 10
 
-        for i in range(num_tries):
-            try:
-                return self._do_one_query_url(url, params, timeout)
-            except requests.exceptions.Timeout as e:
-                if i < num_tries:
-                    self._logger.warning("Timeout with %s; will retry...", url)
-                else:
-                    raise toutv.exceptions.RequestTimeoutError(url, timeout * num_tries) from e
+        ok_status_codes = [200]
+
+        if headers:
+            # conditional request
+            ok_status_codes.append(304)
+
+        return self._get_http_client().get(url, params=params, headers=headers,
+                                           proxies=self._proxies, timeout=timeout,
+                                           num_tries=num_tries,
+                                           ok_status_codes=ok_status_codes)
+
+    @staticmethod
+    def _get_response_key(url, params):
+        if not params:
+            return url
+
+        params = sorted((str(k), str(v)) for k, v in params.items())
+
+        return '{}?{}'.format(url, '&'.join('{}={}'.format(k, v) for k, v in params))
+
+    def get_coalescing_stats(self):
+        """Returns the number of queries made ('calls') and of identical
+        concurrent ones merged into them ('saved')."""
+        return self._flights.get_stats()
+
+    def _do_query_json_url_result(self, url, params, to_result, num_tries=1):
+        # Identical concurrent queries share the result of a single one
+        key = self._get_response_key(url, params)
+
+        def query():
+            return self._query_json_url_result(url, params, to_result,
+                                               num_tries)
+
+        return self._flights.do(key, query)
+
+    def _query_json_url_result(self, url, params, to_result, num_tries=1):
+        # Query a JSON URL and return to_result(json), conditionally if we
+        # have validators for this request.
+        if self._response_cache is None:
+            return to_result(self._do_query_json_url(url, params, num_tries))
+
+        key = self._get_response_key(url, params)
+        response = self._response_cache.get_response(key)
+        headers = {}
+
+        if response is not None:
+            if response['etag'] is not None:
+                headers['If-None-Match'] = response['etag']
 
-    def _do_one_query_url(self, url, params=None, timeout=10):
-        headers = toutv.config.HEADERS
+            if response['last_modified'] is not None:
+                headers['If-Modified-Since'] = response['last_modified']
 
-        r = requests.get(url, params=params, headers=headers, proxies=self._proxies, timeout=timeout)
-        if r.status_code != 200:
-            code = r.status_code
-            raise toutv.exceptions.UnexpectedHttpStatusCodeError(url, code)
+        r = self._do_query_url(url, params, num_tries, headers)
 
-        return r
+        if r.status_code == 304:
+            self._logger.debug('Not modified: {}'.format(key))
+
+            return response['result']
+
+        result = to_result(r.json())
+        etag = r.headers.get('ETag')
+        last_modified = r.headers.get('Last-Modified')
+
+        if etag is not None or last_modified is not None:
+            self._response_cache.set_response(key, {
+                'etag': etag,
+                'last_modified': last_modified,
+                'result': result,
+            })
+
+        return result
 
     def _do_query_json_url(self, url, params=None, num_tries=1):
         r = self._do_query_url(url, params, num_tries)
         return r.json()
 
-    def _do_query_json_endpoint(self, endpoint, params=None):
+    def _do_query_json_endpoint(self, endpoint, params=None, to_result=None):
         url = '{}{}'.format(toutv.config.TOUTV_JSON_URL_PREFIX, endpoint)
-        json = self._do_query_json_url(url, params, num_tries=5)
-        return json['d']
 
-    def get_emissions(self):
-        # All emissions, including those only available in Extra
-        # We don't have much information about them, except their id, title, and URL, but that is enough to be able to fetch them at least.
-        url = '{}/presentation/search'.format(toutv.config.TOUTV_BASE_URL)
-        params = {'v': 2, 'd': 'android'}
-        results_dto = self._do_query_json_url(url, params)
+        def to_d_result(json):
+            if to_result is None:
+                return json['d']
+
+            return to_result(json['d'])
 
-        def dto_to_bo(dto):
-            bo = toutv.bos.Emission()
+        return self._do_query_json_url_result(url, params, to_d_result,
+                                              num_tries=5)
 
-            bo.Title = dto['DisplayText']
-            bo.Id = dto['Id']
-            bo.Url = dto['Url']
+    # All emissions, including those only available in Extra
+    # We don't have much information about them, except their id, title, and URL, but that is enough to be able to fetch them at least.
+    _emissions_url = '{}/presentation/search'.format(toutv.config.TOUTV_BASE_URL)
+    _emissions_params = {'v': 2, 'd': 'android'}
 
-            return bo
+    @staticmethod
+    def _emission_dto_to_bo(dto):
+        bo = toutv.bos.Emission()
 
-        def filter_program(dto):
-            return dto['Key'].startswith('program-')
+        bo.Title = dto['DisplayText']
+        bo.Id = dto['Id']
+        bo.Url = dto['Url']
 
-        programs_dto = filter(filter_program, results_dto)
-        emissions = map(dto_to_bo, programs_dto)
+        return bo
 
-        return list(emissions)
+    @staticmethod
+    def _is_program_dto(dto):
+        return dto['Key'].startswith('program-')
+
+    def get_emissions(self):
+        def to_result(results_dto):
+            programs_dto = filter(self._is_program_dto, results_dto)
+            emissions = map(self._emission_dto_to_bo, programs_dto)
+
+            return list(emissions)
+
+        return self._do_query_json_url_result(self._emissions_url,
+                                              self._emissions_params,
+                                              to_result)
+
+    def iter_emissions(self):
+        """Generates all the emissions while the catalog response is being
+        received.
+
+        The response is parsed one item at a time, so that neither its
+        whole text nor all its items are kept in memory. It's never
+        conditional nor stored in the response cache.
+        """
+        r = self._get_http_client().get(self._emissions_url,
+                                        params=self._emissions_params,
+                                        proxies=self._proxies, timeout=10,
+                                        stream=True)
+
+        try:
+            for dto in toutv.jsonstream.iter_array(r.iter_content(65536)):
+                if self._is_program_dto(dto):
+                    yield self._emission_dto_to_bo(dto)
+        finally:
+            r.close()
 
     def get_emission_episodes(self, emission, short_version=False):
         if short_version:
@@ -128,12 +250,8 @@ class JsonTransport(Transport):
             if len(episodes) > 0:
                 return episodes
 
-        episodes = []
-
         url = '{}/presentation/{}'.format(toutv.config.TOUTV_BASE_URL, emission.Url)
         params = {'v': 2, 'excludeLineups': False, 'd': 'android'}
-        emission_dto = self._do_query_json_url(url, params)
-        seasons = emission_dto['SeasonLineups']
 
         # Create an Episode object from the received JSON.
         def parse_episode(episode_dto, has_season):
@@ -154,27 +272,56 @@ class JsonTransport(Transport):
             episode.set_emission(emission)
             return episode
 
-        # Sometimes we have a non-NULL SeasonLineups attribute, it is a list of
-        # season, where each season contains a list of episodes.
-        if seasons is not None:
-            for season in seasons:
-                episodes_dto = season['LineupItems']
-                for episode_dto in episodes_dto:
-                    episode = parse_episode(episode_dto, True)
-                    episodes.append(episode)
-        else:
-            # But SeasonLineups is sometimes None, most likely because there's
-            # a single video/episode.  We can then treat the top-level object
-            # as the episode.  The important value is idMedia, which will be
-            # used to fetch the playlist when fetching the video.
-            episode = parse_episode(emission_dto, False)
-            episodes = [episode]
+        def to_result(emission_dto):
+            episodes = []
+            seasons = emission_dto['SeasonLineups']
+
+            # Sometimes we have a non-NULL SeasonLineups attribute, it is a list of
+            # season, where each season contains a list of episodes.
+            if seasons is not None:
+                for season in seasons:
+                    episodes_dto = season['LineupItems']
+                    for episode_dto in episodes_dto:
+                        episode = parse_episode(episode_dto, True)
+                        episodes.append(episode)
+            else:
+                # But SeasonLineups is sometimes None, most likely because there's
+                # a single video/episode.  We can then treat the top-level object
+                # as the episode.  The important value is idMedia, which will be
+                # used to fetch the playlist when fetching the video.
+                episode = parse_episode(emission_dto, False)
+                episodes = [episode]
+
+            return episodes
+
+        episodes = self._do_query_json_url_result(url, params, to_result)
+
+        # Episodes of a stored result refer to a copy of the emission, and
+        # may be shared with other threads: refer to emission in copies.
+        episodes = [copy.copy(episode) for episode in episodes]
+
+        for episode in episodes:
+            episode.set_emission(emission)
 
         return episodes
 
+    def get_emission_details(self, emission):
+        url = '{}/presentation{}'.format(toutv.config.TOUTV_BASE_URL, emission.Url)
+        params = {'v': 2, 'excludeLineups': True, 'd': 'android'}
+
+        def to_result(emission_dto):
+            return {
+                'Description': emission_dto['Details']['Description'],
+                'Country': emission_dto['Details']['Country'],
+            }
+
+        return self._do_query_json_url_result(url, params, to_result)
+
     def get_page_repertoire(self):
-        repertoire_dto = self._do_query_json_endpoint('GetPageRepertoire')
+        return self._do_query_json_endpoint('GetPageRepertoire',
+                                            to_result=self._repertoire_dto_to_bo)
 
+    def _repertoire_dto_to_bo(self, repertoire_dto):
         repertoire = bos.Repertoire()
 
         # Emissions
@@ -199,12 +346,13 @@ class JsonTransport(Transport):
         return repertoire
 
     def search(self, query):
-        searchresults = None
-        searchresultdatas = []
         params = {'query': query}
 
-        searchresults_dto = self._do_query_json_endpoint('SearchTerms', params)
+        return self._do_query_json_endpoint('SearchTerms', params,
+                                            to_result=self._searchresults_dto_to_bo)
 
+    def _searchresults_dto_to_bo(self, searchresults_dto):
+        searchresultdatas = []
         searchresults = self._mapper.dto_to_bo(searchresults_dto,
                                                bos.SearchResults)
         if searchresults.Results is not None:
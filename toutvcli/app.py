@@ -28,6 +28,7 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
+import datetime
 import distutils.version
 import locale
 import os
@@ -41,9 +42,13 @@ import re
 import toutv.dl
 import toutv.client
 import toutv.cache
+import toutv.cassette
 import toutv.config
 import toutv.auth
 import toutv.exceptions
+import toutv.http
+import toutv.throughput
+import toutv.transport
 from toutvcli import __version__
 from toutvcli.progressbar import ProgressBar
 import traceback
@@ -58,6 +63,7 @@ class App:
     QUALITY_MIN = 'MIN'
     QUALITY_AVG = 'AVERAGE'
     QUALITY_MAX = 'MAX'
+    QUALITY_AUTO = 'AUTO'
 
     FETCH_INFO_FIRST_ARG = 'show-or-url'
     FETCH_INFO_SECOND_ARG = 'episode'
@@ -69,6 +75,7 @@ class App:
         self._stop = False
         self._logger = logging.getLogger(__name__)
         self._toutv_client = None
+        self._cache = None
         self._verbose = False
         self._quiet = False
 
@@ -103,8 +110,17 @@ class App:
         if self._verbose:
             logging.basicConfig(level=logging.DEBUG)
 
+        if args.record is not None:
+            http_client = toutv.cassette.RecordingHttpClient(args.record)
+            toutv.http.set_default_client(http_client)
+        elif args.replay is not None:
+            http_client = toutv.cassette.ReplayHttpClient(args.replay,
+                                                          latency=args.replay_latency,
+                                                          bandwidth=args.replay_bandwidth)
+            toutv.http.set_default_client(http_client)
+
         if args.build_client:
-            self._toutv_client = self._build_toutv_client(no_cache)
+            self._toutv_client = self._build_toutv_client(no_cache, args.max_stale)
 
         try:
             args.func(args)
@@ -157,6 +173,14 @@ class App:
                 traceback.print_exc()
 
             return 100
+        finally:
+            # Let the stale cache entries we used be refreshed for next
+            # time, even if the command failed.
+            if self._toutv_client is not None:
+                self._toutv_client.wait_revalidations()
+
+            if self._cache is not None:
+                self._save_cache_stats()
 
         return 0
 
@@ -180,8 +204,22 @@ class App:
         # version
         p.add_argument('-n', '--no-cache', action='store_true',
                        dest='no_cache_global', help='Disable cache')
+        p.add_argument('-s', '--max-stale', action='store', type=App._parse_duration,
+                       default='24h',
+                       help='Use cached data expired for less than this (refreshed in the background), like 24h (default: 24h, 0 to disable)')
         p.add_argument('-v', '--verbose', action='store_true',
                        help='Verbose output')
+        p_cassette = p.add_mutually_exclusive_group()
+        p_cassette.add_argument('--record', action='store', metavar='DIR',
+                                help='Record the HTTP exchanges into this cassette directory')
+        p_cassette.add_argument('--replay', action='store', metavar='DIR',
+                                help='Replay the HTTP exchanges of this cassette directory instead of using the network')
+        p.add_argument('--replay-latency', action='store', type=float, default=0,
+                       metavar='SECONDS',
+                       help='Simulated latency of replayed responses (default: 0)')
+        p.add_argument('--replay-bandwidth', action='store', type=int,
+                       metavar='BYTES',
+                       help='Simulated bandwidth of replayed responses, in bytes per second')
         p.add_argument('-V', '--version', action='version',
                        version='%(prog)s v{}'.format(__version__))
 
@@ -256,7 +294,8 @@ command. The episode can be specified using its name, number or id.
         quality_choices = [
             App.QUALITY_MIN,
             App.QUALITY_AVG,
-            App.QUALITY_MAX
+            App.QUALITY_MAX,
+            App.QUALITY_AUTO
         ]
         pf.add_argument(App.FETCH_INFO_FIRST_ARG, action='store', type=str,
                         help='Show or URL, depending on the form used.')
@@ -274,8 +313,19 @@ command. The episode can be specified using its name, number or id.
         pf.add_argument('-q', '--quality', action='store',
                         default=App.QUALITY_AVG, choices=quality_choices,
                         help='Video quality (default: {})'.format(App.QUALITY_AVG))
+        pf.add_argument('--deadline', action='store', type=App._parse_duration,
+                        help='With -q AUTO, time to download each episode in, like 2h or 1h30m (default: episode duration)')
         pf.add_argument('-Q', '--quiet', action='store_true',
                         help='Don\'t show progress while downloading')
+        pf.add_argument('--start', action='store', type=App._parse_time,
+                        help='Only fetch from this time ([[HH:]MM:]SS)')
+        pf.add_argument('--end', action='store', type=App._parse_time,
+                        help='Only fetch up to this time ([[HH:]MM:]SS)')
+        pf_mode = pf.add_mutually_exclusive_group()
+        pf_mode.add_argument('--live', action='store_true',
+                             help='Record a live stream until it ends (or for --end)')
+        pf_mode.add_argument('--adaptive', action='store_true',
+                             help='Switch to a lower bitrate while the throughput is too low')
         pf.set_defaults(func=self._command_fetch)
         pf.set_defaults(build_client=True)
 
@@ -296,8 +346,71 @@ command. The episode can be specified using its name, number or id.
         pn.set_defaults(func=self._command_login)
         pn.set_defaults(build_client=False)
 
+        # cache command
+        pk = sp.add_parser('cache', help='Show cache statistics or manage the cache')
+        ksp = pk.add_subparsers(dest='cache_command', help='Cache commands help')
+        ksp.required = True
+
+        pks = ksp.add_parser('stats', help='Show the entries and hit counts of the cache')
+        pks.set_defaults(func=self._command_cache_stats)
+        pks.set_defaults(build_client=False)
+
+        pkp = ksp.add_parser('purge', help='Remove cache entries')
+        pkp.add_argument('families', action='store', nargs='*', metavar='family',
+                         help='Kind of entries to remove ({}; default: all)'.format(', '.join(toutv.cache.KEY_FAMILIES)))
+        pkp.add_argument('-e', '--expired', action='store_true',
+                         help='Only remove expired entries')
+        pkp.set_defaults(func=self._command_cache_purge)
+        pkp.set_defaults(build_client=False)
+
+        pkw = ksp.add_parser('warm', help='Refresh the list of shows and the episodes of shows')
+        pkw.add_argument('shows', action='store', nargs='*', metavar='show',
+                         help='Name or url of a show to refresh the episodes of')
+        pkw.add_argument('-a', '--all', action='store_true',
+                         help='Refresh the episodes of all shows')
+        pkw.set_defaults(func=self._command_cache_warm)
+        pkw.set_defaults(build_client=True)
+
         return p
 
+    @staticmethod
+    def _parse_time(time_str):
+        # Parse a time like "12:30" (12 min 30 s), "1:02:03" or "90" into a
+        # number of seconds.
+        parts = time_str.split(':')
+
+        if len(parts) > 3:
+            raise argparse.ArgumentTypeError('invalid time "{}"'.format(time_str))
+
+        seconds = 0
+
+        try:
+            for part in parts:
+                value = float(part)
+
+                if value < 0:
+                    raise ValueError()
+
+                seconds = seconds * 60 + value
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid time "{}"'.format(time_str))
+
+        return seconds
+
+    @staticmethod
+    def _parse_duration(duration_str):
+        # Parse a duration like "2h", "1h30m", "90m" or "45s", or a time as
+        # accepted by _parse_time, into a number of seconds.
+        m = re.fullmatch(r'(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?(?:(\d+(?:\.\d+)?)s)?',
+                         duration_str.strip())
+
+        if m is None or not any(m.groups()):
+            return App._parse_time(duration_str)
+
+        hours, minutes, seconds = [float(g or 0) for g in m.groups()]
+
+        return hours * 3600 + minutes * 60 + seconds
+
     @staticmethod
     def _build_cache_path(cache_name):
         cache_path = cache_name
@@ -326,7 +439,11 @@ command. The episode can be specified using its name, number or id.
 
     @staticmethod
     def _build_cache():
-        return toutv.cache.ShelveCache(App._build_cache_path('.toutv_cache'))
+        return toutv.cache.SqliteCache(App._build_cache_path('.toutv_cache.sqlite'))
+
+    @staticmethod
+    def _build_throughput_history():
+        return toutv.throughput.ThroughputHistory(App._build_cache_path('.toutv_throughput'))
 
     @staticmethod
     def _build_auth():
@@ -345,7 +462,7 @@ command. The episode can be specified using its name, number or id.
         token_file = App._build_cache_path(toutv.config.TOUTV_AUTH_TOKEN_PATH)
         os.remove(token_file)
 
-    def _build_toutv_client(self, no_cache):
+    def _build_toutv_client(self, no_cache, max_stale=0):
         auth = App._build_auth()
 
         if no_cache:
@@ -354,7 +471,7 @@ command. The episode can be specified using its name, number or id.
             try:
                 cache = App._build_cache()
             except Exception:
-                print('Warning: not using cache (multiple instances of toutv?)',
+                print('Warning: not using cache (cannot open it)',
                       file=sys.stderr)
 
                 if self._verbose:
@@ -362,7 +479,18 @@ command. The episode can be specified using its name, number or id.
 
                 cache = toutv.cache.EmptyCache()
 
-        return toutv.client.Client(cache=cache, auth=auth)
+        if max_stale:
+            max_stale = datetime.timedelta(seconds=max_stale)
+        else:
+            max_stale = None
+
+        self._cache = cache
+
+        # The same cache stores the validators of the HTTP responses.
+        transport = toutv.transport.JsonTransport(response_cache=cache)
+
+        return toutv.client.Client(transport=transport, cache=cache, auth=auth,
+                                   max_stale=max_stale)
 
     def _parse_show_episode_from_args(self, first, second):
         # Parse the arguments used to specify a show or an episode. If first is
@@ -496,6 +624,20 @@ command. The episode can be specified using its name, number or id.
         bitrate = args.bitrate
         quality = args.quality
         overwrite = args.force
+        start = args.start
+        end = args.end
+        live = args.live
+        deadline = args.deadline
+        adaptive = args.adaptive
+
+        if deadline is not None and quality != App.QUALITY_AUTO:
+            raise CliError('--deadline can only be used with -q {}'.format(App.QUALITY_AUTO))
+
+        if start is not None and end is not None and end <= start:
+            raise CliError('End time must be after start time')
+
+        if live and start is not None:
+            raise CliError('Cannot use a start time when recording a live stream')
 
         first = getattr(args, App.FETCH_INFO_FIRST_ARG)
         second = getattr(args, App.FETCH_INFO_SECOND_ARG)
@@ -503,65 +645,151 @@ command. The episode can be specified using its name, number or id.
         show, episode = self._get_show_episode_from_args(first, second)
 
         if episode:
-            self._fetch_episode(episode, output_dir=output_dir, quality=quality, bitrate=bitrate, overwrite=overwrite)
+            self._fetch_episode(episode, output_dir=output_dir, quality=quality, bitrate=bitrate, overwrite=overwrite,
+                                start=start, end=end, live=live, deadline=deadline, adaptive=adaptive)
+        elif live:
+            raise CliError('Only a single episode can be recorded live')
         else:
             self._fetch_emission_episodes(show, output_dir=output_dir, quality=quality, bitrate=bitrate,
-                                          overwrite=overwrite)
+                                          overwrite=overwrite, start=start, end=end, deadline=deadline,
+                                          adaptive=adaptive)
 
-    def _command_search(self, args):
-        self._print_search_results(args.query)
+    def _open_cache(self):
+        try:
+            self._cache = App._build_cache()
+        except Exception as e:
+            raise CliError('Cannot open cache: {}'.format(e))
 
-    def _print_search_results(self, query):
-        searchresult = self._toutv_client.search(query)
+        return self._cache
 
-        modified_query = searchresult.get_modified_query()
-        print('Effective query: {}\n'.format(modified_query))
+    def _save_cache_stats(self):
+        try:
+            self._cache.save_stats()
+        except Exception as e:
+            self._logger.warning('could not save cache statistics: {}'.format(e))
 
-        if not searchresult.get_results():
-            print('No results')
+    def _command_cache_stats(self, args):
+        stats = self._open_cache().get_stats()
+
+        if not stats:
+            print('Cache is empty')
             return
 
-        for result in searchresult.get_results():
-            if result.get_emission() is not None:
-                emission = result.get_emission()
-                print('Emission: {}  [{}]'.format(emission.get_title(),
-                                                  emission.get_id()))
+        tmpl = '{:<18} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10}'
+        print(tmpl.format('Kind', 'Entries', 'Size', 'Expired', 'Hits',
+                          'Stale', 'Misses', 'Writes', 'Hit ratio'))
+
+        for family in sorted(stats):
+            family_stats = stats[family]
+            hits = family_stats.get('hits', 0)
+            stale_hits = family_stats.get('stale_hits', 0)
+            misses = family_stats.get('misses', 0)
+            lookups = hits + stale_hits + misses
+            hit_ratio = '-'
 
-                if emission.get_description():
-                    print('')
-                    description = textwrap.wrap(emission.get_description(), 78)
-                    for line in description:
-                        print('  {}'.format(line))
+            if lookups:
+                hit_ratio = '{:.1%}'.format((hits + stale_hits) / lookups)
 
-            if result.get_episode() is not None:
-                episode = result.get_episode()
-                print('Episode: {}  [{}]'.format(episode.get_title(),
-                                                 episode.get_id()))
+            size = '{:.1f} kiB'.format(family_stats.get('bytes', 0) / 1024)
+            print(tmpl.format(family, family_stats.get('entries', 0), size,
+                              family_stats.get('expired_entries', 0), hits,
+                              stale_hits, misses, family_stats.get('sets', 0),
+                              hit_ratio))
 
-                infos_lines = []
+    def _command_cache_purge(self, args):
+        families = args.families or None
 
-                air_date = episode.get_air_date()
-                if air_date is not None:
-                    line = '  * Air date: {}'.format(air_date)
-                    infos_lines.append(line)
+        if families is not None:
+            for family in families:
+                if family not in toutv.cache.KEY_FAMILIES:
+                    raise CliError('Unknown kind of cache entries "{}"'.format(family))
 
-                emission_id = episode.get_emission_id()
-                if emission_id is not None:
-                    line = '  * Emission ID: {}'.format(emission_id)
-                    infos_lines.append(line)
+        num_purged = self._open_cache().purge(families, args.expired)
+        print('Removed {} cache entries'.format(num_purged))
 
-                if infos_lines:
-                    print('')
-                    for line in infos_lines:
-                        print(line)
+    def _command_cache_warm(self, args):
+        if args.all and args.shows:
+            raise CliError('Cannot specify shows with --all')
 
-                if episode.get_description():
-                    print('')
-                    description = textwrap.wrap(episode.get_description(), 78)
-                    for line in description:
-                        print('  {}'.format(line))
+        emissions = self._toutv_client.refresh_emissions()
 
-            print('\n')
+        if not args.all:
+            emissions = [self._get_show_episode_from_args(show, None)[0]
+                         for show in args.shows]
+
+        for emission in emissions:
+            if not self._quiet:
+                print('Refreshing episodes of {}'.format(emission.get_title()))
+
+            try:
+                self._toutv_client.refresh_emission_episodes(emission)
+            except toutv.exceptions.UnexpectedHttpStatusCodeError as e:
+                if e.status_code != 404:
+                    raise
+
+    def _command_search(self, args):
+        self._print_search_results(args.query)
+
+    def _print_search_results(self, query):
+        # Print the results as they arrive
+        has_results = False
+
+        for i, searchresult in enumerate(self._toutv_client.iter_search(query)):
+            if i == 0:
+                modified_query = searchresult.get_modified_query()
+                print('Effective query: {}\n'.format(modified_query))
+
+            for result in searchresult.get_results():
+                self._print_search_result(result)
+                has_results = True
+
+            sys.stdout.flush()
+
+        if not has_results:
+            print('No results')
+
+    def _print_search_result(self, result):
+        if result.get_emission() is not None:
+            emission = result.get_emission()
+            print('Emission: {}  [{}]'.format(emission.get_title(),
+                                              emission.get_id()))
+
+            # Don't fetch the missing descriptions: print the results now
+            if emission.Description:
+                print('')
+                description = textwrap.wrap(emission.get_description(), 78)
+                for line in description:
+                    print('  {}'.format(line))
+
+        if result.get_episode() is not None:
+            episode = result.get_episode()
+            print('Episode: {}  [{}]'.format(episode.get_title(),
+                                             episode.get_id()))
+
+            infos_lines = []
+
+            air_date = episode.get_air_date()
+            if air_date is not None:
+                line = '  * Air date: {}'.format(air_date)
+                infos_lines.append(line)
+
+            emission_id = episode.get_emission_id()
+            if emission_id is not None:
+                line = '  * Emission ID: {}'.format(emission_id)
+                infos_lines.append(line)
+
+            if infos_lines:
+                print('')
+                for line in infos_lines:
+                    print(line)
+
+            if episode.get_description():
+                print('')
+                description = textwrap.wrap(episode.get_description(), 78)
+                for line in description:
+                    print('  {}'.format(line))
+
+        print('\n')
 
     def _print_list_emissions(self):
         shows = self._toutv_client.get_emissions()
@@ -588,12 +816,7 @@ command. The episode can be specified using its name, number or id.
             print('  * {} - {} - {}'.format(sae, title, date))
 
     def _print_info_emission(self, emission):
-        if emission.get_description() is None:
-            url = '{}/presentation{}'.format(toutv.config.TOUTV_BASE_URL, emission.Url)
-            emission_dto = self._toutv_client._transport._do_query_json_url(url, {'v': 2, 'excludeLineups': True, 'd': 'android'})
-            emission.Description = emission_dto['Details']['Description']
-            emission.Country = emission_dto['Details']['Country']
-
+        # The description and country are fetched if they're missing
         inner = emission.get_country()
         if inner is None:
             inner = 'Unknown country'
@@ -706,11 +929,25 @@ command. The episode can be specified using its name, number or id.
         if self._quiet:
             return
 
+        # The number of segments of a live stream grows as it's recorded.
+        num_segments = self._seg_provider.num_segments()
+
+        if num_segments > self._cur_segments_count:
+            self._cur_segments_count = num_segments
+            self._cur_pb.set_segments_count(num_segments)
+
         total_bytes = num_bytes_completed_segments + num_bytes_partial_segment
         self._print_cur_pb(num_completed_segments, total_bytes, False)
 
     @staticmethod
-    def _get_fetch_filename_for_episode(episode, quality_level):
+    def _format_time(seconds):
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+
+        return '{:02}h{:02}m{:02}s'.format(hours, minutes, seconds)
+
+    @staticmethod
+    def _get_fetch_filename_for_episode(episode, quality_level, start=None, end=None):
         emission_title = episode.get_emission().Title
         episode_title = episode.Title
 
@@ -719,6 +956,11 @@ command. The episode can be specified using its name, number or id.
             episode_title = '{} {}'.format(sae, episode_title)
 
         episode_title = '{}.{}'.format(episode_title, quality_level)
+
+        if start is not None or end is not None:
+            start_str = App._format_time(start or 0)
+            end_str = 'end' if end is None else App._format_time(end)
+            episode_title = '{}.{}-{}'.format(episode_title, start_str, end_str)
         filename = '{}.{}.ts'.format(emission_title, episode_title)
 
         # remove illegal characters from filename
@@ -728,9 +970,42 @@ command. The episode can be specified using its name, number or id.
 
         return filename
 
-    def _fetch_episode(self, episode, output_dir, bitrate, quality, overwrite):
+    def _get_auto_bitrate(self, episode, qualities, deadline, throughput_history,
+                          start=None, end=None):
+        throughput = throughput_history.get_throughput()
+
+        if throughput is None:
+            print('No throughput measured yet; using {} quality'.format(App.QUALITY_AVG))
+
+            return App._get_average_bitrate(qualities)
+
+        # only the --start/--end range is downloaded
+        duration = episode.get_playlist_duration()
+
+        if end is not None:
+            duration = min(duration, end)
+
+        if start is not None:
+            duration = max(duration - start, 0)
+
+        if deadline is None:
+            deadline = duration
+
+        bitrates = [q.bitrate for q in qualities]
+        bitrate = toutv.throughput.choose_bitrate(bitrates, duration, deadline, throughput)
+
+        if self._verbose:
+            dl_time = toutv.throughput.get_download_time(bitrate, duration, throughput)
+            tmpl = 'Throughput: {:.0f} kiB/s; chose {} kbps (about {:.0f} s to download, deadline: {:.0f} s)'
+            print(tmpl.format(throughput / 1024, bitrate // 1000, dl_time, deadline))
+
+        return bitrate
+
+    def _fetch_episode(self, episode, output_dir, bitrate, quality, overwrite,
+                       start=None, end=None, live=False, deadline=None, adaptive=False):
         # Get available bitrates for episode
         qualities = episode.get_available_qualities()
+        throughput_history = App._build_throughput_history()
 
         quality_level = "qAVG"
         # Choose bitrate
@@ -743,20 +1018,30 @@ command. The episode can be specified using its name, number or id.
                 quality_level = "qMAX"
             elif quality == App.QUALITY_AVG:
                 bitrate = App._get_average_bitrate(qualities)
+            elif quality == App.QUALITY_AUTO:
+                bitrate = self._get_auto_bitrate(episode, qualities, deadline,
+                                                 throughput_history, start, end)
+                quality_level = "qAUTO"
 
-        filename = App._get_fetch_filename_for_episode(episode, quality_level)
+        if live:
+            quality_level = '{}.live-{}'.format(quality_level,
+                                                time.strftime('%Y%m%d-%H%M%S'))
+
+        filename = App._get_fetch_filename_for_episode(episode, quality_level,
+                                                       start, end)
 
         # Create segment handler
         self._seg_handler = toutv.dl.FilesystemSegmentHandler(
             episode=episode, bitrate=bitrate, output_dir=output_dir, filename=filename,
-            overwrite=overwrite)
+            overwrite=overwrite, start=start, end=end, live=live)
 
-        seg_provider = toutv.dl.ToutvApiSegmentProvider(
-            episode=episode, bitrate=bitrate)
+        self._seg_provider = toutv.dl.ToutvApiSegmentProvider(
+            episode=episode, bitrate=bitrate, start=start, end=end, live=live,
+            adaptive=adaptive)
 
         # Create downloader
         self._dl = toutv.dl.Downloader(
-            seg_provider=seg_provider,
+            seg_provider=self._seg_provider,
             seg_handler=self._seg_handler,
             on_progress_update=self._on_dl_progress_update,
             on_dl_start=self._on_dl_start)
@@ -764,12 +1049,17 @@ command. The episode can be specified using its name, number or id.
         # Start download
         self._dl.download()
 
+        # Remember how fast this went, for the AUTO quality
+        throughput_history.add_sample(self._dl.num_downloaded_bytes,
+                                      self._dl.download_time)
+
         # Finished
         self._dl = None
         if self._quiet:
             print("Done.")
 
-    def _fetch_emission_episodes(self, emission, output_dir, bitrate, quality, overwrite):
+    def _fetch_emission_episodes(self, emission, output_dir, bitrate, quality, overwrite,
+                                 start=None, end=None, deadline=None, adaptive=False):
         episodes = self._toutv_client.get_emission_episodes(emission, True)
 
         if not episodes:
@@ -777,20 +1067,28 @@ command. The episode can be specified using its name, number or id.
             print('No episodes available for emission "{}"'.format(title))
             return
 
+        # Fetch the missing PIDs at once
+        self._toutv_client.hydrate(episodes)
+
         for episode in App._sort_episodes(episodes):
             title = episode.get_title()
 
             try:
                 if self._stop:
                     raise toutv.dl.CancelledByUserError()
-                if episode.PID is None:
-                    episode = self._toutv_client.get_episode_by_name(emission, str(episode.Id))
-                self._fetch_episode(episode, output_dir, bitrate, quality, overwrite)
+                self._fetch_episode(episode, output_dir, bitrate, quality, overwrite,
+                                    start, end, deadline=deadline, adaptive=adaptive)
                 sys.stdout.write('\n')
                 sys.stdout.flush()
             except toutv.exceptions.RequestTimeoutError:
                 tmpl = 'Error: cannot fetch "{}": request timeout'
                 print(tmpl.format(title), file=sys.stderr)
+            except toutv.exceptions.CircuitOpenError as e:
+                # Don't make the next episodes fail the same way: wait
+                # until the host can be tried again.
+                tmpl = 'Error: cannot fetch "{}": {}; pausing'
+                print(tmpl.format(title, e), file=sys.stderr)
+                time.sleep(e.retry_after)
             except toutv.exceptions.UnexpectedHttpStatusCodeError:
                 tmpl = 'Error: cannot fetch "{}": unexpected HTTP status code'
                 print(tmpl.format(title), file=sys.stderr)
@@ -1,4 +1,6 @@
+import argparse
 import unittest
+from unittest import mock
 
 from toutvcli import app
 
@@ -34,3 +36,39 @@ class ToutvCliAppTest(unittest.TestCase):
         # Wrong URL formats
         self._testArgParsingRaises('http://ici.tou.tv/infoman/S17E12/something', None)
         self._testArgParsingRaises('http://ici.tou.tv/', None)
+
+    def testParseTime(self):
+        self.assertEqual(app.App._parse_time('90'), 90)
+        self.assertEqual(app.App._parse_time('12:30'), 750)
+        self.assertEqual(app.App._parse_time('1:02:03'), 3723)
+
+        with self.assertRaises(argparse.ArgumentTypeError):
+            app.App._parse_time('1:2:3:4')
+
+        with self.assertRaises(argparse.ArgumentTypeError):
+            app.App._parse_time('12:abc')
+
+    def testParseDuration(self):
+        self.assertEqual(app.App._parse_duration('2h'), 7200)
+        self.assertEqual(app.App._parse_duration('1h30m'), 5400)
+        self.assertEqual(app.App._parse_duration('45s'), 45)
+        self.assertEqual(app.App._parse_duration('1:30:00'), 5400)
+
+        with self.assertRaises(argparse.ArgumentTypeError):
+            app.App._parse_duration('2 days')
+
+    def testAutoBitrateRange(self):
+        episode = mock.Mock()
+        episode.get_playlist_duration.return_value = 3600
+        qualities = [mock.Mock(bitrate=500000), mock.Mock(bitrate=2000000)]
+        history = mock.Mock()
+        history.get_throughput.return_value = 125000
+
+        # 1 Mbps: the whole episode only makes it at the lowest bitrate
+        bitrate = self._app._get_auto_bitrate(episode, qualities, 1800, history)
+        self.assertEqual(bitrate, 500000)
+
+        # ... but 10 minutes of it make it at the highest
+        bitrate = self._app._get_auto_bitrate(episode, qualities, 1800, history,
+                                              start=600, end=1200)
+        self.assertEqual(bitrate, 2000000)
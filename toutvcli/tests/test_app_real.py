@@ -2,13 +2,16 @@ import glob
 import os
 import unittest
 
+from toutv import cassette
+from toutv import http
 from toutvcli import app
 
 
 run_these_tests = 'PYTOUTV_RUN_REAL_TESTS' in os.environ
+cassette_dir = os.environ.get('PYTOUTV_CASSETTE')
 
 
-@unittest.skipIf(not run_these_tests,
+@unittest.skipIf(not run_these_tests and cassette_dir is None,
                  "skippiing tests against real service")
 class ToutvCliAppRealTest(unittest.TestCase):
     """Tou.TV command line tool tests against the real service.
@@ -21,8 +24,31 @@ class ToutvCliAppRealTest(unittest.TestCase):
     environment variable while running the tests.  For example:
 
       $ PYTOUTV_RUN_REAL_TESTS=1 pytest test_app_real.py
+
+    To record the exchanges with the service into a cassette directory,
+    also define PYTOUTV_CASSETTE.  Defining only PYTOUTV_CASSETTE replays
+    them offline, which makes the runs reproducible:
+
+      $ PYTOUTV_RUN_REAL_TESTS=1 PYTOUTV_CASSETTE=cassette pytest test_app_real.py
+      $ PYTOUTV_CASSETTE=cassette pytest test_app_real.py
     """
 
+    def setUp(self):
+        if cassette_dir is None:
+            self._previous_client = None
+            return
+
+        if run_these_tests:
+            http_client = cassette.RecordingHttpClient(cassette_dir)
+        else:
+            http_client = cassette.ReplayHttpClient(cassette_dir)
+
+        self._previous_client = http.set_default_client(http_client)
+
+    def tearDown(self):
+        if cassette_dir is not None:
+            http.set_default_client(self._previous_client)
+
     def _testInfo(self, args):
         args = ['--verbose', 'info'] + args
 
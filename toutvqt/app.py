@@ -2,12 +2,16 @@ import os
 import sys
 import logging
 import platform
+import datetime
 from PyQt4 import Qt
 from toutvqt.main_window import QTouTvMainWindow
 from toutvqt.settings import QTouTvSettings
 from toutvqt.settings import SettingsKeys
 from toutvqt import config
+import toutv.cache
 import toutv.client
+import toutv.thumbnails
+import toutv.transport
 
 
 class _QTouTvApp(Qt.QApplication):
@@ -44,8 +48,45 @@ class _QTouTvApp(Qt.QApplication):
         self.main_window.settings_accepted.connect(
             self._settings.apply_settings)
 
+    def _build_cache(self):
+        location = Qt.QDesktopServices.CacheLocation
+        cache_dir = Qt.QDesktopServices.storageLocation(location)
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = os.path.join(cache_dir, 'toutv_cache.sqlite')
+
+            # Repeated lookups in this long-lived process only cost a dict
+            # access.
+            return toutv.cache.LruCache(toutv.cache.SqliteCache(cache_path))
+        except Exception as e:
+            logging.warning('Not using cache: {}'.format(e))
+
+            return toutv.cache.EmptyCache()
+
+    def _build_thumb_store(self):
+        location = Qt.QDesktopServices.CacheLocation
+        cache_dir = Qt.QDesktopServices.storageLocation(location)
+
+        try:
+            return toutv.thumbnails.ThumbnailStore(os.path.join(cache_dir, 'thumbnails'))
+        except Exception as e:
+            logging.warning('Not storing thumbnails: {}'.format(e))
+
+            return None
+
     def _setup_client(self):
-        self._client = toutv.client.Client()
+        # Once the catalog was fetched once, never wait for it again: the
+        # stale one is shown while it's refreshed in the background.
+        max_stale = datetime.timedelta(days=7)
+        cache = self._build_cache()
+        transport = toutv.transport.JsonTransport(response_cache=cache)
+        # The missing details are fetched by the infos frame in a worker
+        # thread, never by the getters called from the GUI thread.
+        self._client = toutv.client.Client(transport=transport, cache=cache,
+                                           max_stale=max_stale,
+                                           thumb_store=self._build_thumb_store(),
+                                           lazy=False)
 
     def _setup_settings(self):
         # Create a default settings
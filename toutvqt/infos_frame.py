@@ -15,6 +15,7 @@ class QInfosFrame(Qt.QFrame):
         self._client = client
 
         self._setup_thumb_fetching()
+        self._setup_details_fetching()
         self._setup_ui()
         self.show_infos_none()
 
@@ -58,6 +59,7 @@ class QInfosFrame(Qt.QFrame):
     def _setup_infos_widget(self):
         self._setup_none_label()
         self.emission_widget = _QEmissionInfosWidget(self._thumb_fetcher,
+                                                     self._details_fetcher,
                                                      self._client)
         self.emission_widget.select_download.connect(self.select_download)
         self.season_widget = _QSeasonInfosWidget()
@@ -91,6 +93,11 @@ class QInfosFrame(Qt.QFrame):
         self._thumb_fetcher = _QThumbFetcher()
         self._thumb_fetcher.moveToThread(self._fetch_thumb_thread)
 
+    def _setup_details_fetching(self):
+        # Details are fetched in the thumb fetcher thread too
+        self._details_fetcher = _QDetailsFetcher(self._client)
+        self._details_fetcher.moveToThread(self._fetch_thumb_thread)
+
 
 class _QThumbFetcher(Qt.QObject):
     fetch_done = QtCore.pyqtSignal(object)
@@ -115,6 +122,21 @@ class _QThumbFetcher(Qt.QObject):
         self.fetch_done.emit(bo)
 
 
+class _QDetailsFetcher(Qt.QObject):
+    fetch_done = QtCore.pyqtSignal(object)
+
+    def __init__(self, client):
+        super().__init__()
+
+        self._client = client
+
+    def fetch_details(self, bo):
+        tmpl = 'Fetching details of "{}"'
+        logging.debug(tmpl.format(bo.get_title()))
+        self._client.hydrate([bo])
+        self.fetch_done.emit(bo)
+
+
 class _QInfosWidget(Qt.QWidget, utils.QtUiLoad):
     _fetch_thumb_required = QtCore.pyqtSignal(object)
     select_download = QtCore.pyqtSignal(object)
@@ -226,14 +248,33 @@ class _QEmissionCommonInfosWidget:
 class _QEmissionInfosWidget(_QInfosWidget, _QEmissionCommonInfosWidget):
     _UI_NAME = 'emission_infos_widget'
     _fetch_thumb_required = QtCore.pyqtSignal(object)
+    _fetch_details_required = QtCore.pyqtSignal(object)
 
-    def __init__(self, thumb_fetcher, client):
+    def __init__(self, thumb_fetcher, details_fetcher, client):
         super().__init__(thumb_fetcher)
 
+        self._details_fetcher = details_fetcher
         self._client = client
 
         self._setup_ui(_QEmissionInfosWidget._UI_NAME)
         self._setup_thumb_fetching()
+        self._setup_details_fetching()
+
+    def _setup_details_fetching(self):
+        self._fetch_details_required.connect(self._details_fetcher.fetch_details)
+        self._details_fetcher.fetch_done.connect(self._details_fetched)
+
+    def _try_fetch_details(self):
+        if self._bo.get_missing_fields():
+            self._fetch_details_required.emit(self._bo)
+
+    def _details_fetched(self, bo):
+        if bo is not self._bo:
+            # Not us, or too late
+            return
+
+        self._set_description()
+        self._set_country()
 
     def _setup_ui(self, ui_name):
         super()._setup_ui(ui_name)
@@ -258,6 +299,7 @@ class _QEmissionInfosWidget(_QInfosWidget, _QEmissionCommonInfosWidget):
         self._set_common_infos()
         self._set_toutv_url(emission.get_url())
         self._try_set_thumb()
+        self._try_fetch_details()
 
     def _on_dl_btn_clicked(self):
         episodes = self._client.get_emission_episodes(self._bo)